@@ -0,0 +1,28 @@
+"""
+Settings for the benchmark suite (movies/benchmarks.py), without Docker:
+
+    export DJANGO_SETTINGS_MODULE=movieR.benchmark_settings
+    python manage.py migrate
+    python manage.py generate_benchmark_data --movies 1000000 --reviews 50000000 --watchlists 100000
+    python manage.py benchmark --output before.json
+
+SQLite (``BENCHMARK_SQLITE_PATH``, default bench.sqlite3) unless
+``BENCHMARK_DB=postgres``, which uses the regular database settings (set
+DB_HOST=localhost for a local server). Silk is off and the response cache is
+a dummy one, so every run measures the same code path.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+if os.getenv('BENCHMARK_DB', 'sqlite') != 'postgres':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('BENCHMARK_SQLITE_PATH', str(BASE_DIR / 'bench.sqlite3')),
+    }
+
+if os.getenv('BENCHMARK_CACHE') != '1':
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+SILK_ENABLED = False
@@ -0,0 +1,67 @@
+"""
+Gunicorn settings for production: ``gunicorn -c movieR/gunicorn.conf.py movieR.wsgi:application``
+
+Every value can be overridden from the environment (GUNICORN_*).
+GUNICORN_WORKER_CLASS=uvicorn serves the ASGI application (movieR.asgi,
+including the /async/ endpoints) with uvicorn workers instead of threads.
+"""
+import multiprocessing
+import os
+import tempfile
+
+
+def env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Sized from the CPUs: (2 x cores) + 1 processes
+workers = env_int('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1)
+
+if os.getenv('GUNICORN_WORKER_CLASS', 'gthread') == 'uvicorn':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'movieR.asgi:application'
+else:
+    # Threads overlap the time requests spend waiting on Postgres and MinIO
+    worker_class = 'gthread'
+    threads = env_int('GUNICORN_THREADS', 4)
+    wsgi_app = 'movieR.wsgi:application'
+
+# Import the app once in the master so workers fork with it loaded (faster boot, shared memory)
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+# Recycle workers regularly to bound memory growth; the jitter avoids restarting all at once
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+# Idle keep-alive seconds, a bit above nginx's upstream keepalive_timeout
+keepalive = env_int('GUNICORN_KEEPALIVE', 65)
+
+# An empty GUNICORN_ACCESSLOG disables the access log
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-') or None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+forwarded_allow_ips = '*'
+
+# Workers share their /metrics numbers through this directory (movies/metrics.py)
+metrics_dir = os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'movieR-metrics'))
+
+
+def on_starting(server):
+    # Cache invalidation and recently viewed movies only reach every worker through a shared cache
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'movieR.settings')
+    from movies import cache, recently_viewed
+    cache.check_shared_cache(server.cfg.workers)
+    recently_viewed.check_shared_cache(server.cfg.workers)
+
+    from movies.metrics import clear_directory
+    clear_directory(metrics_dir)
+
+
+def child_exit(server, worker):
+    # Keep the counts of recycled workers
+    from movies.metrics import archive_process
+    archive_process(metrics_dir, worker.pid)
@@ -0,0 +1,121 @@
+"""
+Sampled, switchable django-silk profiling.
+
+``SampledSilkyMiddleware`` replaces ``silk.middleware.SilkyMiddleware``: it
+decides up front whether a request is recorded and hands every other request
+straight to the view, so unsampled requests skip silk entirely (no request
+model, no SQL capture, no profiler). A request is recorded when
+
+* its path starts with one of ``SILK_PROFILE_PATHS``,
+* the logged-in user is in ``SILK_PROFILE_USERS``,
+* it sends ``SILK_PROFILE_HEADER`` with the value ``SILK_PROFILE_TOKEN``, or
+* it falls in the random ``SILK_SAMPLE_RATE`` (0.0 - 1.0).
+
+cProfile only runs for the explicitly requested ones (path, user, header)
+unless ``SILK_SAMPLE_PYTHON_PROFILER`` is set. ``SILK_ENABLED = False``
+switches recording off altogether. ``SilkRouter`` sends silk's tables to
+the ``silk`` database alias when one is configured.
+
+Only the WSGI application is profiled. Under ASGI the middleware passes
+every request through untouched, so the async views keep an async chain:
+silk collects SQL per thread, and cannot follow the async ORM's queries
+into its ``sync_to_async`` threads anyway.
+"""
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.models.sql.compiler import SQLCompiler
+from silk.collector import DataCollector
+from silk.middleware import SilkyMiddleware
+from silk.sql import execute_sql as silk_execute_sql
+
+SILK_DATABASE = 'silk'
+
+
+def profile_reason(request):
+    """Why ``request`` should be recorded ('path', 'user', 'header' or 'sample'), or None."""
+    if not getattr(settings, 'SILK_ENABLED', True):
+        return None
+    path = request.path_info
+    if any(path.startswith(prefix) for prefix in getattr(settings, 'SILK_PROFILE_PATHS', ())):
+        return 'path'
+    token = getattr(settings, 'SILK_PROFILE_TOKEN', '')
+    header = getattr(settings, 'SILK_PROFILE_HEADER', 'X-Silk-Profile')
+    if token and request.headers.get(header) == token:
+        return 'header'
+    users = getattr(settings, 'SILK_PROFILE_USERS', ())
+    # Resolving request.user may cost a session query, so only when users are configured
+    if users and request.user.is_authenticated and request.user.get_username() in users:
+        return 'user'
+    rate = getattr(settings, 'SILK_SAMPLE_RATE', 0.0)
+    if rate and random.random() < rate:
+        return 'sample'
+    return None
+
+
+def python_profiler_enabled(reason):
+    """cProfile requests recorded on purpose, not random samples."""
+    return reason != 'sample' or getattr(settings, 'SILK_SAMPLE_PYTHON_PROFILER', False)
+
+
+def _execute_sql(self, *args, **kwargs):
+    # silk's wrapper compiles and formats every query before checking whether a
+    # request is being recorded; check first so unsampled requests run the plain query
+    if DataCollector().request is None:
+        return self._execute_sql(*args, **kwargs)
+    return silk_execute_sql(self, *args, **kwargs)
+
+
+class SampledSilkyMiddleware(SilkyMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Installed before silk's own patch, which it then skips (it checks for _execute_sql)
+        if not hasattr(SQLCompiler, '_execute_sql'):
+            SQLCompiler._execute_sql = SQLCompiler.execute_sql
+            SQLCompiler.execute_sql = _execute_sql
+
+    def __call__(self, request):
+        if self.is_async:
+            # Not profiled under ASGI (see above)
+            return self.get_response(request)
+        reason = profile_reason(request)
+        if reason is None:
+            return self.get_response(request)
+        request.silk_profile_reason = reason
+        # Read by SILKY_PYTHON_PROFILER_FUNC in settings
+        request.silk_python_profiler = python_profiler_enabled(reason)
+        try:
+            return super().__call__(request)
+        finally:
+            # Detach the finished request so later requests on this thread skip SQL capture
+            DataCollector().clear()
+
+
+class SilkRouter:
+    """Store silk's data in the ``silk`` database alias, if configured, away from the app's tables."""
+
+    def _database(self, model):
+        if model._meta.app_label == 'silk' and SILK_DATABASE in settings.DATABASES:
+            return SILK_DATABASE
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._database(model)
+
+    def db_for_write(self, model, **hints):
+        return self._database(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if SILK_DATABASE not in settings.DATABASES:
+            return None
+        return (app_label == 'silk') == (db == SILK_DATABASE)
@@ -0,0 +1,194 @@
+"""
+Read replicas with read-your-writes consistency.
+
+``DATABASE_REPLICAS`` lists database aliases that replicate ``default``.
+Views opt in with ``replica_reads = True`` (class or function attribute, like
+``query_budget``). ``ReplicaRoutingMiddleware`` picks one replica at random for
+a GET/HEAD/OPTIONS request to such a view. ``ReplicaRouter`` then sends that
+request's reads of ``REPLICA_APPS`` models to it. Sessions and users always
+come from the primary, so a fresh login is never lost to replication lag.
+
+Reads go back to the primary for the rest of the request once it writes (or
+locks rows: ``select_for_update()`` and ``get_or_create()`` are routed as
+writes). After any unsafe request or write, the client is pinned to the
+primary for ``REPLICA_PIN_SECONDS``, longer than the replicas lag behind, so
+it reads its own writes. Browsers get the ``REPLICA_PIN_COOKIE`` cookie.
+Clients sending an ``Authorization`` header (token or basic auth) usually
+ignore cookies, so they are also pinned by a hash of that header in the
+``REPLICA_PIN_CACHE_ALIAS`` cache, which must be shared by the workers.
+Requests outside the middleware (commands, background threads) always use
+the primary.
+
+Payloads built from a replica are not stored by movies/cache.py: they would
+be cached under the current versions and outlive the lag.
+"""
+import hashlib
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RequestRouting:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+_routing = ContextVar('replica_routing', default=None)
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def get_pin_cookie():
+    return getattr(settings, 'REPLICA_PIN_COOKIE', 'db_pin')
+
+
+def get_pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def _pin_key(request):
+    """Cache key pinning the client of an ``Authorization`` header, or None."""
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return f"replica_pin:{hashlib.sha256(authorization.encode()).hexdigest()}"
+
+
+def get_pin_cache():
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')]
+
+
+def pinned(request):
+    """Whether the client wrote recently and must read from the primary."""
+    if get_pin_cookie() in request.COOKIES:
+        return True
+    key = _pin_key(request)
+    return key is not None and get_pin_cache().get(key) is not None
+
+
+async def apinned(request):
+    if get_pin_cookie() in request.COOKIES:
+        return True
+    key = _pin_key(request)
+    return key is not None and await get_pin_cache().aget(key) is not None
+
+
+def replica_reads(func):
+    """Whether a resolved view declared ``replica_reads = True``."""
+    view_class = getattr(func, 'view_class', None) or getattr(func, 'cls', None)
+    return bool(getattr(view_class or func, 'replica_reads', False))
+
+
+def current_replica():
+    """The replica the current request reads from, or None (primary)."""
+    routing = _routing.get()
+    if routing is None or routing.wrote:
+        return None
+    return routing.replica
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Sync and async: under ASGI the async views keep an async chain. The
+    routing state is a context variable, which ``sync_to_async`` threads see.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            # The handler adapts view middleware by the method it finds on the instance
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        routing = RequestRouting()
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        key = self.pin(request, response, routing)
+        if key is not None:
+            get_pin_cache().set(key, 1, timeout=get_pin_seconds())
+        return response
+
+    async def __acall__(self, request):
+        routing = RequestRouting()
+        token = _routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        key = self.pin(request, response, routing)
+        if key is not None:
+            await get_pin_cache().aset(key, 1, timeout=get_pin_seconds())
+        return response
+
+    @staticmethod
+    def pin(request, response, routing):
+        """Sets the pin cookie after a write; returns the cache key to pin as well, if any."""
+        if get_replicas() and (routing.wrote or request.method not in SAFE_METHODS):
+            response.set_cookie(get_pin_cookie(), '1', max_age=get_pin_seconds(), httponly=True, samesite='Lax')
+            return _pin_key(request)
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.routable(request, view_func) and not pinned(request):
+            _routing.get().replica = random.choice(get_replicas())
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if self.routable(request, view_func) and not await apinned(request):
+            _routing.get().replica = random.choice(get_replicas())
+
+    @staticmethod
+    def routable(request, view_func):
+        return (get_replicas() and _routing.get() is not None and request.method in SAFE_METHODS
+                and replica_reads(view_func))
+
+
+class ReplicaRouter:
+    """Reads of the app's models go to the request's replica, if it has one."""
+
+    def _routed(self, model):
+        return model._meta.app_label in getattr(settings, 'REPLICA_APPS', ('movies',))
+
+    def db_for_read(self, model, **hints):
+        if not self._routed(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related objects come from where the instance was loaded
+            return instance._state.db
+        return current_replica()
+
+    def db_for_write(self, model, **hints):
+        if not self._routed(model):
+            return None
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        # Also for instances read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        return None
@@ -50,14 +50,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'movies.metrics.MetricsMiddleware',  # first, so it times the whole request
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'movieR.replicas.ReplicaRoutingMiddleware',  # picks a read replica for replica_reads views
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'silk.middleware.SilkyMiddleware',
+    'movieR.profiling.SampledSilkyMiddleware',  # sampled silk, see the Silk section below
+    'movies.querybudget.QueryBudgetMiddleware',  # last: checks the views' query budgets
 ]
 import os
 
@@ -95,14 +98,117 @@ WSGI_APPLICATION = 'movieR.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'moviedb',
-        'USER': 'movieuser',
-        'PASSWORD': '12345678',
-        'HOST': 'postgres_db',      # 'postgres_db/db' if using Docker or 'localhost' if using locally
-        'PORT': '5432',
+        'NAME': os.getenv('DB_NAME', 'moviedb'),
+        'USER': os.getenv('DB_USER', 'movieuser'),
+        'PASSWORD': os.getenv('DB_PASSWORD', '12345678'),
+        'HOST': os.getenv('DB_HOST', 'postgres_db'),      # 'postgres_db/db' if using Docker or 'localhost' if using locally
+        'PORT': os.getenv('DB_PORT', '5432'),
+        # Persistent connections (seconds); use 0 under ASGI, where PgBouncer pools instead
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        # DB_PGBOUNCER=1 when connecting through PgBouncer (transaction pooling, see docker-compose.yml):
+        # connections are pooled there, and server-side cursors do not survive transaction pooling
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_PGBOUNCER') == '1',
     }
 }
 
+# Read replicas (movieR/replicas.py): DB_REPLICA_HOSTS=host[:port],... with the
+# primary's name, credentials and pooling settings
+DATABASE_REPLICAS = []
+for number, address in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+# Seconds a client reads from the primary after writing; above the usual replication lag
+REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', '5'))
+# Pins of clients sending an Authorization header (cookies are for browsers)
+REPLICA_PIN_CACHE_ALIAS = 'default'
+
+# Silk's profiling data goes to its own database when SILK_DB_NAME is set
+# (python manage.py migrate silk --database silk), otherwise to the default one
+if os.getenv('SILK_DB_NAME'):
+    DATABASES['silk'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('SILK_DB_NAME'),
+        'HOST': os.getenv('SILK_DB_HOST', DATABASES['default']['HOST']),
+        'PORT': os.getenv('SILK_DB_PORT', DATABASES['default']['PORT']),
+    }
+
+DATABASE_ROUTERS = ['movieR.profiling.SilkRouter', 'movieR.replicas.ReplicaRouter']
+
+
+# Django REST framework
+# List endpoints are paginated with keyset cursors (see movies/pagination.py);
+# JSON is written with orjson (movies/renderers.py)
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'movies.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    'DEFAULT_RENDERER_CLASSES': [
+        'movies.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Compiled read-only serialization (movies/fastpath.py); same output as plain DRF
+SERIALIZER_FAST_PATH = os.getenv('SERIALIZER_FAST_PATH', '1') == '1'
+
+
+# Caches
+# Redis when REDIS_URL is set (docker-compose.yml). The local-memory fallback is
+# per process, so it only suits a single process (runserver, tests); gunicorn
+# refuses to start several workers on it. Used by the response cache in
+# movies/cache.py and by movies/recently_viewed.py.
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'movier',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+MOVIES_CACHE_ALIAS = 'default'
+MOVIES_CACHE_TIMEOUT = 300  # seconds
+
+# Recently viewed movies (movies/recently_viewed.py): buffered per process and
+# written to the cache in batches, never to the session
+RECENTLY_VIEWED_CACHE_ALIAS = 'default'
+RECENTLY_VIEWED_LIMIT = 20  # movies kept per user
+RECENTLY_VIEWED_FLUSH_INTERVAL = 2.0  # seconds
+RECENTLY_VIEWED_BATCH_SIZE = 100  # users pending before an early flush
+RECENTLY_VIEWED_TIMEOUT = 30 * 24 * 3600
+
+# Leaderboards (refreshed by `manage.py refresh_leaderboards`)
+LEADERBOARD_PRIOR_WEIGHT = 10  # virtual reviews at the global mean in the Bayesian average
+LEADERBOARD_TRENDING_HALF_LIFE_DAYS = 7
+# How far incremental jobs look back past their last run (movies/watermarks.py);
+# longer than any write transaction
+REFRESH_WATERMARK_OVERLAP_SECONDS = 600
+
+# Recommendations (neighbour table built by `manage.py build_recommendations`)
+RECOMMENDATION_NEIGHBORS = 20  # similar movies kept per movie
+
+# Poster renditions (movies/posters.py)
+POSTER_WORKERS = 2  # background threads resizing uploads
+POSTER_RENDITIONS_ASYNC = True
+# Direct-to-bucket poster uploads (movies/uploads.py)
+POSTER_UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+POSTER_UPLOAD_EXPIRES = 900  # seconds a presigned upload URL stays valid
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -174,7 +280,8 @@ MEDIA_URL = f"http://{AWS_S3_CUSTOM_DOMAIN}/"
 
 STORAGES = {
     "default": {
-        "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
+        # S3Storage (MinIO) reporting S3 call latency to /metrics
+        "BACKEND": "movies.storage.InstrumentedS3Storage",
         "OPTIONS": {
             "endpoint_url": MINIO_ENDPOINT,
             "access_key": MINIO_ACCESS_KEY,
@@ -191,6 +298,42 @@ STORAGES = {
     },
 }
 
-SILKY_PYTHON_PROFILER = True  # Enable Python-level profiling
+# Query budgets (movies/querybudget.py)
+# Views declare a query_budget; exceeding it or running duplicate SQL raises
+# in development (QUERY_BUDGET_RAISE) and is logged in production
+
+QUERY_BUDGET_ENABLED = os.getenv('QUERY_BUDGET_ENABLED', '1') == '1'
+QUERY_BUDGET_RAISE = DEBUG
+QUERY_BUDGET_HEADER = DEBUG  # X-Query-Count response header
+QUERY_BUDGET_REPEAT_LIMIT = 3  # same statement, different parameters: more than this looks like N+1
+
+# Metrics (/metrics, see movies/metrics.py)
+# With several worker processes each one writes its numbers to METRICS_DIR
+# (set by movieR/gunicorn.conf.py) so that /metrics can sum them
+
+METRICS_DIR = os.getenv('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 1.0  # seconds between a worker's snapshots
+# Client addresses allowed to scrape /metrics: loopback and private networks (nginx, Prometheus)
+METRICS_ALLOWED_NETWORKS = ('127.0.0.0/8', '::1/128', '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16')
+
+# Silk
+# Only sampled or explicitly requested requests are recorded (movieR/profiling.py);
+# the ASGI application is not profiled
+
+SILK_ENABLED = os.getenv('SILK_ENABLED', '1') == '1'
+SILK_SAMPLE_RATE = float(os.getenv('SILK_SAMPLE_RATE', '0.01'))  # fraction of requests recorded at random
+SILK_SAMPLE_PYTHON_PROFILER = False  # cProfile random samples too
+SILK_PROFILE_PATHS = [path for path in os.getenv('SILK_PROFILE_PATHS', '').split(',') if path]
+SILK_PROFILE_USERS = [user for user in os.getenv('SILK_PROFILE_USERS', '').split(',') if user]
+SILK_PROFILE_HEADER = 'X-Silk-Profile'
+SILK_PROFILE_TOKEN = os.getenv('SILK_PROFILE_TOKEN', '')  # header value that forces recording; empty disables it
+
+SILKY_MIDDLEWARE_CLASS = 'movieR.profiling.SampledSilkyMiddleware'
+# Python-level profiling, decided per request by SampledSilkyMiddleware
+SILKY_PYTHON_PROFILER_FUNC = lambda request: getattr(request, 'silk_python_profiler', False)  # noqa: E731
+SILKY_MAX_REQUEST_BODY_SIZE = 64 * 1024  # bytes; larger bodies are not stored
+SILKY_MAX_RESPONSE_BODY_SIZE = 64 * 1024
+# No garbage collection inside requests; run prune_silk periodically instead
+SILKY_MAX_RECORDED_REQUESTS_CHECK_PERCENT = 0
 SILKY_METRICS_INTERVAL = 60  # Set how frequently profiling data is saved
 
@@ -0,0 +1,19 @@
+"""
+Settings for running the test suite without Postgres:
+
+    python manage.py test --settings=movieR.test_settings
+
+Two in-memory SQLite databases. The second one is the ``replica`` alias
+used by ReplicaRoutingTests (routing is off unless a test enables it with
+``DATABASE_REPLICAS``), so those tests can see which database a read hit.
+Query budget violations (movies/querybudget.py) fail the tests.
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+    'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+}
+DATABASE_REPLICAS = []
+
+QUERY_BUDGET_RAISE = True
@@ -7,16 +7,64 @@ class MovieRAdmin(admin.AdminSite):
     site_title = "MovieR Admin"
     index_title = "Welcome to MovieR Admin"
 
+# Category filter: movie counts come from CategoryStats instead of a COUNT per request
+class CategoryFilter(admin.SimpleListFilter):
+    title = 'category'
+    parameter_name = 'category__id__exact'
+
+    def lookups(self, request, model_admin):
+        categories = Category.objects.order_by('name').values_list('id', 'name', 'stats__movie_count')
+        return [(str(pk), f"{name} ({count or 0})") for pk, name, count in categories]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(category_id=self.value())
+        return queryset
+
 # Category Admin
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'movie_count', 'review_count', 'mean_rating', 'newest_release')
+    list_select_related = ('stats',)
+    show_full_result_count = False
+
+    def stat(self, obj, name, default=0):
+        stats = getattr(obj, 'stats', None)
+        return getattr(stats, name) if stats is not None else default
+
+    @admin.display(description='Movies')
+    def movie_count(self, obj):
+        return self.stat(obj, 'movie_count')
+
+    @admin.display(description='Reviews')
+    def review_count(self, obj):
+        return self.stat(obj, 'review_count')
+
+    @admin.display(description='Mean rating')
+    def mean_rating(self, obj):
+        return round(self.stat(obj, 'mean_rating'), 2)
+
+    @admin.display(description='Newest release')
+    def newest_release(self, obj):
+        return self.stat(obj, 'newest_release', None)
 
 # Movie Admin
 class MovieAdmin(admin.ModelAdmin):
-    list_display = ('title', 'release_date', 'director', 'category')
-    list_filter = ('category',)
+    list_display = ('title', 'release_date', 'director', 'category', 'average_rating', 'review_count')
+    list_filter = (CategoryFilter,)
     search_fields = ('title', 'director')
     list_editable = ('category',)
+    list_select_related = ('category',)
+    show_full_result_count = False
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'category' and request is not None:
+            # Load the options once per request: the changelist builds its form twice
+            # and each row's list_editable select would query them again
+            if not hasattr(request, '_category_choices'):
+                request._category_choices = [*iter(formfield.choices)]
+            formfield.choices = request._category_choices
+        return formfield
 
 # Review Admin
 class ReviewAdmin(admin.ModelAdmin):
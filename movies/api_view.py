@@ -1,48 +1,231 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
-from django.db.models import Prefetch
+from rest_framework.exceptions import NotAuthenticated, ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.generics import ListAPIView, ListCreateAPIView, RetrieveUpdateDestroyAPIView
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F, Prefetch
+from django.db.models.functions import Coalesce
+from . import cache
+from .conditional import (
+    conditional_get, movie_detail_etag, movie_detail_last_modified, movie_list_etag,
+    review_list_etag, watchlist_etag, watchlist_last_modified, watchlist_state,
+)
 from .models import Movie, Category, Review, Watchlist
-from .serializer import MovieSerializer, CategorySerializer, ReviewSerializer, WatchlistSerializer
+from .export import (
+    EXPORT_FORMATS, MOVIE_EXPORT_FIELDS, REVIEW_EXPORT_FIELDS,
+    export_response, movie_rows, review_rows,
+)
+from .leaderboards import TOP, TRENDING, decayed_count, leaderboard
+from .filters import FilterSortMixin, parse_end, parse_iso_date, parse_start
+from .recently_viewed import recent_movie_ids
+from .recommendations import recommend_for_user, similar_movies
+from .search import search_movie_ids
+from .serializer import (
+    MovieSerializer, CategorySerializer, CategoryStatsSerializer, ReviewSerializer, WatchlistSerializer,
+    PosterUploadSerializer, PosterUploadCompleteSerializer, WatchlistBatchSerializer, WatchlistMovieSerializer,
+)
+from .uploads import UploadError, complete_upload, start_upload
+from .watchlists import WatchlistEntry, add_movies, contains_movies, remove_movies
 from django.shortcuts import get_object_or_404
 
 
+class SparseFieldsetMixin:
+    """
+    Supports ``?fields=a,b`` on list endpoints: the serializer only renders the
+    requested fields and the SELECT only loads the columns they need.
+    """
+    fields_query_param = 'fields'
+    # Readable serializer field -> model columns needed to render it
+    field_columns = {}
+
+    def get_requested_fields(self):
+        if self.request.method not in SAFE_METHODS:
+            return None
+        raw = self.request.query_params.get(self.fields_query_param)
+        if not raw:
+            return None
+        requested = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in requested if name not in self.field_columns]
+        if unknown:
+            raise ValidationError({self.fields_query_param: f"Unknown field(s): {', '.join(unknown)}"})
+        return requested
+
+    def project_queryset(self, queryset):
+        fields = self.get_requested_fields()
+        if fields is None:
+            return queryset
+        # Primary key and the pagination keys are always needed
+        columns = {'id', *(field.lstrip('-') for field in getattr(self, 'ordering', ()))}
+        for name in fields:
+            columns.update(self.field_columns[name])
+        return queryset.only(*columns)
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+
+class CachedListMixin:
+    """
+    Serves list responses from the version-stamped response cache (movies/cache.py).
+    The key covers the full URL, so every page/cursor/fields combination is cached separately.
+    """
+    cache_name = None
+    cache_namespaces = ()
+
+    def get_cache_namespaces(self):
+        return self.cache_namespaces
+
+    def list(self, request, *args, **kwargs):
+        build_list = super().list
+        data = cache.get_or_build(
+            self.cache_name, self.get_cache_namespaces(), [request.build_absolute_uri()],
+            lambda: build_list(request, *args, **kwargs).data,
+        )
+        return Response(data)
+
+
+# Fields rendered for movies in ranked lists (leaderboards, recommendations)
+MOVIE_SUMMARY_FIELDS = ('id', 'title', 'release_date', 'director', 'poster', 'poster_renditions', 'category',
+                        'average_rating', 'review_count')
+
+
 # Movie Endpoints
 
-class MovieListCreateAPIView(ListCreateAPIView):
+class MovieListCreateAPIView(CachedListMixin, FilterSortMixin, SparseFieldsetMixin, ListCreateAPIView):
     queryset = Movie.objects.all()
-
-    # Prefetch related category and reviews for movies to avoid N+1 problem
+    cache_name = 'movie-list'
+    cache_namespaces = (cache.MOVIES,)
+    # Session, user, ETag state and one page query (movies/querybudget.py)
+    query_budget = {'GET': 4, 'POST': 7}
+    replica_reads = True
+    filter_params = {
+        'category': ('category_id', int),
+        'director': ('director', str),
+        'released_from': ('release_date__gte', parse_iso_date),
+        'released_to': ('release_date__lte', parse_iso_date),
+        'min_rating': ('rating_average__gte', float),
+    }
+    sort_options = {
+        'release_date': ('release_date', 'id'),
+        '-release_date': ('-release_date', '-id'),
+        'title': ('title', 'id'),
+        '-title': ('-title', '-id'),
+        'rating': ('rating_average', 'id'),
+        '-rating': ('-rating_average', '-id'),
+    }
+    default_sort = 'release_date'
+    field_columns = {
+        'id': ('id',),
+        'title': ('title',),
+        'description': ('description',),
+        'release_date': ('release_date',),
+        'director': ('director',),
+        'poster': ('poster',),
+        'poster_renditions': ('poster', 'poster_renditions'),
+        'category': ('category',),
+        'average_rating': ('review_count', 'rating_sum'),
+        'review_count': ('review_count',),
+    }
+
+    # Join the category (a forward FK) to avoid N+1 queries
+    # (ratings come from the aggregates stored on Movie, so no reviews prefetch)
     def get_queryset(self):
-        return Movie.objects.prefetch_related(
-            Prefetch('category'),
-            Prefetch('reviews')
-        )
+        queryset = Movie.objects.all()
+        fields = self.get_requested_fields()
+        if fields is None or 'category' in fields:
+            queryset = queryset.select_related('category')
+        return self.project_queryset(queryset)
 
     serializer_class = MovieSerializer
 
+    @conditional_get(movie_list_etag)
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
 
 class MovieRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
     queryset = Movie.objects.all()
+    # DELETE cascades to reviews, watchlist entries, neighbours and rankings
+    query_budget = {'GET': 4, 'PUT': 5, 'DELETE': 12}
+    replica_reads = True
 
     def get_queryset(self):
-        return Movie.objects.prefetch_related(
-            Prefetch('category'),
-            Prefetch('reviews')
-        )
+        return Movie.objects.select_related('category')
 
     serializer_class = MovieSerializer
 
+    @conditional_get(movie_detail_etag, movie_detail_last_modified)
+    def get(self, request, *args, **kwargs):
+        return self.retrieve(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        build_detail = super().retrieve
+        pk = kwargs['pk']
+        data = cache.get_or_build(
+            'movie', (cache.movie_namespace(pk), cache.CATEGORIES), [pk],
+            lambda: build_detail(request, *args, **kwargs).data,
+        )
+        return Response(data)
+
 
 # Category Endpoints
 
-class CategoryListCreateAPIView(ListCreateAPIView):
+class CategoryListCreateAPIView(CachedListMixin, SparseFieldsetMixin, ListCreateAPIView):
     queryset = Category.objects.all()
-    serializer_class = CategorySerializer
+    cache_name = 'category-list'
+    cache_namespaces = (cache.CATEGORIES,)
+    query_budget = {'GET': 3, 'POST': 4}
+    replica_reads = True
+    ordering = ('id',)
+    base_field_columns = {
+        'id': ('id',),
+        'name': ('name',),
+    }
+    # Annotated from the summary table (movies/category_stats.py), no columns of Category
+    stats_field_columns = {
+        'movie_count': (),
+        'review_count': (),
+        'mean_rating': (),
+        'newest_release': (),
+    }
+
+    def with_stats(self):
+        return self.request.method in SAFE_METHODS and self.request.query_params.get('with_stats') in ('1', 'true')
+
+    @property
+    def field_columns(self):
+        if self.with_stats():
+            return {**self.base_field_columns, **self.stats_field_columns}
+        return self.base_field_columns
+
+    def get_cache_namespaces(self):
+        # The totals change with movie and review writes, which bump MOVIES
+        if self.with_stats():
+            return (cache.CATEGORIES, cache.MOVIES)
+        return self.cache_namespaces
+
+    def get_serializer_class(self):
+        return CategoryStatsSerializer if self.with_stats() else CategorySerializer
+
+    def get_queryset(self):
+        queryset = Category.objects.all()
+        if self.with_stats():
+            # One LEFT JOIN instead of counting movies and reviews per category
+            queryset = queryset.annotate(
+                movie_count=Coalesce('stats__movie_count', 0),
+                review_count=Coalesce('stats__review_count', 0),
+                rating_sum=Coalesce('stats__rating_sum', 0),
+                newest_release=F('stats__newest_release'),
+            )
+        return self.project_queryset(queryset)
 
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
@@ -50,36 +233,321 @@ class CategoryListCreateAPIView(ListCreateAPIView):
 
 # Review Endpoints
 
-class ReviewListCreateAPIView(ListCreateAPIView):
+class ReviewListCreateAPIView(FilterSortMixin, SparseFieldsetMixin, ListCreateAPIView):
     queryset = Review.objects.all()
-
-    # Prefetch related movie data for each review to avoid N+1 problem
+    query_budget = {'GET': 4, 'POST': 6}
+    replica_reads = True
+    filter_params = {
+        'movie': ('movie_id', int),
+        'user': ('user_id', int),
+        'rating': ('rating', int),
+        'created_after': ('created_at__gte', parse_start),
+        'created_before': ('created_at__lt', parse_end),
+    }
+    sort_options = {
+        'created_at': ('created_at', 'id'),
+        '-created_at': ('-created_at', '-id'),
+        'rating': ('rating', 'created_at', 'id'),
+        '-rating': ('-rating', '-created_at', '-id'),
+    }
+    default_sort = 'created_at'
+    field_columns = {
+        'id': ('id',),
+        'rating': ('rating',),
+        'review_text': ('review_text',),
+        'created_at': ('created_at',),
+        'user': ('user',),
+    }
+
+    # The serializer never renders the movie, so it is not fetched; the user is joined
     def get_queryset(self):
-        return Review.objects.prefetch_related(
-            Prefetch('movie')
-        )
+        queryset = Review.objects.all()
+        fields = self.get_requested_fields()
+        if fields is None or 'user' in fields:
+            queryset = queryset.select_related('user')
+        return self.project_queryset(queryset)
 
     serializer_class = ReviewSerializer
 
+    @conditional_get(review_list_etag)
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
     def post(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            raise NotAuthenticated("Log in to write a review.")
         return self.create(request, *args, **kwargs)
 
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class MovieSearchAPIView(APIView):
+    """
+    Ranked full-text search: ``/movies/search/?q=nolan incep&limit=20``.
+    Terms are prefix-matched; when nothing matches, titles are matched by similarity.
+    """
+    default_limit = 20
+    max_limit = 100
+    query_budget = 4
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': "This query parameter is required."})
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            raise ValidationError({'limit': "Must be an integer."})
+
+        ids = search_movie_ids(query, limit=max(limit, 1))
+        movies = Movie.objects.select_related('category').in_bulk(ids)
+        results = [movies[pk] for pk in ids if pk in movies]
+        return Response({'query': query, 'results': MovieSerializer(results, many=True).data})
+
+
+class LeaderboardAPIView(APIView):
+    """
+    Precomputed leaderboard: ``?category=<id>&limit=20``.
+    Scores are refreshed by the ``refresh_leaderboards`` command, so reading is one indexed range query.
+    """
+    board = None
+    default_limit = 20
+    max_limit = 100
+    query_budget = 3
+
+    def get_score(self, ranking):
+        return ranking.top_score
+
+    def get(self, request, *args, **kwargs):
+        params = {}
+        for name, default in (('category', None), ('limit', self.default_limit)):
+            value = request.query_params.get(name) or default
+            try:
+                params[name] = None if value is None else int(value)
+            except ValueError:
+                raise ValidationError({name: "Must be an integer."})
+        limit = min(max(params['limit'], 1), self.max_limit)
+
+        rankings = leaderboard(self.board, category_id=params['category'], limit=limit)
+        movies = MovieSerializer([ranking.movie for ranking in rankings], many=True, fields=MOVIE_SUMMARY_FIELDS).data
+        results = [
+            {**movie, 'score': round(self.get_score(ranking), 4)}
+            for movie, ranking in zip(movies, rankings)
+        ]
+        return Response({'board': self.board, 'results': results})
+
+
+class TopMoviesAPIView(LeaderboardAPIView):
+    # score: Bayesian average rating
+    board = TOP
+
+
+class TrendingMoviesAPIView(LeaderboardAPIView):
+    # score: review count decayed by the trending half-life
+    board = TRENDING
+
+    def get_score(self, ranking):
+        return decayed_count(ranking.trending_score)
+
+
+class RecommendationAPIView(APIView):
+    """
+    ``?movie=<id>``: movies liked by the same users ("also liked").
+    Without it: recommendations for the current user from their reviews and watchlist.
+    Both read the neighbour table built by the ``build_recommendations`` command.
+    """
+    default_limit = 20
+    max_limit = 100
+    # Session, user, the user's reviews and watchlist, neighbours, movies
+    query_budget = 6
+
+    def get(self, request, *args, **kwargs):
+        params = {}
+        for name, default in (('movie', None), ('limit', self.default_limit)):
+            value = request.query_params.get(name) or default
+            try:
+                params[name] = None if value is None else int(value)
+            except ValueError:
+                raise ValidationError({name: "Must be an integer."})
+        limit = min(max(params['limit'], 1), self.max_limit)
+
+        if params['movie'] is not None:
+            ranked = similar_movies(params['movie'], limit=limit)
+        else:
+            if not request.user.is_authenticated:
+                raise NotAuthenticated("Log in or pass ?movie=<id>.")
+            scores = recommend_for_user(request.user, limit=limit)
+            movies = Movie.objects.select_related('category').defer('description').in_bulk(
+                [movie_id for movie_id, _ in scores])
+            ranked = [(movies[movie_id], score) for movie_id, score in scores if movie_id in movies]
+
+        data = MovieSerializer([movie for movie, _ in ranked], many=True, fields=MOVIE_SUMMARY_FIELDS).data
+        results = [{**movie, 'score': round(score, 4)} for movie, (_, score) in zip(data, ranked)]
+        return Response({'results': results})
+
+
+# Direct Poster Upload Endpoints
+
+class PosterUploadAPIView(APIView):
+    """
+    POST ``{content_type, size, method}``: presigned request(s) to upload the
+    poster straight to the bucket, plus a token for the completion call.
+    """
+    query_budget = 3
+
+    def post(self, request, pk, *args, **kwargs):
+        movie = get_object_or_404(Movie, pk=pk)
+        serializer = PosterUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            payload = start_upload(movie, **serializer.validated_data)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(payload, status=status.HTTP_201_CREATED)
+
+
+class PosterUploadCompleteAPIView(APIView):
+    """POST ``{token, parts}`` once the upload finished: validates the object and sets it as the poster."""
+
+    def post(self, request, pk, *args, **kwargs):
+        movie = get_object_or_404(Movie, pk=pk)
+        serializer = PosterUploadCompleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            complete_upload(movie, **serializer.validated_data)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(MovieSerializer(movie).data)
+
+
+# Bulk Export Endpoints
+
+class ExportAPIView(APIView):
+    """
+    Streams the whole table as NDJSON (default) or CSV (``?output=csv``).
+    Rows are read through a server-side cursor and written one at a time,
+    so memory use does not depend on the number of rows exported.
+    """
+    output_query_param = 'output'
+    filename = None
+    fieldnames = ()
+    # Callable returning the rows to export (movies/export.py)
+    row_source = None
+
+    def get_rows(self):
+        if self.row_source is None:
+            raise ImproperlyConfigured(f"{type(self).__name__} must set row_source.")
+        return self.row_source()
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get(self.output_query_param, 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({self.output_query_param: f"Choose one of: {', '.join(EXPORT_FORMATS)}"})
+        return export_response(self.get_rows(), self.fieldnames, export_format, self.filename)
+
+
+class MovieExportAPIView(ExportAPIView):
+    filename = 'movies'
+    fieldnames = MOVIE_EXPORT_FIELDS
+    row_source = staticmethod(movie_rows)
+
+
+class ReviewExportAPIView(ExportAPIView):
+    filename = 'reviews'
+    fieldnames = REVIEW_EXPORT_FIELDS
+    row_source = staticmethod(review_rows)
+
+
+class RecentlyViewedAPIView(APIView):
+    """The movies the user last opened in the web UI, most recent first."""
+    # Session, user, movies
+    query_budget = 3
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            raise NotAuthenticated("Log in to see your recently viewed movies.")
+        movie_ids = recent_movie_ids(request.user)
+        movies = Movie.objects.select_related('category').in_bulk(movie_ids) if movie_ids else {}
+        # Deleted movies drop out
+        ordered = [movies[movie_id] for movie_id in movie_ids if movie_id in movies]
+        return Response(MovieSerializer(ordered, many=True, fields=MOVIE_SUMMARY_FIELDS).data)
+
 
 # Watchlist Endpoints
 
 class WatchlistRetrieveAPIView(APIView):
+    # Session, user, ETag state, watchlist with its user, movies with their categories
+    query_budget = 5
+    replica_reads = True
+
     # Fetch the watchlist and related movies
+    @conditional_get(watchlist_etag, watchlist_last_modified)
     def get(self, request, *args, **kwargs):
         user = request.user
-        watchlist = Watchlist.objects.prefetch_related(
-            Prefetch('movies')
+        watchlist = Watchlist.objects.select_related('user').prefetch_related(
+            Prefetch('movies', queryset=Movie.objects.select_related('category'))
         ).get(user=user)
 
         serializer = WatchlistSerializer(watchlist)
         return Response(serializer.data)
 
 
+class WatchlistMoviesAPIView(ListAPIView):
+    """
+    The watchlist's movies a page at a time (``?cursor=``, ``?page_size=``), in
+    compact rows: id, title, poster thumbnail and the stored average rating.
+    Each page is one query joining the movies to the watchlist.
+    """
+    serializer_class = WatchlistMovieSerializer
+    ordering = ('id',)
+    # Session, user, ETag state, one page query
+    query_budget = 4
+    replica_reads = True
+
+    def get_queryset(self):
+        return Movie.objects.filter(watchlists__user=self.request.user).only(
+            'id', 'title', 'poster', 'poster_renditions', 'review_count', 'rating_sum')
+
+    @conditional_get(watchlist_etag, watchlist_last_modified)
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            raise NotAuthenticated("Log in to use a watchlist.")
+        return self.list(request, *args, **kwargs)
+
+
+class WatchlistIdsAPIView(APIView):
+    """The IDs of the watchlist's movies (ascending) and their count, for client-side sync."""
+    # Session, user, ETag state, IDs from the through table
+    query_budget = 4
+    replica_reads = True
+
+    @conditional_get(watchlist_etag, watchlist_last_modified)
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            raise NotAuthenticated("Log in to use a watchlist.")
+        movie_ids = list(WatchlistEntry.objects.filter(watchlist__user=request.user)
+                         .order_by('movie_id').values_list('movie_id', flat=True))
+        return Response({'count': len(movie_ids), 'movie_ids': movie_ids})
+
+
+class WatchlistCountAPIView(APIView):
+    """The number of movies in the watchlist, taken from the ETag state (no further query)."""
+    # Session, user, ETag state
+    query_budget = 3
+    replica_reads = True
+
+    @conditional_get(watchlist_etag, watchlist_last_modified)
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            raise NotAuthenticated("Log in to use a watchlist.")
+        state = watchlist_state(request)
+        return Response({'count': state[1] if state else 0})
+
+
 class WatchlistAddMovieAPIView(APIView):
+    query_budget = 7
+
     def post(self, request, *args, **kwargs):
         movie_id = request.data.get('movie_id')
         movie = get_object_or_404(Movie, id=movie_id)
@@ -93,6 +561,8 @@ class WatchlistAddMovieAPIView(APIView):
 
 
 class WatchlistRemoveMovieAPIView(APIView):
+    query_budget = 6
+
     def post(self, request, *args, **kwargs):
         movie_id = request.data.get('movie_id')
         movie = get_object_or_404(Movie, id=movie_id)
@@ -103,3 +573,42 @@ class WatchlistRemoveMovieAPIView(APIView):
         watchlist.movies.remove(movie)
 
         return Response({"message": "Movie removed from watchlist."}, status=status.HTTP_204_NO_CONTENT)
+
+
+class WatchlistBatchMixin:
+    """Validated ``movie_ids`` (a list, repeated form values or ``1,2,3``) for the batch endpoints."""
+
+    def get_movie_ids(self, data):
+        if not self.request.user.is_authenticated:
+            raise NotAuthenticated("Log in to use a watchlist.")
+        serializer = WatchlistBatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['movie_ids']
+
+
+class WatchlistBatchAddAPIView(WatchlistBatchMixin, APIView):
+    """POST ``{movie_ids: [...]}``: adds the movies in one write; returns added, already_present and not_found."""
+    # Session, user, movies IN, watchlist (+3 when get_or_create creates it), membership, insert, touch
+    query_budget = 10
+
+    def post(self, request, *args, **kwargs):
+        return Response(add_movies(request.user, self.get_movie_ids(request.data)))
+
+
+class WatchlistBatchRemoveAPIView(WatchlistBatchMixin, APIView):
+    """POST ``{movie_ids: [...]}``: removes the movies in one delete; returns removed and not_in_watchlist."""
+    # Session, user, watchlist, membership, delete, touch
+    query_budget = 6
+
+    def post(self, request, *args, **kwargs):
+        return Response(remove_movies(request.user, self.get_movie_ids(request.data)))
+
+
+class WatchlistContainsAPIView(WatchlistBatchMixin, APIView):
+    """GET ``?movie_ids=1,2,3``: which of the movies are in the watchlist (contains / missing)."""
+    # Session, user, membership
+    query_budget = 3
+
+    def get(self, request, *args, **kwargs):
+        movie_ids = self.get_movie_ids({'movie_ids': request.query_params.get('movie_ids', '')})
+        return Response(contains_movies(request.user, movie_ids))
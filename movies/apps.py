@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MoviesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'movies'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from django.db.backends.signals import connection_created
+        from . import metrics, querybudget
+        connection_created.connect(metrics.instrument_connection, dispatch_uid='movies.metrics')
+        connection_created.connect(querybudget.instrument_connection, dispatch_uid='movies.querybudget')
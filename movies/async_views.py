@@ -0,0 +1,150 @@
+"""
+Async (ASGI) read-only versions of the hottest API endpoints.
+
+They return the same payloads as their DRF counterparts in api_view.py (same
+filters, sorts, sparse fieldsets, keyset pagination, response cache and
+ETags) but are ``async def`` views using the async ORM, so under an ASGI
+server (uvicorn, see movieR/asgi.py) a request waiting on the database does
+not hold a worker thread. DRF views are sync-only, hence plain Django views
+rendering with the API's JSON renderer.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound
+from rest_framework.request import Request
+
+from . import cache
+from .api_view import MovieListCreateAPIView, ReviewListCreateAPIView, SparseFieldsetMixin
+from .conditional import (
+    aconditional_get, amovie_detail_validators, amovie_list_validators, areview_list_validators,
+    arequest_user, awatchlist_validators,
+)
+from .filters import FilterSortMixin
+from .models import Movie, Review, Watchlist
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .serializer import MovieSerializer, ReviewSerializer
+
+
+class AsyncAPIView(View):
+    """Base for read-only async JSON views; DRF exceptions become JSON error responses."""
+    http_method_names = ['get', 'head', 'options']
+    serializer_class = None
+    # ETag state and the data itself (movies/querybudget.py)
+    query_budget = 2
+    replica_reads = True  # read-only, may read from a replica (movieR/replicas.py)
+    renderer = FastJSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        # A DRF Request only for query_params (authentication is never triggered)
+        self.request = Request(request)
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return self.render(detail, status=exc.status_code)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('context', {'request': self.request, 'view': self})
+        return self.serializer_class(*args, **kwargs)
+
+    def render(self, data, status=200):
+        return HttpResponse(self.renderer.render(data), content_type='application/json', status=status)
+
+
+class AsyncListView(FilterSortMixin, SparseFieldsetMixin, AsyncAPIView):
+    """Filtered, sorted, sparse-fieldset and keyset-paginated list (same mixins as the sync views)."""
+    pagination_class = KeysetPagination
+    model = None
+
+    def get_queryset(self):
+        if self.model is None:
+            raise ImproperlyConfigured(f"{type(self).__name__} must set model or override get_queryset().")
+        return self.project_queryset(self.model._default_manager.all())
+
+    async def list_data(self):
+        paginator = self.pagination_class()
+        queryset = self.get_queryset().filter(**self.get_filters())
+        page = await paginator.apaginate_queryset(queryset, self.request, view=self)
+        return paginator.get_paginated_data(self.get_serializer(page, many=True).data)
+
+    def related(self, queryset, field):
+        # Related objects must be loaded up front: lazy loading is a sync query.
+        # select_related, since prefetch_related does not support async iteration in Django 4.2
+        fields = self.get_requested_fields()
+        if fields is None or field in fields:
+            queryset = queryset.select_related(field)
+        return queryset
+
+
+class AsyncMovieListView(AsyncListView):
+    filter_params = MovieListCreateAPIView.filter_params
+    sort_options = MovieListCreateAPIView.sort_options
+    default_sort = MovieListCreateAPIView.default_sort
+    field_columns = MovieListCreateAPIView.field_columns
+    serializer_class = MovieSerializer
+    model = Movie
+
+    def get_queryset(self):
+        return self.related(super().get_queryset(), 'category')
+
+    @aconditional_get(amovie_list_validators)
+    async def get(self, request, *args, **kwargs):
+        data = await cache.aget_or_build(
+            'movie-list', (cache.MOVIES,), [request.build_absolute_uri()], self.list_data,
+        )
+        return self.render(data)
+
+
+class AsyncMovieDetailView(AsyncAPIView):
+    serializer_class = MovieSerializer
+
+    @aconditional_get(amovie_detail_validators)
+    async def get(self, request, pk, *args, **kwargs):
+        async def build():
+            movie = await Movie.objects.select_related('category').filter(pk=pk).afirst()
+            if movie is None:
+                raise NotFound("No Movie matches the given query.")
+            return self.get_serializer(movie).data
+
+        # Same cache entry as the sync detail view
+        data = await cache.aget_or_build('movie', (cache.movie_namespace(pk), cache.CATEGORIES), [pk], build)
+        return self.render(data)
+
+
+class AsyncReviewListView(AsyncListView):
+    filter_params = ReviewListCreateAPIView.filter_params
+    sort_options = ReviewListCreateAPIView.sort_options
+    default_sort = ReviewListCreateAPIView.default_sort
+    field_columns = ReviewListCreateAPIView.field_columns
+    serializer_class = ReviewSerializer
+    model = Review
+
+    def get_queryset(self):
+        return self.related(super().get_queryset(), 'user')
+
+    @aconditional_get(areview_list_validators)
+    async def get(self, request, *args, **kwargs):
+        return self.render(await self.list_data())
+
+
+class AsyncWatchlistView(AsyncAPIView):
+    # Session, user, ETag state, watchlist, movies
+    query_budget = 5
+
+    @aconditional_get(awatchlist_validators)
+    async def get(self, request, *args, **kwargs):
+        user = await arequest_user(request)
+        if user is None:
+            raise NotAuthenticated()
+        watchlist = await Watchlist.objects.filter(user=user).afirst()
+        if watchlist is None:
+            raise NotFound("No Watchlist matches the given query.")
+        movies = [movie async for movie in Movie.objects.filter(watchlists=watchlist).select_related('category')]
+        # Same payload as WatchlistSerializer
+        return self.render({
+            'id': watchlist.pk,
+            'user': str(user),
+            'movies': MovieSerializer(movies, many=True, context={'request': self.request}).data,
+        })
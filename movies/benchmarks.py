@@ -0,0 +1,513 @@
+"""
+Benchmark harness behind the ``generate_benchmark_data``, ``benchmark`` and
+``compare_benchmarks`` commands.
+
+* ``generate_dataset`` bulk-inserts a seeded synthetic catalog (movies with
+  Zipf-distributed review counts, reviews, users, watchlists). Rows are written
+  with COPY on PostgreSQL and ``executemany`` elsewhere, and the rating
+  aggregates are computed while generating, so no refresh pass is needed.
+* Micro-benchmarks (``MICRO_BENCHMARKS``) time serializers, model properties
+  and the main queries timeit-style; ``endpoint`` benchmarks request every GET
+  route of movies/urls.py in-process.
+* ``run_load_tests`` drives a running server with the closed-loop clients of
+  movies/loadtest.py, one run per endpoint plus a mixed one.
+
+Results are JSON documents (``result_document``) tagged with the commit, the
+database and the dataset size; ``compare`` diffs two of them.
+"""
+import csv
+import itertools
+import platform
+import random
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern
+from django.utils import timezone
+from rest_framework.settings import api_settings
+
+from .category_stats import rebuild_category_stats
+from .loadtest import load_test
+from .models import (
+    Category, CategoryStats, LeaderboardState, Movie, MovieNeighbor, MovieRanking, Rating, RecommendationState, Review,
+    Watchlist,
+)
+from .ratings import compute_rating_stats
+from .serializer import MovieSerializer, ReviewSerializer, WatchlistSerializer
+
+# Generated users are named bench<N>; bench0 is a superuser the benchmarks log in as
+USERNAME_PREFIX = 'bench'
+BENCHMARK_USER = 'bench0'
+REVIEW_SPAN_DAYS = 730
+# Distinct review timestamps generated; rows pick from them (adapting each one is slow)
+TIMESTAMP_POOL = 100000
+
+WORDS = (
+    'love', 'night', 'city', 'last', 'dark', 'river', 'house', 'summer', 'war', 'star', 'ghost', 'king',
+    'road', 'secret', 'blood', 'dream', 'island', 'winter', 'fire', 'heart', 'shadow', 'storm', 'gold',
+    'silent', 'lost', 'wild', 'broken', 'iron', 'glass', 'moon', 'crime', 'garden', 'empire', 'song',
+)
+DIRECTORS = tuple(f'{first} {last}' for first, last in itertools.product(
+    ('Anna', 'Ben', 'Chen', 'Dana', 'Emil', 'Fatima', 'Goran', 'Hana', 'Ivan', 'Julia'),
+    ('Mann', 'Varda', 'Kurosawa', 'Bigelow', 'Lynch', 'Campion', 'Ozu', 'Tarr', 'Reichardt', 'Herzog'),
+))
+REVIEW_TEXTS = (
+    "Great film.", "Not for me.", "Beautifully shot, slow in the middle.", "Would watch again.",
+    "The ending fell flat.", "A modern classic.", "Fine for a rainy evening.", "Overlong but worth it.",
+)
+# Star distributions of weak, average and good movies
+RATING_PROFILES = ((30, 30, 20, 12, 8), (8, 15, 35, 27, 15), (3, 5, 12, 35, 45))
+STARS = tuple(rating.value for rating in Rating)
+REVIEW_COLUMNS = ('movie_id', 'user_id', 'rating', 'review_text', 'created_at', 'updated_at')
+
+
+def review_counts(movies, reviews, rng):
+    """Reviews per movie: Zipf-like popularity (a few blockbusters, a long tail), shuffled over the ids."""
+    weights = [1 / (rank + 1) for rank in range(movies)]
+    total = sum(weights)
+    counts = [int(reviews * weight / total) for weight in weights]
+    for index in range(reviews - sum(counts)):
+        counts[index % movies] += 1
+    rng.shuffle(counts)
+    return counts
+
+
+def insert_rows(model, columns, rows, using):
+    """Plain multi-row insert, bypassing model instances: COPY on PostgreSQL, executemany elsewhere."""
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    names = ', '.join(connection.ops.quote_name(column) for column in columns)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            buffer = StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor.copy_expert(f'COPY {table} ({names}) FROM STDIN WITH (FORMAT csv)', buffer)
+        else:
+            placeholders = ', '.join(['%s'] * len(columns))
+            cursor.executemany(f'INSERT INTO {table} ({names}) VALUES ({placeholders})', rows)
+
+
+@contextmanager
+def deferred_indexes(model, using):
+    """
+    Drop the model's Meta.indexes for a bulk load and rebuild them afterwards,
+    cheaper than updating them row by row. Skipped inside a transaction, where
+    SQLite cannot alter the schema.
+    """
+    connection = connections[using]
+    if connection.in_atomic_block:
+        yield
+        return
+    with connection.schema_editor() as schema_editor:
+        for index in model._meta.indexes:
+            schema_editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as schema_editor:
+            for index in model._meta.indexes:
+                schema_editor.add_index(model, index)
+
+
+def flush_dataset(using):
+    """Empty the catalog tables (raw DELETEs, no cascade collection) and drop the generated users."""
+    connection = connections[using]
+    models = (Watchlist.movies.through, Watchlist, MovieNeighbor, MovieRanking, Review, Movie, CategoryStats,
+              Category, LeaderboardState, RecommendationState)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+        User.objects.using(using).filter(username__regex=rf'^{USERNAME_PREFIX}[0-9]+$').delete()
+
+
+def ensure_users(count, using):
+    """Ids of the users bench0 .. bench<count - 1>, creating the missing ones."""
+    names = [f'{USERNAME_PREFIX}{index}' for index in range(count)]
+    existing = dict(User.objects.using(using).filter(username__in=names).values_list('username', 'id'))
+    missing = [
+        User(username=name, password='!', is_staff=name == BENCHMARK_USER, is_superuser=name == BENCHMARK_USER)
+        for name in names if name not in existing
+    ]
+    User.objects.using(using).bulk_create(missing, batch_size=5000)
+    existing.update(User.objects.using(using).filter(username__in=[user.username for user in missing])
+                    .values_list('username', 'id'))
+    return [existing[name] for name in names]
+
+
+def ensure_categories(count, using):
+    return [Category.objects.using(using).get_or_create(name=f'Genre{index}')[0].pk for index in range(count)]
+
+
+def generate_dataset(movies, reviews, watchlists, users=None, categories=20, watchlist_size=20, seed=42,
+                     batch_size=10000, using='default', progress=None):
+    """
+    Insert a synthetic catalog; the same arguments produce the same catalog
+    (timestamps are relative to now).
+    ``progress(label, done, total)`` is called after each committed batch.
+    Returns the number of rows created per table.
+    """
+    rng = random.Random(seed)
+    adapt_datetime = connections[using].ops.adapt_datetimefield_value
+    user_ids = ensure_users(max(users or 0, watchlists, 1), using)
+    category_ids = ensure_categories(categories, using)
+    counts = review_counts(movies, reviews, rng) if movies else []
+    now = timezone.now()
+    stamps = [adapt_datetime(now - timedelta(seconds=rng.randrange(REVIEW_SPAN_DAYS * 86400)))
+              for _ in range(min(reviews, TIMESTAMP_POOL))]
+    movie_ids = []
+    created = {'movies': 0, 'reviews': 0, 'watchlists': 0, 'watchlist_entries': 0}
+
+    with deferred_indexes(Review, using):
+        for start in range(0, movies, batch_size):
+            batch_ids, batch_reviews = generate_movie_batch(
+                counts[start:start + batch_size], category_ids, user_ids, stamps, now, rng, batch_size, using)
+            movie_ids.extend(batch_ids)
+            created['movies'] += len(batch_ids)
+            created['reviews'] += batch_reviews
+            if progress:
+                progress('movies', created['movies'], movies)
+
+    # Watchlists favour the popular movies too
+    owners = list(User.objects.using(using).filter(pk__in=user_ids[:watchlists], watchlist__isnull=True)
+                  .order_by('pk').values_list('pk', flat=True))
+    cum_weights = list(itertools.accumulate(count + 1 for count in counts))
+    for start in range(0, len(owners), batch_size):
+        with transaction.atomic(using=using):
+            lists = Watchlist.objects.using(using).bulk_create(
+                [Watchlist(user_id=owner) for owner in owners[start:start + batch_size]])
+            entries = []
+            for watchlist in lists:
+                size = min(rng.randint(0, 2 * watchlist_size), len(movie_ids))
+                picked = set(rng.choices(movie_ids, cum_weights=cum_weights, k=size)) if size else ()
+                entries.extend((watchlist.pk, movie_id) for movie_id in picked)
+            insert_rows(Watchlist.movies.through, ('watchlist_id', 'movie_id'), entries, using)
+        created['watchlists'] += len(lists)
+        created['watchlist_entries'] += len(entries)
+        if progress:
+            progress('watchlists', created['watchlists'], len(owners))
+    # The movies were bulk-inserted with their aggregates, bypassing the signals
+    rebuild_category_stats(using=using)
+    return created
+
+
+def generate_movie_batch(counts, category_ids, user_ids, stamps, now, rng, batch_size, using):
+    """
+    Insert one movie per review count, with its reviews and matching rating
+    aggregates. Returns ``(movie ids, number of reviews)``.
+    """
+    batch, batch_reviews = [], []
+    for review_count in counts:
+        profile = rng.choice(RATING_PROFILES)
+        ratings = rng.choices(STARS, weights=profile, k=review_count)
+        stars = {star: 0 for star in STARS}
+        for rating in ratings:
+            stars[rating] += 1
+        rating_sum = sum(ratings)
+        batch.append(Movie(
+            title=' '.join(rng.choices(WORDS, k=rng.randint(1, 4))).title(),
+            description=' '.join(rng.choices(WORDS, k=20)).capitalize() + '.',
+            release_date=(now - timedelta(days=rng.randrange(365 * 80))).date(),
+            director=rng.choice(DIRECTORS),
+            category_id=rng.choice(category_ids),
+            review_count=review_count,
+            rating_sum=rating_sum,
+            rating_average=rating_sum / review_count if review_count else 0,
+            **{f'rating_{star}_count': count for star, count in stars.items()},
+        ))
+        batch_reviews.append(ratings)
+
+    written = 0
+    with transaction.atomic(using=using):
+        Movie.objects.using(using).bulk_create(batch)
+        rows = []
+        for movie, ratings in zip(batch, batch_reviews):
+            for rating in ratings:
+                stamp = rng.choice(stamps)
+                rows.append((movie.pk, rng.choice(user_ids), rating, rng.choice(REVIEW_TEXTS), stamp, stamp))
+                if len(rows) >= batch_size:
+                    insert_rows(Review, REVIEW_COLUMNS, rows, using)
+                    written += len(rows)
+                    rows = []
+        insert_rows(Review, REVIEW_COLUMNS, rows, using)
+        written += len(rows)
+    return [movie.pk for movie in batch], written
+
+
+def dataset_counts(using='default'):
+    return {
+        'movies': Movie.objects.using(using).count(),
+        'reviews': Review.objects.using(using).count(),
+        'watchlists': Watchlist.objects.using(using).count(),
+        'users': User.objects.using(using).count(),
+    }
+
+
+# Micro-benchmarks
+
+def time_call(function, rounds=5, min_time=0.2):
+    """
+    timeit-style timing: the calls per round grow (1, 2, 5, 10, ...) until a
+    round lasts ``min_time``, then ``rounds`` rounds are run. Returns
+    ``(seconds per call of each round, calls per round)``.
+    """
+    for number in (base * 10 ** power for power in itertools.count() for base in (1, 2, 5)):
+        elapsed = _run(function, number)
+        if elapsed >= min_time:
+            break
+    timings = [elapsed / number]
+    for _ in range(rounds - 1):
+        timings.append(_run(function, number) / number)
+    return timings, number
+
+
+def _run(function, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        function()
+    return time.perf_counter() - started
+
+
+class BenchmarkContext:
+    """Sample rows shared by the micro-benchmarks, loaded once."""
+
+    def __init__(self, using='default', sample_size=50):
+        self.using = using
+        self.sample_size = sample_size
+        self.user = (User.objects.using(using).filter(username=BENCHMARK_USER).first()
+                     or User.objects.using(using).filter(is_superuser=True).order_by('pk').first())
+        self.movies = list(Movie.objects.using(using).select_related('category')
+                           .order_by('release_date', 'id')[:sample_size])
+        self.reviews = list(Review.objects.using(using).select_related('user')
+                            .order_by('created_at', 'id')[:sample_size])
+        self.watchlist = (Watchlist.objects.using(using).select_related('user')
+                          .prefetch_related('movies__category').order_by('-pk').first())
+
+    def client(self):
+        client = Client()
+        if self.user is not None:
+            client.force_login(self.user)
+        return client
+
+
+MICRO_BENCHMARKS = {}
+
+
+def micro_benchmark(name):
+    """Register ``setup(context)``, which returns the zero-argument callable to time (or None to skip)."""
+    def register(setup):
+        MICRO_BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@micro_benchmark('model.average_rating')
+def bench_average_rating(context):
+    movies = context.movies
+    return lambda: [movie.average_rating for movie in movies]
+
+
+@micro_benchmark('model.rating_histogram')
+def bench_rating_histogram(context):
+    movies = context.movies
+    return lambda: [movie.rating_histogram for movie in movies]
+
+
+@micro_benchmark('serializer.movie_list')
+def bench_movie_serializer(context):
+    movies = context.movies
+    return lambda: MovieSerializer(movies, many=True).data
+
+
+@micro_benchmark('serializer.review_list')
+def bench_review_serializer(context):
+    reviews = context.reviews
+    return lambda: ReviewSerializer(reviews, many=True).data
+
+
+@micro_benchmark('serializer.watchlist')
+def bench_watchlist_serializer(context):
+    if context.watchlist is None:
+        return None
+    watchlist = context.watchlist
+    return lambda: WatchlistSerializer(watchlist).data
+
+
+@micro_benchmark('render.movie_list')
+def bench_movie_list_render(context):
+    data = MovieSerializer(context.movies, many=True).data
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    return lambda: renderer.render(data)
+
+
+@micro_benchmark('query.movie_page')
+def bench_movie_page(context):
+    queryset = Movie.objects.using(context.using).select_related('category').order_by('release_date', 'id')
+    return lambda: list(queryset[:context.sample_size])
+
+
+@micro_benchmark('query.review_page')
+def bench_review_page(context):
+    queryset = Review.objects.using(context.using).select_related('user').order_by('created_at', 'id')
+    return lambda: list(queryset[:context.sample_size])
+
+
+@micro_benchmark('query.compute_rating_stats')
+def bench_compute_rating_stats(context):
+    movie_ids = [movie.pk for movie in context.movies]
+    return lambda: compute_rating_stats(movie_ids, using=context.using)
+
+
+# Endpoints
+
+# Not benchmarked: full-table exports, destructive or session-changing views, and a view without a template
+SKIPPED_ENDPOINTS = {'movie-export', 'review-export', 'movie_delete', 'login', 'logout', 'signup'}
+ENDPOINT_QUERIES = {'movie-search': '?q=love', 'watchlist-contains': '?movie_ids={movie_id},1,2,3'}
+
+
+def endpoint_paths(movie_id):
+    """``{url name: path}`` of every GET route in movies/urls.py, with ``movie_id`` filled in."""
+    from . import urls
+
+    paths = {}
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern) or pattern.name in SKIPPED_ENDPOINTS:
+            continue
+        view_class = getattr(pattern.callback, 'view_class', None) or getattr(pattern.callback, 'cls', None)
+        if view_class is not None and not hasattr(view_class, 'get'):
+            continue
+        route = str(pattern.pattern).replace('<int:pk>', str(movie_id)).replace('<int:movie_id>', str(movie_id))
+        paths[pattern.name] = '/' + route + ENDPOINT_QUERIES.get(pattern.name, '').format(movie_id=movie_id)
+    return paths
+
+
+def summarize(name, kind, timings, number, **extra):
+    median = statistics.median(timings)
+    return {
+        'name': name,
+        'kind': kind,
+        'median_us': round(median * 1e6, 2),
+        'min_us': round(min(timings) * 1e6, 2),
+        'mean_us': round(statistics.fmean(timings) * 1e6, 2),
+        'stdev_us': round(statistics.stdev(timings) * 1e6, 2) if len(timings) > 1 else 0.0,
+        'ops_per_sec': round(1 / median, 1) if median else None,
+        'rounds': len(timings),
+        'calls_per_round': number,
+        **extra,
+    }
+
+
+def count_queries(function, using):
+    with CaptureQueriesContext(connections[using]) as queries:
+        function()
+    return len(queries)
+
+
+def run_micro_benchmarks(context, names=None, rounds=5, min_time=0.2):
+    results = []
+    for name, setup in MICRO_BENCHMARKS.items():
+        if names and not any(name.startswith(prefix) for prefix in names):
+            continue
+        function = setup(context)
+        if function is None:
+            continue
+        queries = count_queries(function, context.using)
+        timings, number = time_call(function, rounds, min_time)
+        results.append(summarize(name, 'micro', timings, number, queries=queries, items=context.sample_size))
+    return results
+
+
+def run_endpoint_benchmarks(context, names=None, rounds=5, min_time=0.2):
+    """Every GET route through the full middleware stack, in-process (no server, no network)."""
+    if not context.movies:
+        return []
+    client = context.client()
+    results = []
+    for name, path in endpoint_paths(context.movies[0].pk).items():
+        label = f'endpoint.{name}'
+        if names and not any(label.startswith(prefix) for prefix in names):
+            continue
+        status = client.get(path).status_code  # Warm up, and record whether it works
+        queries = count_queries(lambda: client.get(path), context.using)
+        timings, number = time_call(lambda: client.get(path), rounds, min_time)
+        results.append(summarize(label, 'endpoint', timings, number, path=path, status=status, queries=queries))
+    return results
+
+
+def run_load_tests(base_url, context, concurrency, duration, warmup=0, names=None):
+    """Locust-style load test of a running server: one closed-loop run per endpoint, then all of them mixed."""
+    client = context.client()
+    cookie = client.cookies.get(settings.SESSION_COOKIE_NAME)
+    headers = {'Cookie': f'{settings.SESSION_COOKIE_NAME}={cookie.value}'} if cookie else None
+    paths = endpoint_paths(context.movies[0].pk if context.movies else 1)
+    if names:
+        paths = {name: path for name, path in paths.items()
+                 if any(f'load.{name}'.startswith(prefix) for prefix in names)}
+    targets = [(f'load.{name}', [path]) for name, path in paths.items()]
+    targets.append(('load.mixed', list(paths.values())))
+    results = []
+    for label, target_paths in targets:
+        stats = load_test(label, base_url, target_paths, concurrency, duration, warmup=warmup, headers=headers)
+        stats = stats.as_dict()
+        results.append({'name': stats.pop('label'), 'kind': 'load', 'concurrency': concurrency, **stats})
+    return results
+
+
+# Results
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_document(results, using='default'):
+    return {
+        'meta': {
+            'commit': git_revision(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connections[using].vendor,
+            'dataset': dataset_counts(using),
+        },
+        'results': results,
+    }
+
+
+# Metric compared per kind; lower is better for all of them
+COMPARED_METRICS = {'micro': 'median_us', 'endpoint': 'median_us', 'load': 'p50_ms'}
+
+
+def compare(base, head, threshold=10.0):
+    """
+    Rows ``(name, metric, before, after, change %, regressed)`` for the results
+    present in both documents. A result regresses when its metric grew by more
+    than ``threshold`` percent or it runs more queries than before.
+    """
+    before = {result['name']: result for result in base['results']}
+    rows = []
+    for result in head['results']:
+        old = before.get(result['name'])
+        if old is None:
+            continue
+        metric = COMPARED_METRICS.get(result['kind'], 'median_us')
+        change = (result[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+        rows.append((result['name'], metric, old[metric], result[metric], change, change > threshold))
+        if 'queries' in result and 'queries' in old:
+            rows.append((result['name'], 'queries', old['queries'], result['queries'],
+                         (result['queries'] - old['queries']) / old['queries'] * 100 if old['queries'] else 0.0,
+                         result['queries'] > old['queries']))
+    return rows
@@ -0,0 +1,132 @@
+"""
+Response cache for serialized movie/category payloads and rendered list pages.
+
+Keys are version-stamped: every cached value is stored under the current
+version of each namespace it depends on (e.g. ``movies``, ``movie:42``,
+``categories``). A write bumps the versions of the namespaces it touches, so
+entries built before the write can never be read again and simply age out of
+the LRU. Versions start from a nanosecond timestamp so that a version key
+evicted and re-created never reuses an old value.
+
+The backend is whatever ``MOVIES_CACHE_ALIAS`` points to in ``CACHES``. It
+must be shared by every process serving requests (Redis, see REDIS_URL):
+a local-memory cache only sees the version bumps of its own process, so the
+others would keep serving stale entries. ``check_shared_cache`` (called by
+movieR/gunicorn.conf.py) refuses to start several workers on one.
+"""
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from movieR.replicas import current_replica
+
+from . import metrics
+
+MOVIES = 'movies'
+CATEGORIES = 'categories'
+
+
+def movie_namespace(pk):
+    return f'movie:{pk}'
+
+
+def get_cache():
+    return caches[getattr(settings, 'MOVIES_CACHE_ALIAS', 'default')]
+
+
+def check_shared_cache(workers, alias=None):
+    """Refuses to run several workers on a per-process cache (``MOVIES_CACHE_ALIAS`` by default)."""
+    alias = alias or getattr(settings, 'MOVIES_CACHE_ALIAS', 'default')
+    backend = settings.CACHES[alias]['BACKEND']
+    if workers > 1 and backend == 'django.core.cache.backends.locmem.LocMemCache':
+        raise ImproperlyConfigured(
+            f"The '{alias}' cache is per process, so {workers} workers would not see each other's "
+            "writes. Set REDIS_URL (or run a single worker)."
+        )
+
+
+def get_timeout():
+    return getattr(settings, 'MOVIES_CACHE_TIMEOUT', 300)
+
+
+def _version_key(namespace):
+    return f'movies:version:{namespace}'
+
+
+def get_versions(namespaces):
+    """Current version of each namespace, initialising missing ones."""
+    cache = get_cache()
+    keys = {namespace: _version_key(namespace) for namespace in namespaces}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for namespace, key in keys.items():
+        if key not in found:
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+        versions[namespace] = found[key]
+    return versions
+
+
+def get_version(namespace):
+    return get_versions([namespace])[namespace]
+
+
+def _bump(namespaces):
+    cache = get_cache()
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def invalidate(*namespaces, using=None):
+    """
+    Bump the version of each namespace once the current transaction commits;
+    entries stored under the old version become unreachable.
+    """
+    transaction.on_commit(lambda: _bump(namespaces), using=using)
+
+
+def invalidate_movies(movie_ids, using=None):
+    invalidate(MOVIES, *(movie_namespace(pk) for pk in movie_ids), using=using)
+
+
+def make_key(name, namespaces, *parts):
+    versions = get_versions(namespaces)
+    stamp = '.'.join(f'{namespace}={versions[namespace]}' for namespace in sorted(namespaces))
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'movies:{name}:{digest}:{hashlib.md5(stamp.encode("utf-8")).hexdigest()}'
+
+
+def get_or_build(name, namespaces, parts, build):
+    """Return the cached value for ``(name, parts)`` or call ``build()`` and store its result."""
+    cache = get_cache()
+    key = make_key(name, namespaces, *parts)
+    value = cache.get(key)
+    metrics.count_cache(name, value is not None)
+    if value is None:
+        value = build()
+        # Built from a lagging replica: serve it, but do not cache it under the current versions
+        if current_replica() is None:
+            cache.set(key, value, timeout=get_timeout())
+    return value
+
+
+async def aget_or_build(name, namespaces, parts, build):
+    """``get_or_build`` for async views; ``build`` is a coroutine function."""
+    cache = get_cache()
+    key = await sync_to_async(make_key, thread_sensitive=False)(name, namespaces, *parts)
+    value = await cache.aget(key)
+    metrics.count_cache(name, value is not None)
+    if value is None:
+        value = await build()
+        if current_replica() is None:
+            await cache.aset(key, value, timeout=get_timeout())
+    return value
@@ -0,0 +1,116 @@
+"""
+Per-category totals (``CategoryStats``): movie count, review count, rating
+sum (for the mean rating) and newest release date.
+
+* Review writes move a category's review totals by the same deltas as the
+  movie's rating aggregates (``apply_category_deltas``, called from
+  movies.ratings): one UPDATE through the movie's category.
+* Movie creation, deletion, and changes of category or release date,
+  as well as the bulk rating refreshes, recompute the affected categories
+  (``refresh_category_stats``). That is one grouped query over the movie
+  rows (their stored rating aggregates, not the reviews) plus one upsert,
+  with the summary rows locked (``SELECT ... FOR UPDATE``) first: a review
+  write committing between the grouped query and the upsert would
+  otherwise have its delta overwritten. With the lock, pending review
+  writes commit before the totals are read, and new ones wait until the
+  recomputed totals are stored.
+* ``rebuild_category_stats`` (``manage.py rebuild_category_stats``)
+  recomputes every category, e.g. after writes that bypass the signals.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import CATEGORY_STAT_FIELDS, Category, CategoryStats, Movie
+
+
+def _computed(categories):
+    """``{category_id: {field: value}}`` for a Category queryset, from its movies."""
+    rows = categories.order_by().values('pk').annotate(
+        movie_count=Count('movie'),
+        review_count=Coalesce(Sum('movie__review_count'), Value(0)),
+        rating_sum=Coalesce(Sum('movie__rating_sum'), Value(0)),
+        newest_release=Max('movie__release_date'),
+    )
+    return {row.pop('pk'): row for row in rows}
+
+
+def _store(stats, using):
+    CategoryStats.objects.using(using).bulk_create(
+        [CategoryStats(category_id=category_id, **values) for category_id, values in stats.items()],
+        update_conflicts=True, unique_fields=['category'], update_fields=CATEGORY_STAT_FIELDS,
+    )
+
+
+def _recompute(categories, using):
+    """Compute and store the totals of a Category queryset, holding the locks of their summary rows."""
+    with transaction.atomic(using=using, savepoint=False):
+        # In primary key order, like apply_category_deltas, so the two never deadlock
+        locked = CategoryStats.objects.using(using).select_for_update().filter(category__in=categories)
+        list(locked.order_by('pk').values_list('pk', flat=True))
+        stats = _computed(categories)
+        _store(stats, using)
+    return stats
+
+
+def refresh_category_stats(category_ids, using=None):
+    """Recompute the summary rows of a few categories (None and deleted categories are skipped)."""
+    category_ids = {category_id for category_id in category_ids if category_id is not None}
+    if category_ids:
+        _recompute(Category.objects.using(using).filter(pk__in=category_ids), using)
+
+
+def refresh_movie_categories(movie_ids, using=None):
+    """Recompute the categories of the given movies, e.g. after their rating aggregates were rebuilt."""
+    refresh_category_stats(
+        set(Movie.objects.using(using).filter(pk__in=movie_ids).values_list('category_id', flat=True)),
+        using=using,
+    )
+
+
+def rebuild_category_stats(using=None):
+    """Recompute the summary rows of every category; returns the number of categories."""
+    return len(_recompute(Category.objects.using(using).all(), using))
+
+
+def verify_category_stats(using=None):
+    """Ids of the categories whose summary row is missing or disagrees with their movies."""
+    expected = _computed(Category.objects.using(using).all())
+    stored = {row.pop('category_id'): row
+              for row in CategoryStats.objects.using(using).values('category_id', *CATEGORY_STAT_FIELDS)}
+    # A category without movies needs no row: readers take the missing row as zeros
+    empty = {'movie_count': 0, 'review_count': 0, 'rating_sum': 0, 'newest_release': None}
+    return sorted(category_id for category_id, values in expected.items()
+                  if stored.get(category_id, empty) != values)
+
+
+def apply_category_deltas(deltas, using=None):
+    """
+    Adjust the review totals of the movies' categories.
+    ``deltas`` maps movie_id -> {rating: number of reviews added (or removed if negative)}, as in movies.ratings.
+    """
+    totals = {
+        movie_id: (sum(counts.values()), sum(rating * count for rating, count in counts.items()))
+        for movie_id, counts in deltas.items()
+    }
+    totals = {movie_id: total for movie_id, total in totals.items() if total != (0, 0)}
+    if len(totals) == 1:
+        # A single review write: no need to read the movie's category first
+        [(movie_id, (count, rating_sum))] = totals.items()
+        category = Movie.objects.using(using).filter(pk=movie_id).values('category_id')
+        _adjust(CategoryStats.objects.using(using).filter(category_id=Subquery(category)), count, rating_sum)
+        return
+
+    by_category = defaultdict(lambda: [0, 0])
+    for movie_id, category_id in Movie.objects.using(using).filter(pk__in=totals).values_list('pk', 'category_id'):
+        if category_id is not None:
+            by_category[category_id][0] += totals[movie_id][0]
+            by_category[category_id][1] += totals[movie_id][1]
+    for category_id, (count, rating_sum) in sorted(by_category.items()):
+        _adjust(CategoryStats.objects.using(using).filter(category_id=category_id), count, rating_sum)
+
+
+def _adjust(stats, count, rating_sum):
+    stats.update(review_count=F('review_count') + count, rating_sum=F('rating_sum') + rating_sum)
@@ -0,0 +1,181 @@
+"""
+ETag / Last-Modified support for the movie API.
+
+Each endpoint's state is summarised by one small aggregate query over the
+indexed ``updated_at`` columns; Django's ``condition`` decorator compares it
+with the request's validators and answers ``304 Not Modified`` before the
+view queries or serializes anything.
+"""
+import functools
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from .models import Movie, Review, Watchlist
+
+
+def _memoize_on_request(attr):
+    # condition() calls the etag and last-modified functions separately; run the query once
+    def decorator(func):
+        def wrapper(request, *args, **kwargs):
+            if not hasattr(request, attr):
+                setattr(request, attr, func(request, *args, **kwargs))
+            return getattr(request, attr)
+        return wrapper
+    return decorator
+
+
+def _etag(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+@_memoize_on_request('_movie_detail_state')
+def movie_detail_state(request, pk, *args, **kwargs):
+    return Movie.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+
+
+@_memoize_on_request('_movie_list_state')
+def movie_list_state(request, *args, **kwargs):
+    state = Movie.objects.aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return state['last_modified'], state['count']
+
+
+@_memoize_on_request('_review_list_state')
+def review_list_state(request, *args, **kwargs):
+    state = Review.objects.aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return state['last_modified'], state['count']
+
+
+WATCHLIST_STATE = {
+    'updated_at': Max('updated_at'),
+    'movies_updated_at': Max('movies__updated_at'),
+    'count': Count('movies'),
+}
+
+
+def _watchlist_state(state):
+    if state['updated_at'] is None:
+        return None
+    last_modified = max(filter(None, (state['updated_at'], state['movies_updated_at'])))
+    return last_modified, state['count']
+
+
+@_memoize_on_request('_watchlist_state')
+def watchlist_state(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    return _watchlist_state(Watchlist.objects.filter(user=request.user).aggregate(**WATCHLIST_STATE))
+
+
+def movie_detail_etag(request, pk, *args, **kwargs):
+    updated_at = movie_detail_state(request, pk)
+    return _etag('movie', pk, updated_at.isoformat()) if updated_at else None
+
+
+def movie_detail_last_modified(request, pk, *args, **kwargs):
+    return movie_detail_state(request, pk)
+
+
+def _list_etag(name, request, last_modified, count):
+    # The ETag covers the query string, since each page/cursor renders differently.
+    # Lists get no Last-Modified: deleting a row does not move Max(updated_at).
+    return _etag(name, request.get_full_path(), last_modified.isoformat() if last_modified else '', count)
+
+
+def _watchlist_etag(request, user, state):
+    return _etag('watchlist', user.pk, request.get_full_path(), state[0].isoformat(), state[1])
+
+
+def _collection_etag(name, state_func):
+    def etag(request, *args, **kwargs):
+        return _list_etag(name, request, *state_func(request))
+    return etag
+
+
+movie_list_etag = _collection_etag('movies', movie_list_state)
+review_list_etag = _collection_etag('reviews', review_list_state)
+
+
+def watchlist_etag(request, *args, **kwargs):
+    state = watchlist_state(request)
+    if state is None:
+        return None
+    return _watchlist_etag(request, request.user, state)
+
+
+def watchlist_last_modified(request, *args, **kwargs):
+    state = watchlist_state(request)
+    return state[0] if state else None
+
+
+def conditional_get(etag_func, last_modified_func=None):
+    """Class-based view method decorator for ``condition``."""
+    return method_decorator(condition(etag_func=etag_func, last_modified_func=last_modified_func))
+
+
+# Async views (movies/async_views.py): each validators function returns (etag, last_modified)
+
+async def arequest_user(request):
+    """The authenticated user or None; request.user hits the session and user tables synchronously."""
+    if not hasattr(request, '_async_user'):
+        request._async_user = await sync_to_async(
+            lambda: request.user if request.user.is_authenticated else None)()
+    return request._async_user
+
+
+def _aggregate_validators(name, queryset):
+    async def validators(request, *args, **kwargs):
+        state = await queryset.all().aaggregate(last_modified=Max('updated_at'), count=Count('id'))
+        return _list_etag(name, request, state['last_modified'], state['count']), None
+    return validators
+
+
+amovie_list_validators = _aggregate_validators('movies', Movie.objects)
+areview_list_validators = _aggregate_validators('reviews', Review.objects)
+
+
+async def amovie_detail_validators(request, pk, *args, **kwargs):
+    updated_at = await Movie.objects.filter(pk=pk).values_list('updated_at', flat=True).afirst()
+    if updated_at is None:
+        return None, None
+    return _etag('movie', pk, updated_at.isoformat()), updated_at
+
+
+async def awatchlist_validators(request, *args, **kwargs):
+    user = await arequest_user(request)
+    if user is None:
+        return None, None
+    state = _watchlist_state(await Watchlist.objects.filter(user=user).aaggregate(**WATCHLIST_STATE))
+    if state is None:
+        return None, None
+    return _watchlist_etag(request, user, state), state[0]
+
+
+def aconditional_get(validators_func):
+    """
+    ``conditional_get`` for async view methods (``condition`` only wraps sync
+    views in Django 4.2): answers 304/412 from the validators, otherwise runs
+    the view and adds ETag / Last-Modified to its response.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, request, *args, **kwargs):
+            etag, last_modified = await validators_func(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag else None
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = await method(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                if etag and not response.has_header('ETag'):
+                    response.headers['ETag'] = etag
+                if timestamp and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(timestamp)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,85 @@
+import csv
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import Movie, Review
+
+# Rows fetched per round-trip from the (server-side) cursor
+EXPORT_CHUNK_SIZE = 2000
+
+MOVIE_EXPORT_FIELDS = ('id', 'title', 'description', 'release_date', 'director', 'category',
+                       'poster', 'average_rating', 'review_count')
+REVIEW_EXPORT_FIELDS = ('id', 'movie_id', 'user', 'rating', 'review_text', 'created_at')
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class Echo:
+    """File-like object whose write() just hands the value back, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def movie_rows():
+    columns = ('id', 'title', 'description', 'release_date', 'director', 'category__name',
+               'poster', 'review_count', 'rating_sum')
+    queryset = Movie.objects.order_by('id').values_list(*columns)
+    for (movie_id, title, description, release_date, director, category,
+         poster, review_count, rating_sum) in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'id': movie_id,
+            'title': title,
+            'description': description,
+            'release_date': release_date,
+            'director': director,
+            'category': category,
+            'poster': default_storage.url(poster) if poster else None,
+            'average_rating': rating_sum / review_count if review_count else 0,
+            'review_count': review_count,
+        }
+
+
+def review_rows():
+    columns = ('id', 'movie_id', 'user__username', 'rating', 'review_text', 'created_at')
+    queryset = Review.objects.order_by('id').values_list(*columns)
+    for review_id, movie_id, username, rating, review_text, created_at in queryset.iterator(
+            chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'id': review_id,
+            'movie_id': movie_id,
+            'user': username,
+            'rating': rating,
+            'review_text': review_text,
+            'created_at': created_at,
+        }
+
+
+def stream_ndjson(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def stream_csv(rows, fieldnames):
+    writer = csv.writer(Echo())
+    # The header goes out before the query runs, so the first byte is immediate
+    yield writer.writerow(fieldnames)
+    for row in rows:
+        yield writer.writerow([row[name] for name in fieldnames])
+
+
+def export_response(rows, fieldnames, export_format, filename):
+    """Build a StreamingHttpResponse emitting ``rows`` one line at a time."""
+    if export_format == 'csv':
+        stream = stream_csv(rows, fieldnames)
+    else:
+        stream = stream_ndjson(rows)
+    response = StreamingHttpResponse(stream, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
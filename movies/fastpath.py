@@ -0,0 +1,248 @@
+"""
+Read-only fast path for the serializers in serializer.py.
+
+DRF renders every field of every row through ``get_attribute`` /
+``to_representation`` method calls, which dominates the CPU time of list
+responses once the queries are cheap. ``compile_serializer`` turns a bound
+serializer into generated Python code instead, one function per serializer
+with the attribute lookups and conversions written out::
+
+    def represent(obj):
+        ret = {}
+        v = obj.id
+        ret['id'] = None if v is None else int(v)
+        v = obj.category.name
+        ...
+
+Fields without a known conversion, attributes that are callables and rows
+that are mappings go through the field's own DRF methods, and a row whose
+lookups fail (e.g. ``category`` is None) is rendered again field by field
+with DRF's rules (defaults, ``allow_null``, skipped fields). The output is
+always what DRF would produce; ``SerializerContractTests`` checks it.
+
+Switched off with ``SERIALIZER_FAST_PATH = False``.
+"""
+import copy
+import datetime
+from collections.abc import Mapping
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from rest_framework import fields, relations, serializers
+from rest_framework.fields import SkipField, is_simple_callable
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import api_settings
+
+ISO_8601 = 'iso-8601'
+
+
+def enabled():
+    return getattr(settings, 'SERIALIZER_FAST_PATH', True)
+
+
+def compilable(serializer):
+    """Serializers whose to_representation is DRF's own (or marked as equivalent with ``fast_path = True``)."""
+    method = type(serializer).to_representation
+    base = serializers.ListSerializer if isinstance(serializer, serializers.ListSerializer) else serializers.Serializer
+    return method is base.to_representation or getattr(method, 'fast_path', False)
+
+
+def copy_fields(declared_fields):
+    """
+    Fields of a new read-only serializer. DRF deep-copies the declared fields,
+    which re-runs every field's __init__ and costs more than rendering a page
+    of rows; plain fields only need a shallow copy to be bound to the new
+    serializer. Nested serializers are still deep-copied.
+    """
+    fields = {}
+    for name, field in declared_fields.items():
+        if isinstance(field, serializers.BaseSerializer):
+            fields[name] = copy.deepcopy(field)
+            continue
+        clone = copy.copy(field)
+        if '_validators' in field.__dict__:
+            clone._validators = list(field._validators)
+        fields[name] = clone
+    return fields
+
+
+# Conversions
+# Exact field classes whose to_representation is a plain conversion map to
+# ``field -> (expression of v, argument)``; ``{convert}`` in the expression is
+# the field's to_representation and ``{arg}`` the argument. None: always call
+# to_representation.
+
+def _iso_date(field):
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return None
+    # Anything but a date (a str passes through, a datetime is refused) is left to DRF
+    return '(v.isoformat() if type(v) is date else {convert}(v))', None
+
+
+def _iso_datetime(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    # The current timezone is looked up once per serializer rather than per row
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return None
+    return '(zulu(v.astimezone({arg}).isoformat()) if type(v) is datetime and v.tzinfo else {convert}(v))', \
+        field_timezone
+
+
+def zulu(value):
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+EXPRESSIONS = {
+    fields.IntegerField: lambda field: ('int(v)', None),
+    fields.FloatField: lambda field: ('float(v)', None),
+    fields.CharField: lambda field: ('str(v)', None),
+    fields.DateField: _iso_date,
+    fields.DateTimeField: _iso_datetime,
+    fields.JSONField: lambda field: None if field.binary else ('v', None),
+    relations.StringRelatedField: lambda field: ('str(v)', None),
+}
+
+
+def _nested(serializer, many):
+    """Converter for a nested serializer, compiled on the first value it sees."""
+    compiled = None
+
+    def convert(value):
+        nonlocal compiled
+        rows = _rows(value) if many else [value]
+        if rows and compiled is None:
+            compiled = compile_serializer(serializer, rows[0])
+        return [compiled(row) for row in rows] if many else compiled(value)
+    return convert
+
+
+def _converter(field):
+    """``value -> representation`` function for ``field``."""
+    if isinstance(field, serializers.ListSerializer) and compilable(field) and compilable(field.child):
+        return _nested(field.child, many=True)
+    if isinstance(field, serializers.Serializer) and compilable(field):
+        return _nested(field, many=False)
+    return field.to_representation
+
+
+def _expression(field, index, namespace):
+    make = EXPRESSIONS.get(type(field))
+    expression = make(field) if make is not None else None
+    if expression is None:
+        return f'c{index}(v)'
+    template, namespace[f'a{index}'] = expression
+    return template.format(convert=f'c{index}', arg=f'a{index}')
+
+
+# Lookups
+
+def _plain_attrs(field, sample):
+    """The source attributes of ``field`` if plain ``getattr`` chains fetch it (judging by ``sample``), else None."""
+    attrs = field.source_attrs
+    if (sample is None or isinstance(sample, Mapping)
+            or (isinstance(field, relations.RelatedField) and field.use_pk_only_optimization())
+            or not attrs or not all(attr.isidentifier() for attr in attrs)):
+        return None
+    value = sample
+    for attr in attrs:
+        if isinstance(value, Mapping):
+            return None
+        value = getattr(value, attr, None)
+        if is_simple_callable(value):
+            return None
+    return attrs
+
+
+def _interpreted(plan):
+    """DRF's ``Serializer.to_representation`` over the plan, for rows the generated code cannot handle."""
+    def represent(instance):
+        ret = {}
+        for field, convert, method in plan:
+            if method is not None:
+                ret[field.field_name] = method(instance)
+                continue
+            try:
+                value = field.get_attribute(instance)
+            except SkipField:
+                continue
+            check_for_none = value.pk if isinstance(value, PKOnlyObject) else value
+            ret[field.field_name] = None if check_for_none is None else convert(value)
+        return ret
+    return represent
+
+
+@lru_cache(maxsize=256)
+def _code(source, label):
+    # The source only depends on the field layout, so serializers share code objects
+    return compile(source, f'<compiled {label}>', 'exec')
+
+
+def compile_serializer(serializer, sample=None):
+    """
+    Compile the readable fields of a bound serializer into ``instance -> dict``.
+    ``sample`` (a typical instance) tells which fields can use plain attribute lookups.
+    """
+    plan = []
+    namespace = {
+        'date': datetime.date, 'datetime': datetime.datetime, 'zulu': zulu,
+        'SkipField': SkipField, 'PKOnlyObject': PKOnlyObject, 'ObjectDoesNotExist': ObjectDoesNotExist,
+    }
+    lines = ['def represent(obj):', '    try:', '        ret = {}']
+    for index, field in enumerate(serializer._readable_fields):
+        name = repr(field.field_name)
+        if isinstance(field, fields.SerializerMethodField):
+            # source='*': the method gets the instance itself
+            method = getattr(serializer, field.method_name)
+            plan.append((field, None, method))
+            namespace[f'm{index}'] = method
+            lines.append(f'        ret[{name}] = m{index}(obj)')
+            continue
+
+        convert = _converter(field)
+        plan.append((field, convert, None))
+        namespace[f'c{index}'] = convert
+        expression = _expression(field, index, namespace)
+        attrs = _plain_attrs(field, sample)
+        if attrs is not None:
+            lines += [
+                f'        v = obj.{".".join(attrs)}',
+                f'        ret[{name}] = None if v is None else {expression}',
+            ]
+        else:
+            namespace[f'g{index}'] = field.get_attribute
+            lines += [
+                '        try:',
+                f'            v = g{index}(obj)',
+                '        except SkipField:',
+                '            pass',
+                '        else:',
+                f'            ret[{name}] = None if v is None or (type(v) is PKOnlyObject and v.pk is None) '
+                f'else {expression}',
+            ]
+    lines += [
+        '    except (AttributeError, KeyError, ObjectDoesNotExist):',
+        '        return interpreted(obj)',
+        '    return ret',
+    ]
+    namespace['interpreted'] = _interpreted(plan)
+    exec(_code('\n'.join(lines), type(serializer).__name__), namespace)
+    return namespace['represent']
+
+
+def _rows(data):
+    # Dealing with nested relationships, data can be a Manager (like ListSerializer)
+    rows = data.all() if isinstance(data, models.manager.BaseManager) else data
+    return rows if isinstance(rows, (list, tuple)) else list(rows)
+
+
+def represent_many(child, data):
+    """Same as ``ListSerializer.to_representation``, with the child compiled once for all rows."""
+    rows = _rows(data)
+    if not rows:
+        return []
+    represent = compile_serializer(child, rows[0])
+    return [represent(row) for row in rows]
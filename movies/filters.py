@@ -0,0 +1,84 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+# Query parameter parsers (besides int/float); they raise ValueError on bad input
+
+def parse_iso_date(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError("Expected a date (YYYY-MM-DD).")
+    return parsed
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _parse_bound(value, day_offset):
+    # Plain dates first: parse_datetime() would also accept "YYYY-MM-DD" as midnight
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is not None:
+        return _start_of_day(day + timedelta(days=day_offset))
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError("Expected a date (YYYY-MM-DD) or an ISO 8601 datetime.")
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+def parse_start(value):
+    """A datetime, or a date meaning the start of that day."""
+    return _parse_bound(value, 0)
+
+
+def parse_end(value):
+    """A datetime, or a date meaning the end of that day (exclusive bound: the next midnight)."""
+    return _parse_bound(value, 1)
+
+
+class FilterSortMixin:
+    """
+    Declarative query-parameter filtering and sorting for list views.
+
+    ``filter_params`` maps a query parameter to ``(lookup, parser)``;
+    ``sort_options`` maps ``?sort=`` values to a keyset ordering (read by the
+    paginator through ``ordering``). Every filter/sort has a matching composite
+    index on the model so that each request stays an index range scan.
+    """
+    sort_query_param = 'sort'
+    filter_params = {}
+    sort_options = {}
+    default_sort = None
+
+    @property
+    def ordering(self):
+        sort = self.request.query_params.get(self.sort_query_param) or self.default_sort
+        if sort not in self.sort_options:
+            raise ValidationError({self.sort_query_param: f"Choose one of: {', '.join(self.sort_options)}"})
+        return self.sort_options[sort]
+
+    def get_filters(self):
+        filters, errors = {}, {}
+        for param, (lookup, parser) in self.filter_params.items():
+            value = self.request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            try:
+                filters[lookup] = parser(value)
+            except (TypeError, ValueError) as e:
+                errors[param] = str(e) or "Invalid value."
+        if errors:
+            raise ValidationError(errors)
+        return filters
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in ('GET', 'HEAD'):
+            return queryset
+        return queryset.filter(**self.get_filters())
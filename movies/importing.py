@@ -0,0 +1,360 @@
+"""
+Batch pipeline behind the ``import_movies`` management command.
+
+CSV files are streamed in fixed-size batches. Each batch is parsed and
+validated in Python, resolved against the database with one lookup per
+batch, and written with ``bulk_create`` (or PostgreSQL ``COPY`` for reviews)
+in its own transaction. A checkpoint (an ``ImportCheckpoint`` row, updated in
+that same transaction) records how many rows of each file have been committed
+so an interrupted import can be resumed without skipping or repeating a batch.
+
+With ``workers > 1`` the reviews file is split into byte-range shards that are
+parsed and validated in a process pool; the parent process is the single
+database writer and commits one shard per transaction, in file order.
+"""
+import csv
+import multiprocessing
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from io import StringIO
+
+import django
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .category_stats import rebuild_category_stats
+from .models import Category, ImportCheckpoint, Movie, Rating, Review
+from .ratings import apply_rating_deltas
+
+VALID_RATINGS = {rating.value for rating in Rating}
+
+
+def iter_csv_batches(path, batch_size, skip=0):
+    """Yield lists of ``(line_number, row)`` of at most ``batch_size`` rows, skipping the first ``skip``."""
+    with open(path, newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        batch = []
+        for index, row in enumerate(reader):
+            if index < skip:
+                continue
+            batch.append((reader.line_num, row))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def parse_movie_row(row):
+    title = row['title'].strip()
+    if not title:
+        raise ValueError("title is empty")
+    return {
+        'title': title,
+        'description': row['description'],
+        'release_date': date.fromisoformat(row['release_date'].strip()),
+        'director': row['director'].strip(),
+        'category': (row.get('category') or '').strip(),
+    }
+
+
+def parse_review_row(row):
+    rating = int(row['rating'])
+    if rating not in VALID_RATINGS:
+        raise ValueError(f"rating {rating} is not between 1 and 5")
+    review_text = row['review_text']
+    if not review_text.strip():
+        raise ValueError("review text is empty")
+    return int(row['movie_id']), rating, review_text
+
+
+def parse_batch(batch, parser):
+    """Return ``(parsed, errors)``; parsed items are ``(line_number, value)``, errors ``(line_number, message)``."""
+    parsed, errors = [], []
+    for line_number, row in batch:
+        try:
+            parsed.append((line_number, parser(row)))
+        except KeyError as e:
+            errors.append((line_number, f"missing column {e}"))
+        except (TypeError, ValueError) as e:
+            errors.append((line_number, str(e)))
+    return parsed, errors
+
+
+class ImportStats:
+    def __init__(self, label):
+        self.label = label
+        self.rows = 0
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    def add(self, rows, created, skipped, errors):
+        self.rows += rows
+        self.created += created
+        self.skipped += skipped
+        self.errors.extend(errors)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def summary(self):
+        rate = self.rows / self.elapsed if self.elapsed else 0
+        return (f"{self.label}: {self.rows:,} rows, {self.created:,} created, {self.skipped:,} skipped, "
+                f"{len(self.errors):,} invalid in {self.elapsed:.1f}s ({rate:,.0f} rows/s)")
+
+
+class Checkpoint:
+    """
+    How many rows of each source file have been committed, stored in the
+    ``ImportCheckpoint`` row called ``name``. ``advance`` must run inside the
+    batch's transaction so the position commits (or rolls back) with the rows.
+    """
+
+    def __init__(self, name, using='default'):
+        self.name = name
+        self.using = using
+        self.state = {}
+        if name:
+            row = ImportCheckpoint.objects.using(using).filter(name=name).first()
+            if row is not None:
+                self.state = row.state
+
+    def entry(self, stage, source):
+        entry = self.state.get(stage)
+        if entry and entry.get('source') == os.path.abspath(source):
+            return entry
+        return {}
+
+    def position(self, stage, source):
+        return self.entry(stage, source).get('rows', 0)
+
+    def advance(self, stage, source, rows, **extra):
+        if not self.name:
+            return
+        self.state[stage] = {'source': os.path.abspath(source), 'rows': rows, **extra}
+        ImportCheckpoint.objects.using(self.using).update_or_create(name=self.name, defaults={'state': self.state})
+
+    def clear(self):
+        if self.name:
+            ImportCheckpoint.objects.using(self.using).filter(name=self.name).delete()
+
+
+class CategoryResolver:
+    """Maps category names to ids, creating missing categories one batch at a time."""
+
+    def __init__(self, using):
+        self.using = using
+        self.ids = {}
+
+    def resolve(self, names):
+        missing = {name for name in names if name and name not in self.ids}
+        if missing:
+            categories = Category.objects.using(self.using)
+            categories.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+            self.ids.update(categories.filter(name__in=missing).values_list('name', 'id'))
+        return self.ids
+
+
+def write_movie_batch(parsed, categories, using):
+    """Insert the movies whose title is not in the database yet; returns ``(created, skipped)``."""
+    by_title = {}
+    for _, movie in parsed:
+        by_title.setdefault(movie['title'], movie)
+    existing = set(
+        Movie.objects.using(using).filter(title__in=list(by_title)).values_list('title', flat=True)
+    )
+    category_ids = categories.resolve({movie['category'] for movie in by_title.values()})
+
+    new_movies = [
+        Movie(
+            title=movie['title'],
+            description=movie['description'],
+            release_date=movie['release_date'],
+            director=movie['director'],
+            category_id=category_ids.get(movie['category']),
+        )
+        for title, movie in by_title.items() if title not in existing
+    ]
+    # The category totals are rebuilt once the movies are in (import_movies)
+    Movie.objects.using(using).bulk_create(new_movies, refresh_categories=False)
+    return len(new_movies), len(parsed) - len(new_movies)
+
+
+def write_review_batch(parsed, using, use_copy=False):
+    """
+    Insert reviews of existing movies and bump their rating aggregates.
+    Returns ``(created, errors)`` where errors are reviews of unknown movies.
+    """
+    movie_ids = {review[0] for _, review in parsed}
+    known = set(Movie.objects.using(using).filter(pk__in=movie_ids).values_list('pk', flat=True))
+
+    rows, errors = [], []
+    deltas = defaultdict(lambda: defaultdict(int))
+    for line_number, (movie_id, rating, review_text) in parsed:
+        if movie_id not in known:
+            errors.append((line_number, f"Movie with ID {movie_id} not found."))
+            continue
+        rows.append((movie_id, rating, review_text))
+        deltas[movie_id][rating] += 1
+
+    if use_copy:
+        copy_reviews(rows, using)
+    else:
+        Review.objects.using(using).bulk_create(
+            [Review(movie_id=movie_id, rating=rating, review_text=text) for movie_id, rating, text in rows],
+            refresh_ratings=False,
+        )
+    apply_rating_deltas(deltas, using=using)
+    return len(rows), errors
+
+
+# COPY bypasses the model defaults: every NOT NULL column but the id must be listed
+REVIEW_COPY_COLUMNS = ('movie_id', 'rating', 'review_text', 'created_at', 'updated_at', 'user_id')
+
+
+def copy_reviews(rows, using):
+    # PostgreSQL COPY: one round-trip and no per-row INSERT parsing
+    user_id = Review._meta.get_field('user').get_default()
+    now = timezone.now().isoformat()
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    for movie_id, rating, review_text in rows:
+        writer.writerow((movie_id, rating, review_text, now, now, user_id))
+    buffer.seek(0)
+
+    table = Review._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {table} ({", ".join(REVIEW_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)',
+            buffer,
+        )
+
+
+def copy_supported(using):
+    return connections[using].vendor == 'postgresql'
+
+
+def import_movies(path, batch_size, checkpoint, using, progress=None):
+    stats = ImportStats('Movies')
+    done = checkpoint.position('movies', path)
+    categories = CategoryResolver(using)
+    for batch in iter_csv_batches(path, batch_size, skip=done):
+        parsed, errors = parse_batch(batch, parse_movie_row)
+        done += len(batch)
+        with transaction.atomic(using=using):
+            created, skipped = write_movie_batch(parsed, categories, using)
+            checkpoint.advance('movies', path, done)
+        stats.add(len(batch), created, skipped, errors)
+        if progress:
+            progress(stats)
+    # bulk_create skips the signals; the review batches then adjust these rows by delta
+    rebuild_category_stats(using=using)
+    return stats
+
+
+def import_reviews(path, batch_size, checkpoint, using, use_copy=False, progress=None):
+    stats = ImportStats('Reviews')
+    done = checkpoint.position('reviews', path)
+    for batch in iter_csv_batches(path, batch_size, skip=done):
+        parsed, errors = parse_batch(batch, parse_review_row)
+        done += len(batch)
+        with transaction.atomic(using=using):
+            created, missing = write_review_batch(parsed, using, use_copy=use_copy)
+            checkpoint.advance('reviews', path, done)
+        stats.add(len(batch), created, 0, errors + missing)
+        if progress:
+            progress(stats)
+    return stats
+
+
+# Parallel (sharded) review import
+
+def plan_shards(path, shard_bytes, start=None):
+    """
+    Split the data rows of a CSV into ``[start, end)`` byte ranges of roughly
+    ``shard_bytes`` that begin at line starts. Returns ``(fieldnames, shards)``.
+    Records must not contain embedded newlines.
+    """
+    with open(path, 'rb') as f:
+        fieldnames = next(csv.reader([f.readline().decode('utf-8')]))
+        data_start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        start = max(start or data_start, data_start)
+        shards = []
+        while start < size:
+            end = min(start + shard_bytes, size)
+            if end < size:
+                # Move the boundary to the start of the next line
+                f.seek(end - 1)
+                f.readline()
+                end = f.tell()
+            shards.append((start, end))
+            start = end
+    return fieldnames, shards
+
+
+def parse_review_shard(path, start, end, fieldnames):
+    """
+    Worker entry point: parse one byte range of the reviews file.
+    Returns ``(parsed, errors, line_count)`` with line numbers relative to the shard.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start).decode('utf-8')
+    reader = csv.DictReader(StringIO(data, newline=''), fieldnames=fieldnames)
+    parsed, errors = parse_batch(((reader.line_num, row) for row in reader), parse_review_row)
+    line_count = data.count('\n') + (0 if data.endswith('\n') else 1)
+    return parsed, errors, line_count
+
+
+def import_reviews_parallel(path, batch_size, checkpoint, using, workers, shard_bytes,
+                            use_copy=False, progress=None):
+    stats = ImportStats('Reviews')
+    entry = checkpoint.entry('review_shards', path)
+    fieldnames, shards = plan_shards(path, shard_bytes, start=entry.get('offset'))
+    rows_done = entry.get('rows', 0)
+    lines_before = entry.get('lines', 1)  # the header line
+
+    # Spawned workers never inherit this process's database connections
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+        pending = deque()
+        shard_iter = iter(enumerate(shards))
+
+        def submit_next():
+            for index, (start, end) in shard_iter:
+                pending.append((index, end, pool.submit(parse_review_shard, path, start, end, fieldnames)))
+                return
+
+        # Keep a bounded number of parsed shards in flight so memory stays flat
+        for _ in range(workers * 2):
+            submit_next()
+
+        while pending:
+            index, end, future = pending.popleft()
+            parsed, errors, line_count = future.result()
+            submit_next()
+            rows = len(parsed) + len(errors)
+
+            parsed = [(lines_before + line, review) for line, review in parsed]
+            errors = [(lines_before + line, f"[shard {index}] {message}") for line, message in errors]
+            created = 0
+            with transaction.atomic(using=using):
+                for offset in range(0, len(parsed), batch_size):
+                    batch_created, missing = write_review_batch(
+                        parsed[offset:offset + batch_size], using, use_copy=use_copy)
+                    created += batch_created
+                    errors.extend((line, f"[shard {index}] {message}") for line, message in missing)
+                rows_done += rows
+                lines_before += line_count
+                checkpoint.advance('review_shards', path, rows_done, offset=end, lines=lines_before)
+            stats.add(rows, created, 0, sorted(errors))
+            if progress:
+                progress(stats)
+    return stats
@@ -0,0 +1,296 @@
+"""
+Precomputed "top rated" and "trending" leaderboards.
+
+Scores live in ``MovieRanking`` so that reading a board is a single range scan
+over a ``(category, -score, movie)`` index instead of an aggregate over reviews.
+
+* ``top_score`` is a Bayesian average: each movie's ratings are blended with
+  ``LEADERBOARD_PRIOR_WEIGHT`` virtual ratings at the global mean, so a movie
+  with two 5-star reviews does not outrank one with thousands of 4.8s.
+* ``trending_score`` is an exponentially time-decayed review count with a
+  half-life of ``LEADERBOARD_TRENDING_HALF_LIFE_DAYS``. It is stored as
+  ``log(sum(exp(decay_rate * age_since_epoch)))``: decaying every movie by the
+  same factor never changes the order, so a refresh only adds the new reviews
+  and never rewrites untouched rows.
+
+``refresh_leaderboards`` is incremental: it rescores movies whose aggregates
+changed since the last run (with the overlap of movies/watermarks.py) and
+folds in reviews with a higher id than the last one processed. Ids are
+allocated before commit, so a review with a lower id can still commit after a
+run has passed it: the ids a run skipped are kept as gaps in
+``LeaderboardState.review_gaps`` and looked up again by the following runs,
+until they are older than the watermark overlap (then they were deleted or
+rolled back). Deleted reviews keep their (decaying) trending weight until the
+next ``full`` refresh.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Min, Q, Sum, Window
+from django.db.models.functions import Lead
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import LeaderboardState, Movie, MovieRanking, Review
+from .watermarks import changed_since, database_now, get_overlap
+
+TOP = 'top'
+TRENDING = 'trending'
+BOARD_FIELDS = {TOP: 'top_score', TRENDING: 'trending_score'}
+
+# Fixed origin of the log-space trending scores
+TRENDING_EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+# A full refresh ignores reviews older than this many half-lives (weight < 0.1%)
+TRENDING_HORIZON_HALF_LIVES = 10
+# Rescore everything when the global mean moved by more than this
+MEAN_DRIFT_TOLERANCE = 0.01
+# Review id gaps looked up per query
+GAP_QUERY_SIZE = 200
+
+
+def get_prior_weight():
+    return getattr(settings, 'LEADERBOARD_PRIOR_WEIGHT', 10)
+
+
+def get_half_life():
+    return timedelta(days=getattr(settings, 'LEADERBOARD_TRENDING_HALF_LIFE_DAYS', 7))
+
+
+def decay_rate():
+    """Per-second decay rate of a review's trending weight."""
+    return math.log(2) / get_half_life().total_seconds()
+
+
+def bayesian_average(rating_sum, review_count, mean, prior_weight):
+    return (prior_weight * mean + rating_sum) / (prior_weight + review_count)
+
+
+def log_weight(created_at):
+    """Log of a review's trending weight, relative to ``TRENDING_EPOCH``."""
+    return decay_rate() * (created_at - TRENDING_EPOCH).total_seconds()
+
+
+def log_add(a, b):
+    # log(exp(a) + exp(b)) without overflow; None stands for log(0)
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def decayed_count(trending_score, now=None):
+    """Convert a stored trending score into today's decayed review count."""
+    if trending_score is None:
+        return 0.0
+    return math.exp(trending_score - log_weight(now or timezone.now()))
+
+
+def global_mean_rating(using=None):
+    totals = Movie.objects.using(using).aggregate(rating_sum=Sum('rating_sum'), review_count=Sum('review_count'))
+    if not totals['review_count']:
+        return 0.0
+    return totals['rating_sum'] / totals['review_count']
+
+
+def _get_state(using):
+    state = LeaderboardState.objects.using(using).order_by('pk').first()
+    return state or LeaderboardState.objects.using(using).create()
+
+
+def refresh_top_scores(movies, mean, chunk_size, using=None):
+    """Upsert the Bayesian score of ``movies`` (a Movie queryset); returns the number rescored."""
+    prior_weight = get_prior_weight()
+    rows = movies.order_by().values_list('id', 'category_id', 'rating_sum', 'review_count')
+    total = 0
+    batch = []
+    for movie_id, category_id, rating_sum, review_count in rows.iterator(chunk_size=chunk_size):
+        batch.append(MovieRanking(
+            movie_id=movie_id,
+            category_id=category_id,
+            top_score=bayesian_average(rating_sum, review_count, mean, prior_weight),
+        ))
+        if len(batch) == chunk_size:
+            total += _upsert_top(batch, using)
+            batch = []
+    if batch:
+        total += _upsert_top(batch, using)
+    return total
+
+
+def _upsert_top(rankings, using):
+    MovieRanking.objects.using(using).bulk_create(
+        rankings, update_conflicts=True, unique_fields=['movie'], update_fields=['category', 'top_score'],
+    )
+    return len(rankings)
+
+
+def _fold_reviews(rows, using=None):
+    """Add ``(movie_id, created_at)`` rows to the trending scores (in the caller's transaction)."""
+    added = defaultdict(lambda: None)
+    for movie_id, created_at in rows:
+        added[movie_id] = log_add(added[movie_id], log_weight(created_at))
+
+    rankings = MovieRanking.objects.using(using)
+    existing = rankings.select_for_update().in_bulk(list(added))
+    # Movies without a ranking row yet get one with their category; their top
+    # score is filled in by the next refresh_top_scores() pass
+    categories = dict(
+        Movie.objects.using(using).filter(pk__in=set(added) - set(existing)).values_list('pk', 'category_id')
+    )
+    updated, created = [], []
+    for movie_id, score in added.items():
+        if movie_id in existing:
+            ranking = existing[movie_id]
+            ranking.trending_score = log_add(ranking.trending_score, score)
+            updated.append(ranking)
+        elif movie_id in categories:
+            created.append(MovieRanking(
+                movie_id=movie_id, category_id=categories[movie_id], trending_score=score,
+            ))
+    rankings.bulk_update(updated, ['trending_score'])
+    rankings.bulk_create(created)
+
+
+def _missing_ranges(low, high, present, seen_at):
+    """``[first, last, seen_at]`` ranges of the ids in ``(low, high]`` that are not in ``present``."""
+    gaps = []
+    previous = low
+    for pk in sorted(present) + [high + 1]:
+        if pk > previous + 1:
+            gaps.append([previous + 1, pk - 1, seen_at])
+        previous = max(previous, pk)
+    return gaps
+
+
+def _missing_ids(reviews, low, high, seen_at):
+    """
+    ``_missing_ranges`` of the ids in ``(low, high]`` computed by the database:
+    only the rows followed by a gap are fetched, not every id of the range.
+    """
+    ids = reviews.filter(pk__gt=low, pk__lte=high)
+    bounds = ids.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return [[low + 1, high, seen_at]] if high > low else []
+    gaps = [[low + 1, bounds['first'] - 1, seen_at]] if bounds['first'] > low + 1 else []
+    followed = ids.annotate(next_pk=Window(Lead('pk'), order_by=F('pk').asc())).filter(next_pk__gt=F('pk') + 1)
+    gaps += sorted([pk + 1, next_pk - 1, seen_at] for pk, next_pk in followed.values_list('pk', 'next_pk'))
+    if bounds['last'] < high:
+        gaps.append([bounds['last'] + 1, high, seen_at])
+    return gaps
+
+
+def add_trending_reviews(state, chunk_size, now, since=None, using=None):
+    """
+    Fold reviews with an id above ``state.last_review_id`` (created after
+    ``since``, if given) into the trending scores, one chunk per transaction.
+    The watermark and the ids skipped below it are saved with each chunk, so
+    an interrupted run never counts a review twice.
+    """
+    total = 0
+    last_id = Review.objects.using(using).aggregate(last=Max('pk'))['last'] or 0
+    reviews = Review.objects.using(using).filter(pk__lte=last_id)
+    while True:
+        low = state.last_review_id
+        chunk = reviews.filter(pk__gt=low).order_by('pk')
+        if since is not None:
+            chunk = chunk.filter(created_at__gte=since)
+        chunk = list(chunk.values_list('pk', 'movie_id', 'created_at')[:chunk_size])
+        high = chunk[-1][0] if len(chunk) == chunk_size else last_id
+        if high <= low:
+            return total
+        if since is None:
+            gaps = _missing_ranges(low, high, {pk for pk, _, _ in chunk}, now.isoformat())
+        else:
+            # Older reviews were left out on purpose, they are not gaps; the
+            # range may hold most of the table, so the database finds the gaps
+            gaps = _missing_ids(reviews, low, high, now.isoformat())
+
+        with transaction.atomic(using=using):
+            _fold_reviews([(movie_id, created_at) for _, movie_id, created_at in chunk], using)
+            state.review_gaps += gaps
+            state.last_review_id = high
+            state.save(update_fields=['last_review_id', 'review_gaps'])
+        total += len(chunk)
+
+
+def recheck_review_gaps(state, now, using=None):
+    """
+    Count the reviews that committed inside the gaps of earlier runs and
+    forget the gaps older than the watermark overlap; returns the reviews added.
+    """
+    expired = now - get_overlap()
+    gaps = state.review_gaps
+    remaining = []
+    total = 0
+    for offset in range(0, len(gaps), GAP_QUERY_SIZE):
+        batch = gaps[offset:offset + GAP_QUERY_SIZE]
+        query = Q()
+        for first, last, _ in batch:
+            query |= Q(pk__range=(first, last))
+        found = list(Review.objects.using(using).filter(query).values_list('pk', 'movie_id', 'created_at'))
+        present = {pk for pk, _, _ in found}
+        for first, last, seen_at in batch:
+            if parse_datetime(seen_at) > expired:
+                remaining += _missing_ranges(first - 1, last, {pk for pk in present if first <= pk <= last}, seen_at)
+        # The found reviews and the gaps they close are saved together
+        with transaction.atomic(using=using):
+            _fold_reviews([(movie_id, created_at) for _, movie_id, created_at in found], using)
+            state.review_gaps = remaining + gaps[offset + GAP_QUERY_SIZE:]
+            state.save(update_fields=['review_gaps'])
+        total += len(found)
+    return total
+
+
+def refresh_leaderboards(full=False, chunk_size=1000, using=None):
+    """
+    Bring both leaderboards up to date; returns ``(movies rescored, reviews added)``.
+    ``full`` rescores every movie and rebuilds the trending scores from scratch.
+    """
+    # The database clock stamps updated_at, see movies/watermarks.py
+    started = database_now(using)
+    state = _get_state(using)
+    mean = global_mean_rating(using)
+    # When the prior moved, every stored top score is stale
+    rescore_all = full or state.mean_rating is None or abs(mean - state.mean_rating) > MEAN_DRIFT_TOLERANCE
+    if rescore_all:
+        state.mean_rating = mean
+
+    movies = Movie.objects.using(using)
+    if not rescore_all and state.refreshed_at is not None:
+        movies = movies.filter(updated_at__gte=changed_since(state.refreshed_at))
+    rescored = refresh_top_scores(movies, state.mean_rating, chunk_size, using)
+
+    if full:
+        horizon = started - get_half_life() * TRENDING_HORIZON_HALF_LIVES
+        with transaction.atomic(using=using):
+            MovieRanking.objects.using(using).update(trending_score=None)
+            state.last_review_id = 0
+            state.review_gaps = []
+            state.save(update_fields=['last_review_id', 'review_gaps'])
+        added = add_trending_reviews(state, chunk_size, started, since=horizon, using=using)
+    else:
+        added = recheck_review_gaps(state, started, using)
+        added += add_trending_reviews(state, chunk_size, started, using=using)
+
+    state.refreshed_at = started
+    state.save(update_fields=['refreshed_at', 'mean_rating'])
+    return rescored, added
+
+
+def leaderboard(board, category_id=None, limit=20, using=None):
+    """The ``limit`` best-ranked movies of ``board``, optionally within one category."""
+    field = BOARD_FIELDS[board]
+    rankings = MovieRanking.objects.using(using)
+    if category_id is not None:
+        rankings = rankings.filter(category_id=category_id)
+    if board == TRENDING:
+        rankings = rankings.filter(trending_score__isnull=False)
+    return list(
+        rankings.select_related('movie__category').defer('movie__description')
+        .order_by(f'-{field}', 'movie_id')[:limit]
+    )
@@ -0,0 +1,122 @@
+"""
+Small closed-loop HTTP load generator behind the ``loadtest`` command.
+
+``concurrency`` asyncio clients each keep one HTTP/1.1 keep-alive connection
+and send GET requests back to back for ``duration`` seconds, cycling through
+the given paths. Only the standard library is used, so it runs anywhere the
+project does.
+"""
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class LoadResult:
+    def __init__(self, label, latencies, errors, elapsed):
+        self.label = label
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def rps(self):
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'label': self.label,
+            'requests': self.requests,
+            'errors': self.errors,
+            'rps': round(self.rps, 1),
+            'p50_ms': round(percentile(self.latencies, 0.50) * 1000, 2),
+            'p90_ms': round(percentile(self.latencies, 0.90) * 1000, 2),
+            'p99_ms': round(percentile(self.latencies, 0.99) * 1000, 2),
+        }
+
+
+async def _read_response(reader):
+    """Read one response; returns ``(status, keep_alive)``."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed by the server")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)  # chunk + CRLF
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def _client(host, port, paths, offset, deadline, latencies, errors, headers):
+    reader = writer = None
+    index = offset
+    while time.monotonic() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            request = f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n{headers}Connection: keep-alive\r\n\r\n'
+            started = time.monotonic()
+            writer.write(request.encode('latin-1'))
+            await writer.drain()
+            status, keep_alive = await _read_response(reader)
+            latencies.append(time.monotonic() - started)
+            if status >= 400:
+                errors.append(status)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            errors.append('connection')
+            if writer is not None:
+                writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(base_url, paths, concurrency, duration, headers=None):
+    """Returns ``(latencies in seconds, errors, elapsed seconds)``."""
+    parts = urlsplit(base_url)
+    prefix = parts.path.rstrip('/')
+    paths = [prefix + path for path in paths]
+    extra_headers = ''.join(f'{name}: {value}\r\n' for name, value in (headers or {}).items())
+    latencies, errors = [], []
+    started = time.monotonic()
+    deadline = started + duration
+    await asyncio.gather(*(
+        _client(parts.hostname, parts.port or 80, paths, offset, deadline, latencies, errors, extra_headers)
+        for offset in range(concurrency)
+    ))
+    return latencies, len(errors), time.monotonic() - started
+
+
+def load_test(label, base_url, paths, concurrency, duration, warmup=0, headers=None):
+    if warmup:
+        asyncio.run(run_load(base_url, paths, concurrency, warmup, headers))
+    latencies, errors, elapsed = asyncio.run(run_load(base_url, paths, concurrency, duration, headers))
+    return LoadResult(label, latencies, errors, elapsed)
@@ -0,0 +1,67 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.benchmarks import (
+    BenchmarkContext, result_document, run_endpoint_benchmarks, run_load_tests, run_micro_benchmarks,
+)
+
+
+class Command(BaseCommand):
+    help = ("Run the micro-benchmarks and in-process endpoint benchmarks (and a load test of every endpoint "
+            "with --base-url) against the current database; see movieR/benchmark_settings.py")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', default='',
+                            help="Comma-separated name prefixes, e.g. serializer.,endpoint.movie-list")
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--min-time', type=float, default=0.2, help="Minimum seconds per round")
+        parser.add_argument('--sample-size', type=int, default=50, help="Rows per serializer/query benchmark")
+        parser.add_argument('--no-endpoints', action='store_true', help="Skip the in-process endpoint benchmarks")
+        parser.add_argument('--base-url', help="Also load-test a running server, e.g. http://localhost:8000")
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--duration', type=float, default=10, help="Seconds of load per endpoint")
+        parser.add_argument('--warmup', type=float, default=1, help="Seconds of unmeasured load first")
+        parser.add_argument('--output', help="Write the results as JSON (for compare_benchmarks)")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if options['rounds'] <= 0 or options['sample_size'] <= 0:
+            raise CommandError("--rounds and --sample-size must be positive")
+        names = [name.strip() for name in options['only'].split(',') if name.strip()]
+        using = options['database']
+        context = BenchmarkContext(using, options['sample_size'])
+        if not context.movies:
+            raise CommandError("No movies to benchmark; run generate_benchmark_data first")
+
+        timing = {'names': names, 'rounds': options['rounds'], 'min_time': options['min_time']}
+        results = run_micro_benchmarks(context, **timing)
+        if not options['no_endpoints']:
+            results += run_endpoint_benchmarks(context, **timing)
+        if options['base_url']:
+            self.stderr.write(f"Load testing {options['base_url']} with {options['concurrency']} clients...")
+            results += run_load_tests(options['base_url'], context, options['concurrency'], options['duration'],
+                                      warmup=options['warmup'], names=names)
+
+        document = result_document(results, using)
+        if options['output']:
+            directory = os.path.dirname(options['output'])
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(options['output'], 'w') as output:
+                json.dump(document, output, indent=2)
+
+        self.stdout.write(f"{'benchmark':<40} {'median':>12} {'min':>12} {'queries':>8}")
+        for result in results:
+            if result['kind'] == 'load':
+                self.stdout.write(f"{result['name']:<40} {result['p50_ms']:>9.2f} ms {result['p99_ms']:>9.2f} ms "
+                                  f"{result['rps']:>8.1f} req/s, {result['errors']} errors")
+                continue
+            self.stdout.write(f"{result['name']:<40} {result['median_us']:>9.1f} µs {result['min_us']:>9.1f} µs "
+                              f"{result['queries']:>8}")
+        failed = [result['name'] for result in results if result.get('status', 200) >= 400]
+        if failed:
+            self.stdout.write(self.style.ERROR(f"Endpoints answering with an error: {', '.join(failed)}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {len(results)} benchmarks run on {document['meta']['database']} at {document['meta']['commit']}."))
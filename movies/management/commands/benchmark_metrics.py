@@ -0,0 +1,67 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve
+
+from movies.metrics import MetricsMiddleware, db_execute_wrapper, registry
+
+
+def per_call_us(function, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+class Command(BaseCommand):
+    help = "Measure the per-request and per-query overhead of the /metrics instrumentation (no database needed)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200000)
+        parser.add_argument('--queries', type=int, default=5, help="Queries per simulated request")
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results")
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        request = RequestFactory().get('/movies/')
+        request.resolver_match = resolve('/movies/')
+        response = HttpResponse()
+        context = {'connection': connections['default'], 'cursor': None}
+
+        def fake_execute(sql, params, many, context):
+            return None
+
+        def view(request):
+            for _ in range(options['queries']):
+                fake_execute('SELECT 1', (), False, context)
+            return response
+
+        def instrumented_view(request):
+            for _ in range(options['queries']):
+                db_execute_wrapper(fake_execute, 'SELECT 1', (), False, context)
+            return response
+
+        middleware = MetricsMiddleware(instrumented_view)
+        bare = per_call_us(lambda: view(request), iterations)
+        instrumented = per_call_us(lambda: middleware(request), iterations)
+        query_bare = per_call_us(lambda: fake_execute('SELECT 1', (), False, context), iterations)
+        query_wrapped = per_call_us(
+            lambda: db_execute_wrapper(fake_execute, 'SELECT 1', (), False, context), iterations)
+        registry.clear()
+
+        results = {
+            'request_overhead_us': round(instrumented - bare, 3),
+            'query_overhead_us': round(query_wrapped - query_bare, 3),
+            'queries_per_request': options['queries'],
+            'iterations': iterations,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"Per request (incl. {options['queries']} queries): {results['request_overhead_us']:.2f} µs")
+        self.stdout.write(f"Per query: {results['query_overhead_us']:.2f} µs")
+        self.stdout.write(self.style.SUCCESS("✅ Metrics overhead measured."))
@@ -0,0 +1,43 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies.recommendations import InteractionMatrix, get_neighbor_count
+
+
+class Command(BaseCommand):
+    help = "Time the neighbour computation on synthetic data for several catalog sizes (no database access)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,5000,20000',
+                            help="Comma-separated catalog sizes (number of movies)")
+        parser.add_argument('--users-per-movie', type=float, default=2.0)
+        parser.add_argument('--interactions-per-user', type=int, default=30)
+        parser.add_argument('--neighbors', type=int, default=None)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def synthetic_matrix(self, movies, users, per_user, rng):
+        # Zipf-like popularity: a few blockbusters, a long tail
+        popularity = [1 / (rank + 1) for rank in range(movies)]
+        matrix = InteractionMatrix()
+        for user_id in range(users):
+            for movie_id in rng.choices(range(movies), weights=popularity, k=per_user):
+                matrix.add(user_id, movie_id, rng.choice((1 / 3, 2 / 3, 1.0)))
+        return matrix.finalize()
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        k = options['neighbors'] or get_neighbor_count()
+        self.stdout.write(f"{'movies':>8} {'users':>8} {'interactions':>13} {'build s':>9} {'movies/s':>10}")
+        for size in [int(size) for size in options['sizes'].split(',')]:
+            users = int(size * options['users_per_movie'])
+            matrix = self.synthetic_matrix(size, users, options['interactions_per_user'], rng)
+            started = time.perf_counter()
+            for movie_id in range(size):
+                matrix.neighbors(movie_id, k)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{size:>8} {users:>8} {matrix.interaction_count:>13} {elapsed:>9.2f} {size / elapsed:>10,.0f}"
+            )
+        self.stdout.write(self.style.SUCCESS("✅ Benchmark finished."))
@@ -0,0 +1,92 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.loadtest import load_test
+
+GUNICORN_CONFIG = os.path.join('movieR', 'gunicorn.conf.py')
+
+
+def server_command(mode, port):
+    address = f'127.0.0.1:{port}'
+    if mode == 'runserver':
+        return [sys.executable, 'manage.py', 'runserver', '--noreload', address], {}
+    if mode in ('gthread', 'uvicorn'):
+        command = [sys.executable, '-m', 'gunicorn', '-c', GUNICORN_CONFIG, '--bind', address]
+        return command, {'GUNICORN_WORKER_CLASS': mode, 'GUNICORN_ACCESSLOG': ''}
+    raise CommandError(f"Unknown server mode '{mode}'; use runserver, gthread or uvicorn.")
+
+
+def wait_until_listening(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f"The server exited with code {process.returncode} before listening.")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"Nothing listens on port {port} after {timeout}s.")
+
+
+class Command(BaseCommand):
+    help = ("Start the app under each server mode (runserver, gunicorn gthread, gunicorn uvicorn) "
+            "in turn and measure the throughput and latency of the same requests.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default='runserver,gthread,uvicorn',
+                            help="Comma-separated server modes to compare")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Gunicorn worker processes (default: sized from the CPUs, see gunicorn.conf.py)")
+        parser.add_argument('--port', type=int, default=8100, help="Port the servers listen on")
+        parser.add_argument('--paths', default='/movies/,/movies/1/,/reviews/',
+                            help="Comma-separated paths, requested round-robin")
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--duration', type=float, default=20, help="Seconds measured per server")
+        parser.add_argument('--warmup', type=float, default=3, help="Seconds of unmeasured load first")
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results")
+
+    def handle(self, *args, **options):
+        paths = [path.strip() for path in options['paths'].split(',') if path.strip()]
+        port = options['port']
+        results = []
+        for mode in [mode.strip() for mode in options['modes'].split(',') if mode.strip()]:
+            command, extra_env = server_command(mode, port)
+            env = {**os.environ, **extra_env}
+            if options['workers']:
+                env['GUNICORN_WORKERS'] = str(options['workers'])
+
+            self.stderr.write(f"Starting {mode}...")
+            process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_until_listening(port, process)
+                self.stderr.write(f"Loading {mode} with {options['concurrency']} clients...")
+                results.append(load_test(mode, f'http://127.0.0.1:{port}', paths, options['concurrency'],
+                                         options['duration'], warmup=options['warmup']).as_dict())
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=40)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'server':<10} {'requests':>9} {'errors':>7} {'req/s':>9} "
+                          f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+        for result in results:
+            self.stdout.write(
+                f"{result['label']:<10} {result['requests']:>9} {result['errors']:>7} {result['rps']:>9.1f} "
+                f"{result['p50_ms']:>8.2f} {result['p90_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+            )
+        self.stdout.write(self.style.SUCCESS("✅ Server benchmark finished."))
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.benchmarks import compare
+
+
+class Command(BaseCommand):
+    help = "Compare two benchmark result files; fails when a benchmark got slower or runs more queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('base', help="Results of the baseline commit (benchmark --output)")
+        parser.add_argument('head', help="Results of the commit under test")
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help="Slowdown in percent tolerated before a benchmark counts as regressed")
+
+    def handle(self, *args, **options):
+        documents = []
+        for path in (options['base'], options['head']):
+            try:
+                with open(path) as results:
+                    documents.append(json.load(results))
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {path}: {e}")
+        base, head = documents
+        for label, document in (('base', base), ('head', head)):
+            meta = document['meta']
+            self.stdout.write(f"{label}: {meta['commit']} on {meta['database']}, {meta['dataset']}")
+        if base['meta']['dataset'] != head['meta']['dataset']:
+            self.stdout.write(self.style.WARNING("The datasets differ; timings are not comparable."))
+
+        rows = compare(base, head, options['threshold'])
+        self.stdout.write(f"{'benchmark':<40} {'metric':<10} {'before':>10} {'after':>10} {'change':>8}")
+        for name, metric, before, after, change, regressed in rows:
+            line = f"{name:<40} {metric:<10} {before:>10} {after:>10} {change:>+7.1f}%"
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+
+        regressions = sum(row[-1] for row in rows)
+        if regressions:
+            raise CommandError(f"❌ {regressions} regressions (threshold {options['threshold']}%).")
+        self.stdout.write(self.style.SUCCESS(f"✅ No regressions in {len(rows)} comparisons."))
@@ -0,0 +1,58 @@
+import time
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.benchmarks import flush_dataset, generate_dataset
+
+
+class Command(BaseCommand):
+    help = ("Bulk-insert a seeded synthetic catalog for the benchmarks, "
+            "e.g. --movies 1000000 --reviews 50000000 --watchlists 100000")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=10000)
+        parser.add_argument('--reviews', type=int, default=200000)
+        parser.add_argument('--watchlists', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=None,
+                            help="Review authors (default: one per watchlist, at least 1)")
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--watchlist-size', type=int, default=20, help="Average movies per watchlist")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=10000, help="Rows inserted per statement")
+        parser.add_argument('--flush', action='store_true',
+                            help="Delete all movies, reviews, watchlists, categories and bench users first")
+        parser.add_argument('--derived', action='store_true',
+                            help="Also refresh the leaderboards and build the recommendations afterwards")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if min(options['movies'], options['reviews'], options['watchlists']) < 0 or options['batch_size'] <= 0:
+            raise CommandError("Sizes must not be negative and --batch-size must be positive")
+        if options['reviews'] and not options['movies']:
+            raise CommandError("Reviews need at least one movie")
+
+        using = options['database']
+        if options['flush']:
+            flush_dataset(using)
+        progress = self.report_progress if options['verbosity'] >= 2 else None
+        started = time.monotonic()
+        created = generate_dataset(
+            options['movies'], options['reviews'], options['watchlists'], users=options['users'],
+            categories=options['categories'], watchlist_size=options['watchlist_size'], seed=options['seed'],
+            batch_size=options['batch_size'], using=using, progress=progress,
+        )
+        elapsed = time.monotonic() - started
+        cache.clear()
+        if options['derived']:
+            call_command('refresh_leaderboards', database=using, stdout=self.stdout)
+            call_command('build_recommendations', database=using, stdout=self.stdout)
+
+        rows = sum(created.values())
+        self.stdout.write(', '.join(f"{count:,} {name.replace('_', ' ')}" for name, count in created.items()))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Benchmark data generated in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:,.0f} rows/s)."))
+
+    def report_progress(self, label, done, total):
+        self.stdout.write(f"{label}: {done:,}/{total:,}")
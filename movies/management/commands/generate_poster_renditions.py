@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from movies.models import Movie
+from movies.posters import generate_renditions
+
+
+class Command(BaseCommand):
+    help = "Generate poster renditions for movies whose poster has none yet (or for all with --force)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate renditions that already exist")
+        parser.add_argument('--workers', type=int, default=4, help="Posters processed in parallel")
+        parser.add_argument('--database', default='default')
+
+    def pending_movie_ids(self, using, force):
+        movies = Movie.objects.using(using).exclude(poster='').exclude(poster__isnull=True)
+        for movie_id, poster, renditions in movies.values_list('id', 'poster', 'poster_renditions').iterator():
+            if force or (renditions or {}).get('source') != poster:
+                yield movie_id
+
+    def results(self, movie_ids, using, workers):
+        """Yield ``(movie_id, error or None)`` in order; one worker runs in this thread."""
+        if workers <= 1:
+            for movie_id in movie_ids:
+                try:
+                    generate_renditions(movie_id, using=using)
+                except Exception as e:
+                    yield movie_id, e
+                else:
+                    yield movie_id, None
+            return
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(movie_id, pool.submit(generate_renditions, movie_id, using=using)) for movie_id in movie_ids]
+            for movie_id, future in futures:
+                yield movie_id, future.exception()
+
+    def handle(self, *args, **options):
+        using = options['database']
+        movie_ids = list(self.pending_movie_ids(using, options['force']))
+        done = failed = 0
+        for movie_id, error in self.results(movie_ids, using, options['workers']):
+            if error is None:
+                done += 1
+            else:
+                failed += 1
+                self.stderr.write(f"Movie {movie_id}: {error}")
+        self.stdout.write(self.style.SUCCESS(f"✅ Generated poster renditions for {done} movies ({failed} failed)."))
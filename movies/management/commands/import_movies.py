@@ -1,60 +1,78 @@
-from django.core.management.base import BaseCommand
-import csv
-from movies.models import Movie, Category, Review
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.importing import (
+    Checkpoint, copy_supported, import_movies, import_reviews, import_reviews_parallel,
+)
+
+# Invalid rows printed in the final report (the total is always shown)
+MAX_REPORTED_ERRORS = 20
+
 
 class Command(BaseCommand):
-    help = "Import movies and reviews from CSV files"
+    help = "Import movies and reviews from CSV files in batches"
 
-    def handle(self, *args, **kwargs):
-        try:
-            # Import Categories first
-            category_dict = {}
-
-            with open('movies_data.csv', newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    category_name = row['category'].strip()
-                    if category_name not in category_dict:
-                        category, created = Category.objects.get_or_create(name=category_name)
-                        category_dict[category_name] = category
-                        self.stdout.write(self.style.SUCCESS(f"Category added: {category_name}"))
-
-            # Import Movies
-            with open('movies_data.csv', newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    category = category_dict.get(row['category'].strip())
-
-                    movie, created = Movie.objects.get_or_create(
-                        title=row['title'],
-                        defaults={
-                            'description': row['description'],
-                            'release_date': row['release_date'],
-                            'director': row['director'],
-                            'category': category
-                        }
-                    )
-
-                    if created:
-                        self.stdout.write(self.style.SUCCESS(f"Movie added: {movie.title}"))
-
-            # Import Reviews
-            with open('reviews_data.csv', newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    try:
-                        movie = Movie.objects.get(id=row['movie_id'])
-                        Review.objects.create(
-                            movie=movie,
-                            rating=int(row['rating']),
-                            review_text=row['review_text'],
-                            created_at=row['created_at']
-                        )
-                        self.stdout.write(self.style.SUCCESS(f"Review added for: {movie.title}"))
-                    except Movie.DoesNotExist:
-                        self.stdout.write(self.style.ERROR(f"Movie with ID {row['movie_id']} not found."))
-
-            self.stdout.write(self.style.SUCCESS("✅ All data successfully imported!"))
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', default='movies_data.csv', help="Path of the movies CSV")
+        parser.add_argument('--reviews', default='reviews_data.csv', help="Path of the reviews CSV")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Rows parsed, looked up and inserted per transaction")
+        parser.add_argument('--checkpoint',
+                            help="Name of a checkpoint recording committed rows (stored in the database); "
+                                 "an existing checkpoint resumes the import")
+        parser.add_argument('--no-copy', action='store_true',
+                            help="Use bulk_create for reviews even on PostgreSQL instead of COPY")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Parse the reviews file in N processes (byte-range shards, one record per line)")
+        parser.add_argument('--shard-bytes', type=int, default=8 * 1024 * 1024,
+                            help="Approximate size of a reviews shard with --workers; one shard per transaction")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        for option in ('movies', 'reviews'):
+            if not os.path.exists(options[option]):
+                raise CommandError(f"File not found: {options[option]}")
+        if options['batch_size'] <= 0:
+            raise CommandError("--batch-size must be positive")
+        if options['workers'] <= 0 or options['shard_bytes'] <= 0:
+            raise CommandError("--workers and --shard-bytes must be positive")
 
+        using = options['database']
+        batch_size = options['batch_size']
+        checkpoint = Checkpoint(options['checkpoint'], using=using)
+        use_copy = copy_supported(using) and not options['no_copy']
+        progress = self.report_progress if options['verbosity'] >= 2 else None
+        workers = options['workers']
+
+        # Sequential and sharded imports checkpoint reviews differently (rows vs. byte offset)
+        other_stage = 'reviews' if workers > 1 else 'review_shards'
+        if checkpoint.entry(other_stage, options['reviews']):
+            raise CommandError("The checkpoint was written with a different --workers mode; resume with that mode.")
+
+        try:
+            results = [import_movies(options['movies'], batch_size, checkpoint, using, progress=progress)]
+            if workers > 1:
+                results.append(import_reviews_parallel(
+                    options['reviews'], batch_size, checkpoint, using, workers, options['shard_bytes'],
+                    use_copy=use_copy, progress=progress,
+                ))
+            else:
+                results.append(import_reviews(options['reviews'], batch_size, checkpoint, using,
+                                              use_copy=use_copy, progress=progress))
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f"❌ Error: {e}"))
+            resume = " Re-run with the same --checkpoint to resume." if checkpoint.name else ""
+            raise CommandError(f"❌ Error: {e}.{resume}") from e
+
+        for stats in results:
+            self.stdout.write(self.style.SUCCESS(stats.summary()))
+            for line_number, message in stats.errors[:MAX_REPORTED_ERRORS]:
+                self.stdout.write(self.style.ERROR(f"  line {line_number}: {message}"))
+            if len(stats.errors) > MAX_REPORTED_ERRORS:
+                self.stdout.write(self.style.ERROR(f"  ... {len(stats.errors) - MAX_REPORTED_ERRORS:,} more"))
+
+        checkpoint.clear()
+        self.stdout.write(self.style.SUCCESS("✅ All data successfully imported!"))
+
+    def report_progress(self, stats):
+        self.stdout.write(stats.summary())
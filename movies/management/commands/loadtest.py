@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from movies.loadtest import load_test
+
+
+class Command(BaseCommand):
+    help = ("Compare latency (p50/p99) and throughput of the WSGI API with the async ASGI endpoints. "
+            "Run both servers with the same number of worker processes for a fair comparison.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', default='http://localhost:8000', help="Base URL of the WSGI server")
+        parser.add_argument('--asgi', default='http://localhost:8001', help="Base URL of the ASGI server")
+        parser.add_argument('--asgi-prefix', default='/async',
+                            help="Prefix of the async variants of the paths on the ASGI server")
+        parser.add_argument('--paths', default='/movies/,/movies/1/,/reviews/',
+                            help="Comma-separated API paths (sync form), requested round-robin")
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--duration', type=float, default=30, help="Seconds measured per server")
+        parser.add_argument('--warmup', type=float, default=3, help="Seconds of unmeasured load first")
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results")
+
+    def handle(self, *args, **options):
+        paths = [path.strip() for path in options['paths'].split(',') if path.strip()]
+        targets = [
+            ('wsgi', options['wsgi'], paths),
+            ('asgi', options['asgi'], [options['asgi_prefix'].rstrip('/') + path for path in paths]),
+        ]
+        results = []
+        for label, base_url, target_paths in targets:
+            if not base_url:
+                continue
+            self.stderr.write(f"Loading {label} ({base_url}) with {options['concurrency']} clients...")
+            results.append(load_test(label, base_url, target_paths, options['concurrency'],
+                                     options['duration'], warmup=options['warmup']).as_dict())
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'server':<8} {'requests':>9} {'errors':>7} {'req/s':>9} "
+                          f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+        for result in results:
+            self.stdout.write(
+                f"{result['label']:<8} {result['requests']:>9} {result['errors']:>7} {result['rps']:>9.1f} "
+                f"{result['p50_ms']:>8.2f} {result['p90_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+            )
+        self.stdout.write(self.style.SUCCESS("✅ Load test finished."))
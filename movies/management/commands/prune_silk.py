@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.utils import timezone
+from silk.models import Request
+
+
+class Command(BaseCommand):
+    help = "Delete silk profiling data older than --days (run it periodically, e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=7, help="Keep the requests of the last N days")
+        parser.add_argument('--keep', type=int, default=None,
+                            help="Also keep at most this many of the most recent requests")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Requests (with their queries and profiles) deleted per transaction")
+
+    def handle(self, *args, **options):
+        using = router.db_for_write(Request)
+        requests = Request.objects.using(using)
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        if options['keep'] is not None:
+            newest = list(requests.order_by('-start_time').values_list('start_time', flat=True)
+                          [options['keep']:options['keep'] + 1])
+            if newest and newest[0] > cutoff:
+                cutoff = newest[0]
+
+        # Small batches keep locks and transactions short on a live database
+        deleted = 0
+        while True:
+            batch = list(requests.filter(start_time__lte=cutoff)
+                         .order_by('start_time').values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            with transaction.atomic(using=using):
+                requests.filter(pk__in=batch).delete()
+            deleted += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Pruned {deleted} silk requests (up to {cutoff:%Y-%m-%d %H:%M})."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.category_stats import rebuild_category_stats, verify_category_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or verify) the per-category movie/review totals from the movie table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only compare the stored totals with the movies, do not write")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if options['verify']:
+            mismatched = verify_category_stats(using=using)
+            if mismatched:
+                sample = ', '.join(str(category_id) for category_id in mismatched[:20])
+                raise CommandError(f"{len(mismatched)} category(ies) have stale totals: {sample}")
+            self.stdout.write(self.style.SUCCESS("✅ All category totals are consistent."))
+            return
+
+        total = rebuild_category_stats(using=using)
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt the totals of {total} categories."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.ratings import rebuild_rating_stats, verify_rating_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or verify) the denormalized rating aggregates stored on each movie"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only compare stored aggregates with the reviews, do not write")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of movies recomputed per query/transaction")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        using = options['database']
+
+        if options['verify']:
+            mismatched = verify_rating_stats(chunk_size=chunk_size, using=using)
+            if mismatched:
+                sample = ', '.join(str(movie_id) for movie_id in mismatched[:20])
+                raise CommandError(f"{len(mismatched)} movie(s) have stale rating aggregates: {sample}")
+            self.stdout.write(self.style.SUCCESS("✅ All rating aggregates are consistent."))
+            return
+
+        total = rebuild_rating_stats(chunk_size=chunk_size, using=using)
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt rating aggregates for {total} movies."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from movies.leaderboards import refresh_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Update the precomputed top-rated and trending leaderboards (run it periodically, e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Rescore every movie and rebuild trending scores instead of refreshing incrementally")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of movies/reviews processed per query/transaction")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        rescored, added = refresh_leaderboards(
+            full=options['full'], chunk_size=options['chunk_size'], using=options['database'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Leaderboards refreshed: {rescored} movies rescored, {added} new reviews counted."
+        ))
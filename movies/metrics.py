@@ -0,0 +1,426 @@
+"""
+Always-on hot-path metrics in the Prometheus text format, served at ``/metrics``.
+
+Cheap counters and histograms aggregated in process memory:
+
+* request latency per URL name (``MetricsMiddleware``),
+* database queries and query time per request (an ``execute_wrapper``
+  attached to every new database connection),
+* response cache hits and misses (movies/cache.py),
+* serializer time (movies/serializer.py),
+* S3/MinIO API call latency (movies/storage.py).
+
+Under gunicorn each worker process has its own registry. When
+``METRICS_DIR`` is set (movieR/gunicorn.conf.py sets it), every worker
+writes a snapshot of its registry to ``<METRICS_DIR>/metrics_<pid>.json``
+once per ``METRICS_FLUSH_INTERVAL`` from a background thread, and
+``/metrics`` sums all snapshots, so any worker answers for the whole server.
+Snapshots of exited workers are folded into ``archive.json`` by gunicorn's
+``child_exit`` hook so counters never go backwards.
+
+``/metrics`` answers only clients in ``METRICS_ALLOWED_NETWORKS`` (nginx
+also restricts it); the app servers' ports are not published.
+"""
+import atexit
+import fcntl
+import glob
+import ipaddress
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# name -> (type, help, label names, buckets)
+METRICS = {
+    'http_request_duration_seconds': (
+        'histogram', "Request latency by URL name", ('view', 'method', 'status'), DURATION_BUCKETS),
+    'db_queries_per_request': (
+        'histogram', "Database queries per request", ('view',), QUERY_COUNT_BUCKETS),
+    'db_query_duration_seconds': (
+        'histogram', "Total database query time per request", ('view',), DURATION_BUCKETS),
+    'db_queries_total': (
+        'counter', "Database queries, including those outside requests", ('alias',), None),
+    'cache_requests_total': (
+        'counter', "Response cache lookups", ('cache', 'result'), None),
+    'serializer_duration_seconds': (
+        'histogram', "Time spent rendering serializers", ('serializer',), FAST_BUCKETS),
+    's3_request_duration_seconds': (
+        'histogram', "S3/MinIO API call latency", ('operation',), DURATION_BUCKETS),
+}
+
+
+# Layout of a request series: one list holding the three per-request histograms
+_DURATION = len(DURATION_BUCKETS) + 2  # bucket counts incl. +Inf, then the sum
+_QUERIES = len(QUERY_COUNT_BUCKETS) + 2
+REQUEST_HISTOGRAMS = (
+    # (metric, labels kept, offset in the series, size)
+    ('http_request_duration_seconds', 3, 0, _DURATION),
+    ('db_queries_per_request', 1, _DURATION, _QUERIES),
+    ('db_query_duration_seconds', 1, _DURATION + _QUERIES, _DURATION),
+)
+
+
+class Registry:
+    """
+    Counters ``{(name, labels): value}``, histograms ``{(name, labels): [bucket
+    counts..., sum]}`` and per-request series ``{(view, method, status): [...]}``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.requests = {}
+
+    def observe(self, name, labels, value):
+        # Bucket counts are per bucket (not cumulative); the last one is +Inf
+        buckets = METRICS[name][3]
+        key = (name, labels)
+        with self.lock:
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            series[bisect_left(buckets, value)] += 1
+            series[-1] += value
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def record_request(self, view, method, status, duration, queries, query_time):
+        # The hot path: one lookup and three bucket increments under one lock
+        key = (view, method, status)
+        with self.lock:
+            series = self.requests.get(key)
+            if series is None:
+                series = self.requests[key] = [0] * (2 * _DURATION + _QUERIES)
+            series[bisect_left(DURATION_BUCKETS, duration)] += 1
+            series[_DURATION - 1] += duration
+            series[_DURATION + bisect_left(QUERY_COUNT_BUCKETS, queries)] += 1
+            series[_DURATION + _QUERIES - 1] += queries
+            series[_DURATION + _QUERIES + bisect_left(DURATION_BUCKETS, query_time)] += 1
+            series[-1] += query_time
+
+    def snapshot(self):
+        with self.lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self.counters.items()]
+            histograms = [[name, list(labels), list(series)] for (name, labels), series in self.histograms.items()]
+            requests = [(labels, list(series)) for labels, series in self.requests.items()]
+        for labels, series in requests:
+            for name, kept, offset, size in REQUEST_HISTOGRAMS:
+                histograms.append([name, list(labels[:kept]), series[offset:offset + size]])
+        return {'counters': counters, 'histograms': histograms}
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.requests.clear()
+
+
+registry = Registry()
+
+
+def merge(snapshots):
+    """Sum snapshots into ``(counters, histograms)`` dicts keyed by ``(name, labels)``."""
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get('counters', ()):
+            key = (name, tuple(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, series in snapshot.get('histograms', ()):
+            key = (name, tuple(labels))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], series)]
+            else:
+                histograms[key] = list(series)
+    return counters, histograms
+
+
+# Multiprocess aggregation
+
+def get_metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def _write_json(path, data):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def process_file(directory, pid):
+    return os.path.join(directory, f'metrics_{pid}.json')
+
+
+def flush():
+    directory = get_metrics_dir()
+    if directory:
+        _write_json(process_file(directory, os.getpid()), registry.snapshot())
+
+
+_flusher_started = False
+_flusher_lock = threading.Lock()
+
+
+def _flush_forever(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def start_flusher():
+    """Start this process's snapshot thread (once per process; reset after fork)."""
+    global _flusher_started
+    with _flusher_lock:
+        if _flusher_started:
+            return
+        _flusher_started = True
+        if get_metrics_dir():
+            os.makedirs(get_metrics_dir(), exist_ok=True)
+            threading.Thread(
+                target=_flush_forever, args=(getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0),),
+                name='metrics-flush', daemon=True,
+            ).start()
+            atexit.register(flush)
+
+
+def _after_fork():
+    # A forked worker starts empty, with its own snapshot thread
+    global _flusher_started
+    _flusher_started = False
+    registry.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def archive_process(directory, pid):
+    """Fold an exited worker's snapshot into ``archive.json`` (gunicorn's child_exit hook)."""
+    path = process_file(directory, pid)
+    if not os.path.exists(path):
+        return
+    with open(os.path.join(directory, 'archive.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive = os.path.join(directory, 'archive.json')
+        counters, histograms = merge([_read_json(archive), _read_json(path)])
+        _write_json(archive, {
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(labels), series] for (name, labels), series in histograms.items()],
+        })
+        os.remove(path)
+
+
+def clear_directory(directory):
+    """Remove the snapshots of a previous server run (gunicorn's on_starting hook)."""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+def collect():
+    """This process's live values plus the snapshots of every other worker."""
+    snapshots = [registry.snapshot()]
+    directory = get_metrics_dir()
+    if directory:
+        own = process_file(directory, os.getpid())
+        snapshots += [_read_json(path) for path in glob.glob(os.path.join(directory, '*.json')) if path != own]
+    return merge(snapshots)
+
+
+# Exposition
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(counters, histograms):
+    lines = []
+    for name, (kind, help_text, label_names, buckets) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        if kind == 'counter':
+            for (series_name, labels), value in sorted(counters.items()):
+                if series_name == name:
+                    lines.append(f'{name}{_labels(label_names, labels)} {_number(value)}')
+            continue
+        for (series_name, labels), series in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f'{name}_bucket{_labels(label_names, labels, le)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(label_names, labels)} {_number(series[-1])}')
+            lines.append(f'{name}_count{_labels(label_names, labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def scrape_allowed(address):
+    # Direct hits on the app server carry the client's address; through nginx, nginx's own
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    networks = getattr(settings, 'METRICS_ALLOWED_NETWORKS', ('127.0.0.0/8', '::1/128'))
+    return any(address in ipaddress.ip_network(network) for network in networks)
+
+
+def metrics_view(request):
+    if not scrape_allowed(request.META.get('REMOTE_ADDR', '')):
+        return HttpResponseForbidden("Metrics are only served to internal networks.")
+    return HttpResponse(render(*collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Instrumentation
+
+class RequestStats:
+    __slots__ = ('queries', 'query_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+
+
+# Stats of the request being handled; a context variable so that async views'
+# queries, run in sync_to_async threads with a copy of the context, are counted too
+_request_stats = ContextVar('movies_request_stats', default=None)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = perf_counter() - started
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_time += elapsed
+        registry.inc('db_queries_total', (context['connection'].alias,))
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """``connection_created`` receiver: wrap every query of the new connection."""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+def count_cache(name, hit):
+    registry.inc('cache_requests_total', (name, 'hit' if hit else 'miss'))
+
+
+@contextmanager
+def timed_serializer(name):
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe('serializer_duration_seconds', (name,), perf_counter() - started)
+
+
+def _before_s3_call(context, **kwargs):
+    context['metrics_started'] = perf_counter()
+
+
+def _after_s3_call(context, model, **kwargs):
+    started = context.pop('metrics_started', None)
+    if started is not None:
+        registry.observe('s3_request_duration_seconds', (model.name,), perf_counter() - started)
+
+
+def instrument_boto_client(client):
+    """Time every API call of a botocore S3 client (once per client)."""
+    if not getattr(client, '_movies_metrics', False):
+        # provide-client-params is the first event of every call, even when a response is stubbed
+        client.meta.events.register('provide-client-params.s3', _before_s3_call)
+        client.meta.events.register('after-call.s3', _after_s3_call)
+        client._movies_metrics = True
+    return client
+
+
+class MetricsMiddleware:
+    """Outermost middleware: records every request's latency and database work."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not _flusher_started:
+            start_flusher()
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self.record(request, response, perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        if not _flusher_started:
+            start_flusher()
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self.record(request, response, perf_counter() - started, stats)
+        return response
+
+    @staticmethod
+    def record(request, response, duration, stats):
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        registry.record_request(view, request.method, f'{response.status_code // 100}xx',
+                                duration, stats.queries, stats.query_time)
+
+
+# Nothing to query; for QueryBudgetMiddleware
+metrics_view.query_budget = 0
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.19 on 2026-10-18 18:02
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# Only PostgreSQL has tsvector/GIN/pg_trgm; other databases use the in-process
+# fallback in movies/search.py, so the indexes are not part of the model state.
+# The expression is frozen here; it matched movies.search.movie_search_vector() when written.
+SEARCH_INDEXES = [
+    GinIndex(
+        SearchVector('title', weight='A', config='english')
+        + SearchVector('director', weight='B', config='english')
+        + SearchVector('description', weight='C', config='english'),
+        name='movie_search_vector_idx',
+    ),
+    GinIndex(fields=['title'], opclasses=['gin_trgm_ops'], name='movie_title_trgm_idx'),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Movie = apps.get_model('movies', 'Movie')
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(Movie, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Movie = apps.get_model('movies', 'Movie')
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(Movie, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
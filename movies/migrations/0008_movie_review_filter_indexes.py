@@ -0,0 +1,56 @@
+# Generated by Django 4.2.19 on 2026-10-18 18:09
+
+from django.db import migrations, models
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+
+def backfill_rating_average(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    Movie.objects.using(schema_editor.connection.alias).filter(review_count__gt=0).update(
+        rating_average=Cast(F('rating_sum'), FloatField()) / F('review_count'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_movie_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='rating_average',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_average, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['category', 'release_date', 'id'], name='movie_category_release_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['director', 'release_date', 'id'], name='movie_director_release_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['rating_average', 'id'], name='movie_rating_average_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['title', 'id'], name='movie_title_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['movie', 'created_at', 'id'], name='review_movie_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='review_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['rating', 'created_at', 'id'], name='review_rating_created_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.19 on 2026-10-18 18:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_movie_review_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_review_id', models.BigIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(null=True)),
+                ('mean_rating', models.FloatField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MovieRanking',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='movies.movie')),
+                ('top_score', models.FloatField(default=0)),
+                ('trending_score', models.FloatField(null=True)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='movies.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-top_score', 'movie'], name='ranking_top_idx'), models.Index(fields=['category', '-top_score', 'movie'], name='ranking_category_top_idx'), models.Index(fields=['-trending_score', 'movie'], name='ranking_trending_idx'), models.Index(fields=['category', '-trending_score', 'movie'], name='ranking_category_trending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_movie_neighbors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='poster_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.19 on 2026-10-18 18:20
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+import django.db.models.deletion
+
+
+def backfill_category_stats(apps, schema_editor):
+    Category = apps.get_model('movies', 'Category')
+    CategoryStats = apps.get_model('movies', 'CategoryStats')
+    db_alias = schema_editor.connection.alias
+
+    rows = Category.objects.using(db_alias).order_by().values('pk').annotate(
+        movie_count=Count('movie'),
+        review_count=Sum('movie__review_count'),
+        rating_sum=Sum('movie__rating_sum'),
+        newest_release=Max('movie__release_date'),
+    )
+    CategoryStats.objects.using(db_alias).bulk_create([
+        CategoryStats(category_id=row['pk'], movie_count=row['movie_count'], review_count=row['review_count'] or 0,
+                      rating_sum=row['rating_sum'] or 0, newest_release=row['newest_release'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_movie_poster_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='movies.category')),
+                ('movie_count', models.PositiveIntegerField(default=0)),
+                ('review_count', models.PositiveBigIntegerField(default=0)),
+                ('rating_sum', models.PositiveBigIntegerField(default=0)),
+                ('newest_release', models.DateField(null=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_category_stats, migrations.RunPython.noop),
+    ]
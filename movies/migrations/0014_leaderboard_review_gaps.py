@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0013_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leaderboardstate',
+            name='review_gaps',
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from enum import Enum
 
 
@@ -10,6 +11,81 @@ class Category(models.Model):
         return self.name
 
 
+# Denormalized rating aggregates, maintained by movies.ratings
+RATING_STAT_FIELDS = (
+    'review_count', 'rating_sum', 'rating_average',
+    'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+)
+# Movie columns written only by background jobs, never by Movie.save() on a loaded instance
+DERIVED_FIELDS = RATING_STAT_FIELDS + ('poster_renditions',)
+
+
+# Movie fields the category summary rows (movies/category_stats.py) are computed from
+CATEGORY_SOURCE_FIELDS = {'category', 'category_id', 'release_date'}
+
+
+class MovieQuerySet(models.QuerySet):
+    # bulk_create(), bulk_update() and update() bypass the model signals, so
+    # invalidate the cached responses (movies/cache.py) of the movies they write
+    # and recompute the categories they add movies to or move movies between.
+    # Callers that invalidate themselves opt out with invalidate_cache=False,
+    # those that rebuild the category totals afterwards with refresh_categories=False.
+
+    def bulk_create(self, objs, *args, invalidate_cache=True, refresh_categories=True, **kwargs):
+        from . import cache
+        from .category_stats import refresh_category_stats
+
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if refresh_categories and objs:
+            refresh_category_stats({obj.category_id for obj in objs}, using=self.db)
+        if invalidate_cache and objs:
+            # New movies only appear in lists; a missing movie is never cached
+            cache.invalidate(cache.MOVIES, using=self.db)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, invalidate_cache=True, **kwargs):
+        from . import cache
+        from .category_stats import refresh_category_stats
+
+        pks = [obj.pk for obj in objs]
+        categories = None
+        if CATEGORY_SOURCE_FIELDS.intersection(fields):
+            # The categories the movies leave, then the ones they join
+            categories = set(self.filter(pk__in=pks).values_list('category_id', flat=True))
+            categories.update(obj.category_id for obj in objs)
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if categories:
+            refresh_category_stats(categories, using=self.db)
+        if invalidate_cache:
+            cache.invalidate_movies(pks, using=self.db)
+        return rows
+
+    def update(self, invalidate_cache=True, **kwargs):
+        from . import cache
+        from .category_stats import refresh_category_stats
+
+        moved = CATEGORY_SOURCE_FIELDS.intersection(kwargs)
+        if not invalidate_cache and not moved:
+            return super().update(**kwargs)
+        before = list(self.values_list('pk', 'category_id'))
+        pks = [pk for pk, _ in before]
+        rows = super().update(**kwargs)
+        if moved:
+            categories = {category_id for _, category_id in before}
+            if moved & {'category', 'category_id'}:
+                # The filter may no longer match once category changed: follow the rows by pk
+                categories.update(self.model._base_manager.using(self.db).filter(pk__in=pks)
+                                  .values_list('category_id', flat=True))
+            refresh_category_stats(categories, using=self.db)
+        if invalidate_cache:
+            cache.invalidate_movies(pks, using=self.db)
+        return rows
+
+    bulk_create.alters_data = True
+    bulk_update.alters_data = True
+    update.alters_data = True
+
+
 class Movie(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
@@ -17,17 +93,76 @@ class Movie(models.Model):
     director = models.CharField(max_length=100)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
     poster = models.ImageField(upload_to='new_movie_posters/', null=True, blank=True)
+    # Resized copies of the poster, written by movies.posters (see poster_variants)
+    poster_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # Bumped on any change to the rendered payload (incl. ratings), used for ETags
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Rating aggregates (kept in sync with Review rows, see movies/ratings.py)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    # rating_sum / review_count, stored so rating filters and sorts can use an index
+    rating_average = models.FloatField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = MovieQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order of the movie list API
+            models.Index(fields=['release_date', 'id'], name='movie_release_date_id_idx'),
+            # Filters/sorts of the movie list API, each followed by the keyset order
+            models.Index(fields=['category', 'release_date', 'id'], name='movie_category_release_idx'),
+            models.Index(fields=['director', 'release_date', 'id'], name='movie_director_release_idx'),
+            models.Index(fields=['rating_average', 'id'], name='movie_rating_average_idx'),
+            models.Index(fields=['title', 'id'], name='movie_title_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # The aggregates are updated in place with F() expressions and the renditions
+        # by a background job; never write back the (possibly stale) values loaded
+        # into this instance.
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored category/release date; changing them refreshes the category stats
+        loaded = dict(zip(field_names, values))
+        if 'category_id' in loaded and 'release_date' in loaded:
+            instance._category_snapshot = (loaded['category_id'], loaded['release_date'])
+        return instance
+
     @property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews:
-            return sum([review.rating for review in reviews]) / len(reviews)
+        if self.review_count:
+            return self.rating_sum / self.review_count
         return 0  # If no reviews exist, return 0
 
+    @property
+    def rating_histogram(self):
+        return {rating.value: getattr(self, f'rating_{rating.value}_count') for rating in Rating}
+
+    @property
+    def poster_variants(self):
+        """The renditions of the current poster ({} while they are being generated)."""
+        renditions = self.poster_renditions or {}
+        if not self.poster or renditions.get('source') != self.poster.name:
+            return {}
+        return renditions
+
 
 class Rating(Enum):
     ONE = 1
@@ -37,20 +172,189 @@ class Rating(Enum):
     FIVE = 5
 
 
+class ReviewQuerySet(models.QuerySet):
+    # bulk_create() and update() bypass the model signals, so refresh the
+    # aggregates of the affected movies from the review table instead;
+    # delete() does the same rather than adjusting them once per row.
+
+    def bulk_create(self, objs, *args, refresh_ratings=True, **kwargs):
+        from .ratings import refresh_rating_stats
+
+        objs = super().bulk_create(objs, *args, **kwargs)
+        # Callers that track rating deltas themselves (e.g. import_movies) opt out
+        if refresh_ratings:
+            refresh_rating_stats({obj.movie_id for obj in objs}, using=self.db)
+        return objs
+
+    def update(self, **kwargs):
+        from .ratings import refresh_rating_stats
+
+        kwargs.setdefault('updated_at', timezone.now())  # auto_now is not applied by update()
+        if 'rating' not in kwargs and 'movie' not in kwargs and 'movie_id' not in kwargs:
+            return super().update(**kwargs)
+        # The filter may no longer match once movie_id changed: follow the rows by pk
+        pks, movie_ids = set(), set()
+        for pk, movie_id in self.values_list('pk', 'movie_id'):
+            pks.add(pk)
+            movie_ids.add(movie_id)
+        rows = super().update(**kwargs)
+        if 'movie' in kwargs or 'movie_id' in kwargs:
+            movie_ids.update(self.model._base_manager.using(self.db).filter(pk__in=pks)
+                             .values_list('movie_id', flat=True))
+        refresh_rating_stats(movie_ids, using=self.db)
+        return rows
+
+    def delete(self):
+        from .ratings import refresh_rating_stats
+
+        # Read the movies from the database the rows are deleted from; the
+        # post_delete signal skips its per-row deltas for queryset deletes
+        self._for_write = True
+        movie_ids = set(self.order_by().values_list('movie_id', flat=True).distinct())
+        result = super().delete()
+        refresh_rating_stats(movie_ids, using=self.db)
+        return result
+
+    bulk_create.alters_data = True
+    update.alters_data = True
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class Review(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='reviews')
     rating = models.IntegerField(choices=[(rating.value, rating.name) for rating in Rating])  # Using Enum
     review_text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, default=1)
 
+    objects = ReviewQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order of the review list API
+            models.Index(fields=['created_at', 'id'], name='review_created_at_id_idx'),
+            # Filters/sorts of the review list API, each followed by the keyset order
+            models.Index(fields=['movie', 'created_at', 'id'], name='review_movie_created_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='review_user_created_idx'),
+            models.Index(fields=['rating', 'created_at', 'id'], name='review_rating_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.movie.title} ({self.rating}⭐)"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored movie/rating so an edit can adjust the aggregates by delta
+        loaded = dict(zip(field_names, values))
+        if 'movie_id' in loaded and 'rating' in loaded:
+            instance._rating_snapshot = (loaded['movie_id'], loaded['rating'])
+        return instance
+
 
 class Watchlist(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     movies = models.ManyToManyField(Movie, related_name='watchlists')
+    # Also bumped when movies are added or removed (see movies/signals.py)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.username}'s Watchlist"
+
+
+# Per-category totals, maintained by movies.category_stats
+CATEGORY_STAT_FIELDS = ('movie_count', 'review_count', 'rating_sum', 'newest_release')
+
+
+class CategoryStats(models.Model):
+    """Summary row of a category for the category list and the admin, maintained by movies.category_stats."""
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    movie_count = models.PositiveIntegerField(default=0)
+    review_count = models.PositiveBigIntegerField(default=0)
+    rating_sum = models.PositiveBigIntegerField(default=0)
+    newest_release = models.DateField(null=True)
+
+    @property
+    def mean_rating(self):
+        # Over all reviews of the category's movies, like Movie.average_rating
+        if self.review_count:
+            return self.rating_sum / self.review_count
+        return 0
+
+    def __str__(self):
+        return f"Stats of category {self.category_id}"
+
+
+class MovieRanking(models.Model):
+    """Precomputed leaderboard scores, refreshed by the refresh_leaderboards command."""
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='ranking')
+    # Copy of movie.category so per-category boards are one index range
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='+')
+    # Bayesian average rating
+    top_score = models.FloatField(default=0)
+    # log(sum of exp(decay_rate * review age from a fixed epoch)); None without reviews
+    trending_score = models.FloatField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-top_score', 'movie'], name='ranking_top_idx'),
+            models.Index(fields=['category', '-top_score', 'movie'], name='ranking_category_top_idx'),
+            models.Index(fields=['-trending_score', 'movie'], name='ranking_trending_idx'),
+            models.Index(fields=['category', '-trending_score', 'movie'], name='ranking_category_trending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ranking of {self.movie_id}"
+
+
+class LeaderboardState(models.Model):
+    """Single row recording how far the incremental leaderboard refresh has got."""
+    last_review_id = models.BigIntegerField(default=0)
+    # [first id, last id, seen at] ranges below last_review_id that had no committed review yet
+    review_gaps = models.JSONField(default=list)
+    refreshed_at = models.DateTimeField(null=True)
+    # Global mean rating used as the Bayesian prior of the stored top scores
+    mean_rating = models.FloatField(null=True)
+
+    def __str__(self):
+        return f"Leaderboards refreshed at {self.refreshed_at}"
+
+
+class MovieNeighbor(models.Model):
+    """Top-K most similar movies of each movie, built by the build_recommendations command."""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    # Cosine similarity of the two movies' user vectors
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'neighbor'], name='unique_movie_neighbor'),
+        ]
+        indexes = [
+            models.Index(fields=['movie', '-score'], name='neighbor_movie_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.movie_id} ~ {self.neighbor_id} ({self.score:.3f})"
+
+
+class RecommendationState(models.Model):
+    """Single row recording when the neighbour table was last built."""
+    built_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"Recommendations built at {self.built_at}"
+
+
+class ImportCheckpoint(models.Model):
+    """Progress of a resumable ``import_movies`` run, written in the same transaction as each batch."""
+    name = models.CharField(max_length=255, primary_key=True)
+    # stage -> {'source': path, 'rows': committed rows, ...}
+    state = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Import checkpoint {self.name}"
@@ -0,0 +1,203 @@
+import json
+from base64 import b64decode, b64encode
+from datetime import date, datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import BigIntegerField, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+MAX_BIGINT = BigIntegerField.MAX_BIGINT
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination over a composite, unique ordering such as
+    ``('release_date', 'id')``.
+
+    The cursor holds the ordering values of the last row of the page, so every
+    page is a single indexed range query no matter how deep the client goes,
+    and rows inserted or deleted meanwhile never shift or duplicate results.
+    Views declare the ordering with an ``ordering`` attribute (fields may be
+    prefixed with ``-`` for descending order); the last field must be unique
+    (normally ``id``).
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE or 50
+    max_page_size = 500
+    ordering = ('id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async counterpart of ``paginate_queryset`` for async views."""
+        queryset = self.page_queryset(queryset, request, view)
+        return self.set_page([obj async for obj in queryset])
+
+    def page_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = tuple(getattr(view, 'ordering', None) or self.ordering)
+        self.page_size = self.get_page_size(request)
+
+        position, self.reverse = self.decode_cursor(request)
+        self.cursor_given = position is not None
+        if position is not None:
+            position = self.parse_position(queryset, position)
+
+        queryset = queryset.order_by(*self.get_order_by(self.reverse))
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(position, self.reverse))
+        # Fetch one extra row to know whether there is another page
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+
+        if self.reverse:
+            self.has_next = self.cursor_given
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor_given
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    @staticmethod
+    def split_field(field):
+        """``'-rating'`` -> ``('rating', True)``"""
+        return (field[1:], True) if field.startswith('-') else (field, False)
+
+    def get_order_by(self, reverse):
+        order_by = []
+        for field in self.ordering:
+            name, descending = self.split_field(field)
+            order_by.append(f'-{name}' if descending != reverse else name)
+        return order_by
+
+    def get_seek_filter(self, position, reverse):
+        # (a, b, c) > (x, y, z)  ==  a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        # with "<" instead of ">" for descending fields (and everything flipped when paging back)
+        names = [self.split_field(field)[0] for field in self.ordering]
+        seek = Q()
+        for index, field in enumerate(self.ordering):
+            name, descending = self.split_field(field)
+            lookup = 'lt' if descending != reverse else 'gt'
+            clause = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(names[:index], position[:index]):
+                clause &= Q(**{previous: value})
+            seek |= clause
+        return seek
+
+    def get_ordering_field(self, queryset, name):
+        """Model field (or annotation output field) behind an ordering name such as ``category__name``."""
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        model, field = queryset.model, None
+        for part in name.split('__'):
+            field = model._meta.get_field(part)
+            model = field.related_model
+        return field.target_field if field.is_relation else field
+
+    def parse_position(self, queryset, position):
+        """The cursor values as the ordering fields' Python types; a crafted cursor is a 404, not a 500."""
+        parsed = []
+        for field_name, raw in zip(self.ordering, position):
+            try:
+                field = self.get_ordering_field(queryset, self.split_field(field_name)[0])
+                value = field.to_python(raw)
+                if value is None:
+                    raise ValueError('null cursor value')
+                # Range checks: the column size (not enforced by every backend) and 64 bits
+                field.run_validators(value)
+                if isinstance(value, int) and not -MAX_BIGINT - 1 <= value <= MAX_BIGINT:
+                    raise ValueError('integer out of range')
+            except (FieldDoesNotExist, ValidationError, ValueError, TypeError, OverflowError):
+                raise NotFound(self.invalid_cursor_message)
+            parsed.append(value)
+        return parsed
+
+    def get_position(self, obj):
+        position = []
+        for field in self.ordering:
+            value = obj
+            for part in self.split_field(field)[0].split('__'):
+                value = getattr(value, part)
+            if isinstance(value, (date, datetime)):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse), 'o': ','.join(self.ordering)}, separators=(',', ':'))
+        return b64encode(payload.encode('utf-8'), altchars=b'-_').decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_', validate=True))
+            position = payload['p']
+            reverse = bool(payload.get('r'))
+            ordering = payload.get('o')
+        except (TypeError, ValueError, KeyError, AttributeError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        # A cursor issued under another ?sort= does not describe a position in this order
+        if (not isinstance(position, list) or len(position) != len(self.ordering)
+                or ordering != ','.join(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        cursor = self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        cursor = self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
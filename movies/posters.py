@@ -0,0 +1,183 @@
+"""
+Poster rendition pipeline.
+
+When a movie's poster changes, WebP and JPEG copies at ``POSTER_WIDTHS`` and a
+tiny blurred placeholder (inlined as a data URI) are generated with Pillow and
+uploaded next to the original. Their URLs are stored in
+``Movie.poster_renditions`` so pages can serve a ``srcset`` instead of the
+full-size upload.
+
+Generation runs after the transaction commits, in a thread pool outside the
+request cycle (Pillow releases the GIL while decoding, resizing and encoding).
+Set ``POSTER_RENDITIONS_ASYNC = False`` to run it inline, e.g. in tests.
+``generate_poster_renditions`` backfills posters uploaded before this existed.
+"""
+import base64
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models.functions import Now
+from PIL import Image, ImageFilter, ImageOps
+
+from . import cache
+from .models import Movie
+
+logger = logging.getLogger(__name__)
+
+POSTER_WIDTHS = (160, 320, 640)
+# format key -> (Pillow format, file extension, save options)
+POSTER_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+PLACEHOLDER_WIDTH = 16
+RENDITIONS_DIR = 'poster_renditions'
+
+
+def rendition_name(movie_id, source, width, extension):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f'{RENDITIONS_DIR}/{movie_id}/{stem}-{width}w.{extension}'
+
+
+def _to_rgb(image):
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # JPEG has no alpha channel: flatten onto white
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _resize(image, width):
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def _encode(image, pillow_format, options):
+    buffer = BytesIO()
+    image.save(buffer, format=pillow_format, **options)
+    return buffer.getvalue()
+
+
+def render_renditions(source_file):
+    """
+    Returns ``(size, files, placeholder)``: the source ``(width, height)``,
+    ``{(format key, width): bytes}`` and a blurred data URI. Posters are never upscaled.
+    """
+    with Image.open(source_file) as original:
+        image = _to_rgb(original)
+    widths = sorted({min(width, image.width) for width in POSTER_WIDTHS})
+
+    files = {}
+    for width in widths:
+        resized = image if width == image.width else _resize(image, width)
+        for key, (pillow_format, _, options) in POSTER_FORMATS.items():
+            files[key, width] = _encode(resized, pillow_format, options)
+
+    tiny = _resize(image, min(PLACEHOLDER_WIDTH, image.width)).filter(ImageFilter.GaussianBlur(1))
+    placeholder = 'data:image/jpeg;base64,' + base64.b64encode(
+        _encode(tiny, 'JPEG', {'quality': 50})).decode('ascii')
+    return image.size, files, placeholder
+
+
+def generate_renditions(movie_id, using=None):
+    """Generate and store the renditions of a movie's current poster; returns True if written."""
+    movie = Movie.objects.using(using).filter(pk=movie_id).only('id', 'poster', 'poster_renditions').first()
+    if movie is None:
+        return False
+    if not movie.poster:
+        if movie.poster_renditions:
+            Movie.objects.using(using).filter(pk=movie_id).update(
+                poster_renditions={}, updated_at=Now(), invalidate_cache=False)
+            cache.invalidate_movies([movie_id], using=using)
+        return False
+
+    source = movie.poster.name
+    storage = movie.poster.storage
+    with storage.open(source, 'rb') as source_file:
+        (width, height), files, placeholder = render_renditions(source_file)
+
+    renditions = {'source': source, 'width': width, 'height': height, 'placeholder': placeholder}
+    for (key, rendition_width), content in files.items():
+        extension = POSTER_FORMATS[key][1]
+        name = storage.save(rendition_name(movie_id, source, rendition_width, extension), ContentFile(content))
+        renditions.setdefault(key, {})[str(rendition_width)] = storage.url(name)
+
+    # Only if the poster was not replaced meanwhile (its own job will run)
+    with transaction.atomic(using=using):
+        written = Movie.objects.using(using).filter(pk=movie_id, poster=source).update(
+            poster_renditions=renditions, updated_at=Now(), invalidate_cache=False)
+        cache.invalidate_movies([movie_id], using=using)
+    return bool(written)
+
+
+def srcset(renditions, key):
+    """``"url 160w, url 320w"`` for one format of ``Movie.poster_variants``."""
+    urls = renditions.get(key) or {}
+    return ', '.join(f'{url} {width}w' for width, url in sorted(urls.items(), key=lambda item: int(item[0])))
+
+
+def thumbnail_url(renditions, key='jpeg'):
+    """URL of the smallest rendition in one format of ``Movie.poster_variants``, or None."""
+    urls = renditions.get(key) or {}
+    return urls[min(urls, key=int)] if urls else None
+
+
+def picture_context(movie, display_width):
+    """Template values for a responsive ``<picture>`` of the poster, or None without renditions."""
+    renditions = movie.poster_variants
+    if not renditions:
+        return None
+    jpeg = sorted(renditions['jpeg'].items(), key=lambda item: int(item[0]))
+    # Fallback src: the smallest JPEG covering a 2x display
+    fallback = next((url for width, url in jpeg if int(width) >= display_width * 2), jpeg[-1][1])
+    return {
+        'webp_srcset': srcset(renditions, 'webp'),
+        'jpeg_srcset': srcset(renditions, 'jpeg'),
+        'src': fallback,
+        'placeholder': renditions['placeholder'],
+        'width': display_width,
+        'height': round(renditions['height'] * display_width / renditions['width']),
+    }
+
+
+# Background execution
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'POSTER_WORKERS', 2), thread_name_prefix='poster',
+            )
+        return _executor
+
+
+def _run_job(movie_id, using):
+    try:
+        generate_renditions(movie_id, using=using)
+    except Exception:
+        logger.exception("Generating poster renditions of movie %s failed", movie_id)
+    finally:
+        # Worker threads have their own connections; do not leak them
+        close_old_connections()
+
+
+def schedule_renditions(movie_id, using=None):
+    """Generate the renditions once the current transaction commits."""
+    if getattr(settings, 'POSTER_RENDITIONS_ASYNC', True):
+        transaction.on_commit(lambda: get_executor().submit(_run_job, movie_id, using), using=using)
+    else:
+        transaction.on_commit(lambda: generate_renditions(movie_id, using=using), using=using)
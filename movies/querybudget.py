@@ -0,0 +1,212 @@
+"""
+Query budgets: catch N+1 queries and repeated SQL before they ship.
+
+* ``query_budget(max_queries)`` is a context manager and decorator that
+  records every query run inside it, on every database connection.
+* ``QueryBudgetMiddleware`` does the same for each request and checks the
+  view's declared budget: a ``query_budget`` attribute on the view class (or
+  function). Views without one (the admin, third-party apps) are not checked.
+  It runs in sync and async mode, so the async views keep an async chain.
+
+Queries are recorded by an execute wrapper installed on every connection
+(``connection_created``) that appends to the recorders of the current
+context. Async views run their queries in ``sync_to_async`` threads, on those
+threads' connections, with a copy of the context: they are recorded too.
+
+A block violates its budget when it runs more queries than allowed, runs the
+exact same SQL with the same parameters twice, or runs the same SQL with
+different parameters more than ``QUERY_BUDGET_REPEAT_LIMIT`` times (the N+1
+pattern). Transaction control statements (BEGIN, SAVEPOINT, ...) count
+towards the budget but are never duplicates. Violations raise ``QueryBudgetExceeded`` when
+``QUERY_BUDGET_RAISE`` is set (development and tests) and are logged
+otherwise.
+"""
+import logging
+from collections import Counter
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# First keyword of statements that only manage transactions
+TRANSACTION_CONTROL = {'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'START', 'END'}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A block ran more queries than its budget, or duplicate SQL."""
+
+
+def get_repeat_limit():
+    return getattr(settings, 'QUERY_BUDGET_REPEAT_LIMIT', 3)
+
+
+# The active recorders (nested blocks each record)
+_recorders = ContextVar('query_budget_recorders', default=())
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    for recorder in _recorders.get():
+        recorder.queries.append((context['connection'].alias, sql, params))
+    return execute(sql, params, many, context)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """``connection_created`` receiver: record the queries of the new connection."""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+class QueryRecorder:
+    """Records ``(alias, sql, params)`` of the queries run on any connection while active."""
+
+    def __init__(self):
+        self.queries = []
+        self._token = None
+
+    def __enter__(self):
+        # Connections of this thread opened before the receiver was connected
+        for connection in connections.all():
+            instrument_connection(None, connection)
+        self._token = _recorders.set((*_recorders.get(), self))
+        return self
+
+    def __exit__(self, *exc_info):
+        _recorders.reset(self._token)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def statements(self):
+        """The recorded queries without transaction control (``BEGIN``, ``SAVEPOINT "s1"``, ...)."""
+        return [(alias, sql, params) for alias, sql, params in self.queries
+                if sql.lstrip().split(None, 1)[0].upper() not in TRANSACTION_CONTROL]
+
+    def duplicates(self):
+        """``{sql: times}`` of queries run more than once with the same parameters."""
+        counts = Counter((alias, sql, _hashable(params)) for alias, sql, params in self.statements())
+        return {sql: times for (_, sql, _), times in counts.items() if times > 1}
+
+    def repeated(self, limit):
+        """``{sql: times}`` of statements run more than ``limit`` times, whatever their parameters."""
+        counts = Counter((alias, sql) for alias, sql, _ in self.statements())
+        return {sql: times for (_, sql), times in counts.items() if times > limit}
+
+
+def _hashable(params):
+    if isinstance(params, (list, tuple)):
+        return tuple(_hashable(param) for param in params)
+    if isinstance(params, dict):
+        return tuple(sorted((key, _hashable(value)) for key, value in params.items()))
+    try:
+        hash(params)
+    except TypeError:
+        return repr(params)
+    return params
+
+
+def find_problems(recorder, max_queries=None, allow_duplicates=False):
+    problems = []
+    if max_queries is not None and len(recorder) > max_queries:
+        problems.append(f"{len(recorder)} queries, budget is {max_queries}")
+    if not allow_duplicates:
+        for sql, times in recorder.duplicates().items():
+            problems.append(f"duplicate query ({times}x): {sql}")
+        for sql, times in recorder.repeated(get_repeat_limit()).items():
+            problems.append(f"same query with different parameters {times}x (N+1?): {sql}")
+    return problems
+
+
+def report(label, problems):
+    if not problems:
+        return
+    message = f"Query budget of {label} exceeded:\n  " + '\n  '.join(problems)
+    if getattr(settings, 'QUERY_BUDGET_RAISE', settings.DEBUG):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class query_budget(ContextDecorator):
+    """
+    ``with query_budget(3):`` or ``@query_budget(3)``: at most ``max_queries``
+    queries (None: no limit) and, unless ``allow_duplicates``, no duplicates.
+    """
+
+    def __init__(self, max_queries=None, allow_duplicates=False, label='block'):
+        self.max_queries = max_queries
+        self.allow_duplicates = allow_duplicates
+        self.label = label
+        self.recorder = None
+
+    def __enter__(self):
+        self.recorder = QueryRecorder().__enter__()
+        return self.recorder
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.recorder.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            report(self.label, find_problems(self.recorder, self.max_queries, self.allow_duplicates))
+        return False
+
+
+def view_budget(func, method):
+    """
+    The ``query_budget`` declared by a resolved view (class or function
+    attribute): a number, or ``{method: number}`` when methods differ.
+    """
+    view_class = getattr(func, 'view_class', None) or getattr(func, 'cls', None)
+    budget = getattr(view_class, 'query_budget', None) if view_class is not None else None
+    if budget is None:
+        budget = getattr(func, 'query_budget', None)
+    if isinstance(budget, dict):
+        budget = budget.get(method)
+    return budget
+
+
+class QueryBudgetMiddleware:
+    """
+    Checks each request against its view's budget; sits last in MIDDLEWARE so
+    only the view's own work (including lazy session/user loading) counts.
+    With ``QUERY_BUDGET_HEADER`` the count is sent as ``X-Query-Count``.
+    Disabled with ``QUERY_BUDGET_ENABLED = False``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', True):
+            return self.get_response(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        return self.check(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', True):
+            return await self.get_response(request)
+        with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        return self.check(request, response, recorder)
+
+    @staticmethod
+    def check(request, response, recorder):
+        match = request.resolver_match
+        if match is not None:
+            budget = view_budget(match.func, request.method)
+            logger.debug("%s %s ran %d queries (budget %s)", request.method, match.view_name, len(recorder), budget)
+            # Only our own views declare budgets; the admin and third-party views are left alone
+            if budget is not None:
+                report(f"{request.method} {match.view_name}", find_problems(recorder, budget))
+        if getattr(settings, 'QUERY_BUDGET_HEADER', settings.DEBUG):
+            response['X-Query-Count'] = str(len(recorder))
+        return response
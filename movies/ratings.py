@@ -0,0 +1,118 @@
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Now, NullIf
+from django.utils import timezone
+
+from . import cache
+from .category_stats import apply_category_deltas, rebuild_category_stats, refresh_movie_categories
+from .models import Movie, Rating, Review, RATING_STAT_FIELDS
+
+
+def _star_field(rating):
+    return f'rating_{rating}_count'
+
+
+def apply_rating_deltas(deltas, using=None):
+    """
+    In-place adjustment of the aggregates, one UPDATE per movie.
+    ``deltas`` maps movie_id -> {rating: number of reviews added (or removed if negative)}.
+    """
+    for movie_id, counts in deltas.items():
+        review_count = F('review_count') + sum(counts.values())
+        rating_sum = F('rating_sum') + sum(rating * count for rating, count in counts.items())
+        updates = {
+            'review_count': review_count,
+            'rating_sum': rating_sum,
+            # SET expressions see the old row, so derive the average from the new totals
+            'rating_average': Coalesce(
+                Cast(rating_sum, FloatField()) / NullIf(review_count, 0), Value(0.0),
+                output_field=FloatField(),
+            ),
+            'updated_at': Now(),
+        }
+        for rating, count in counts.items():
+            updates[_star_field(rating)] = F(_star_field(rating)) + count
+        Movie.objects.using(using).filter(pk=movie_id).update(invalidate_cache=False, **updates)
+    apply_category_deltas(deltas, using=using)
+    cache.invalidate_movies(list(deltas), using=using)
+
+
+def apply_rating_delta(movie_id, rating, sign, using=None):
+    # O(1) in-place adjustment of one movie's aggregates (sign is +1 or -1)
+    apply_rating_deltas({movie_id: {rating: sign}}, using=using)
+
+
+def compute_rating_stats(movie_ids, using=None):
+    """Return {movie_id: {field: value}} computed from the review table."""
+    annotations = {
+        'review_count': Count('id'),
+        'rating_sum': Sum('rating'),
+    }
+    for rating in Rating:
+        annotations[_star_field(rating.value)] = Count('id', filter=Q(rating=rating.value))
+
+    stats = {movie_id: dict.fromkeys(RATING_STAT_FIELDS, 0) for movie_id in movie_ids}
+    rows = (
+        Review.objects.using(using)
+        .filter(movie_id__in=movie_ids)
+        .order_by()
+        .values('movie_id')
+        .annotate(**annotations)
+    )
+    for row in rows:
+        movie_id = row.pop('movie_id')
+        stats[movie_id] = {field: row[field] or 0 for field in annotations}
+    for values in stats.values():
+        values['rating_average'] = values['rating_sum'] / values['review_count'] if values['review_count'] else 0
+    return stats
+
+
+def refresh_rating_stats(movie_ids, using=None, categories=True):
+    # Recompute from scratch for a (small) set of movies, e.g. after bulk writes
+    movie_ids = [movie_id for movie_id in movie_ids if movie_id is not None]
+    if not movie_ids:
+        return
+    stats = compute_rating_stats(movie_ids, using=using)
+    now = timezone.now()
+    movies = [Movie(pk=movie_id, updated_at=now, **values) for movie_id, values in stats.items()]
+    Movie.objects.using(using).bulk_update(movies, RATING_STAT_FIELDS + ('updated_at',), invalidate_cache=False)
+    if categories:
+        refresh_movie_categories(list(stats), using=using)
+    cache.invalidate_movies(list(stats), using=using)
+
+
+def _movie_id_chunks(chunk_size, using=None):
+    ids = Movie.objects.using(using).order_by('pk').values_list('pk', flat=True)
+    chunk = []
+    for movie_id in ids.iterator(chunk_size=chunk_size):
+        chunk.append(movie_id)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def rebuild_rating_stats(chunk_size=1000, using=None):
+    """Recompute the aggregates of every movie; returns the number of movies processed."""
+    total = 0
+    for chunk in _movie_id_chunks(chunk_size, using=using):
+        with transaction.atomic(using=using):
+            refresh_rating_stats(chunk, using=using, categories=False)
+        total += len(chunk)
+    # The category totals are sums of the movie aggregates: once at the end
+    rebuild_category_stats(using=using)
+    return total
+
+
+def verify_rating_stats(chunk_size=1000, using=None):
+    """Return the ids of movies whose stored aggregates disagree with their reviews."""
+    mismatched = []
+    for chunk in _movie_id_chunks(chunk_size, using=using):
+        expected = compute_rating_stats(chunk, using=using)
+        stored = Movie.objects.using(using).filter(pk__in=chunk).values('pk', *RATING_STAT_FIELDS)
+        for row in stored:
+            movie_id = row.pop('pk')
+            if row != expected[movie_id]:
+                mismatched.append(movie_id)
+    return mismatched
@@ -0,0 +1,120 @@
+"""
+Recently viewed movies, kept in the cache instead of the session.
+
+Writing the session on every page view cost an UPDATE of ``django_session``
+per request. Views are now collected in a per-process buffer, deduplicated
+per user, and written to the cache (``RECENTLY_VIEWED_CACHE_ALIAS``) in one
+``set_many`` by a timer ``RECENTLY_VIEWED_FLUSH_INTERVAL`` seconds after the
+first pending view, as soon as ``RECENTLY_VIEWED_BATCH_SIZE`` users are
+pending, and when the process exits. Browsing does no database writes.
+
+Each user keeps their last ``RECENTLY_VIEWED_LIMIT`` movies, most recent
+first. A process reads its own pending views; other workers see them after
+the flush, provided the cache is shared between them (Redis, see REDIS_URL):
+``check_shared_cache`` (called by movieR/gunicorn.conf.py) refuses to start
+several workers on a local-memory cache. The list is a convenience and is
+lost if evicted from the cache.
+"""
+import atexit
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import cache as response_cache
+
+_lock = threading.Lock()
+# user id -> movie ids not flushed yet, most recent first
+_pending = {}
+# Flushes the buffer once the interval has passed; set while views are pending
+_timer = None
+
+
+def get_alias():
+    return getattr(settings, 'RECENTLY_VIEWED_CACHE_ALIAS', 'default')
+
+
+def get_cache():
+    return caches[get_alias()]
+
+
+def check_shared_cache(workers):
+    response_cache.check_shared_cache(workers, alias=get_alias())
+
+
+def get_limit():
+    return getattr(settings, 'RECENTLY_VIEWED_LIMIT', 20)
+
+
+def _key(user_id):
+    return f'recently_viewed:{user_id}'
+
+
+def _merge(newer, older, limit):
+    """``newer`` then ``older``, without duplicates, at most ``limit`` ids."""
+    merged = []
+    for movie_id in (*newer, *older):
+        if movie_id not in merged:
+            merged.append(movie_id)
+            if len(merged) == limit:
+                break
+    return merged
+
+
+def record_view(user, movie_id):
+    """Note that ``user`` viewed the movie; flushes the buffer when a batch is full."""
+    global _timer
+    if not user.is_authenticated:
+        return
+    with _lock:
+        _pending[user.pk] = _merge([movie_id], _pending.get(user.pk, ()), get_limit())
+        due = len(_pending) >= getattr(settings, 'RECENTLY_VIEWED_BATCH_SIZE', 100)
+        if not due and _timer is None:
+            _timer = threading.Timer(getattr(settings, 'RECENTLY_VIEWED_FLUSH_INTERVAL', 2.0), flush)
+            _timer.daemon = True
+            _timer.start()
+    if due:
+        flush()
+
+
+def flush():
+    """Write the pending views of every user to the cache."""
+    global _timer
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not pending:
+        return
+    cache = get_cache()
+    keys = {user_id: _key(user_id) for user_id in pending}
+    stored = cache.get_many(keys.values())
+    limit = get_limit()
+    cache.set_many(
+        {key: _merge(pending[user_id], stored.get(key, ()), limit) for user_id, key in keys.items()},
+        timeout=getattr(settings, 'RECENTLY_VIEWED_TIMEOUT', 30 * 24 * 3600),
+    )
+
+
+def recent_movie_ids(user):
+    """The user's recently viewed movie ids, most recent first."""
+    if not user.is_authenticated:
+        return []
+    stored = get_cache().get(_key(user.pk), ())
+    with _lock:
+        pending = _pending.get(user.pk, ())
+    return _merge(pending, stored, get_limit())
+
+
+def _after_fork():
+    # Views buffered before the fork belong to the parent, and its timer thread is not copied
+    global _timer
+    _pending.clear()
+    _timer = None
+
+
+atexit.register(flush)
+os.register_at_fork(after_in_child=_after_fork)
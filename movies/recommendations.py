@@ -0,0 +1,198 @@
+"""
+Item-based ("users who liked this also liked") recommendations.
+
+An offline job (``build_recommendations``) loads positive signals - reviews
+rated 3 or more and watchlist memberships - into a sparse user x movie
+matrix, computes the top-K cosine neighbours of each movie block by block,
+and stores them in ``MovieNeighbor``. Online requests only read neighbour
+rows through the ``(movie, -score)`` index and merge them in memory.
+
+The matrix is kept as dicts of non-zero entries (row- and column-wise), so
+similarities are accumulated only over co-rating users: the cost follows the
+number of interactions rather than catalog size squared, and memory is the
+matrix plus one block of results.
+"""
+import heapq
+import math
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Movie, MovieNeighbor, RecommendationState, Review, Watchlist
+from .watermarks import changed_since, database_now
+
+# Weight of each review rating as a "liked" signal; 1-2 stars are not one
+LIKED_WEIGHTS = {3: 1 / 3, 4: 2 / 3, 5: 1.0}
+WATCHLIST_WEIGHT = 0.5
+# Users with more interactions than this (e.g. the account bulk imports are attributed to)
+# carry no taste signal and would make every movie similar to every other one
+MAX_USER_ITEMS = 5000
+# Most recent reviews used as seeds for a user's recommendations
+HISTORY_LIMIT = 200
+BLOCK_SIZE = 500
+
+
+def get_neighbor_count():
+    return getattr(settings, 'RECOMMENDATION_NEIGHBORS', 20)
+
+
+class InteractionMatrix:
+    """Sparse user x movie matrix of signal weights, stored both row- and column-wise."""
+
+    def __init__(self):
+        self.user_items = defaultdict(dict)
+        self.item_users = {}
+        self.norms = {}
+
+    def add(self, user_id, movie_id, weight):
+        # Several signals for the same pair keep the strongest one
+        items = self.user_items[user_id]
+        if weight > items.get(movie_id, 0.0):
+            items[movie_id] = weight
+
+    def finalize(self, max_user_items=MAX_USER_ITEMS):
+        item_users = defaultdict(dict)
+        for user_id, items in list(self.user_items.items()):
+            if len(items) > max_user_items:
+                del self.user_items[user_id]
+                continue
+            for movie_id, weight in items.items():
+                item_users[movie_id][user_id] = weight
+        self.item_users = dict(item_users)
+        self.norms = {
+            movie_id: math.sqrt(sum(weight * weight for weight in users.values()))
+            for movie_id, users in self.item_users.items()
+        }
+        return self
+
+    @classmethod
+    def from_database(cls, using=None, chunk_size=5000):
+        matrix = cls()
+        reviews = Review.objects.using(using).filter(rating__in=list(LIKED_WEIGHTS))
+        for user_id, movie_id, rating in reviews.values_list('user_id', 'movie_id', 'rating').iterator(chunk_size):
+            matrix.add(user_id, movie_id, LIKED_WEIGHTS[rating])
+        memberships = Watchlist.movies.through.objects.using(using).values_list('watchlist__user_id', 'movie_id')
+        for user_id, movie_id in memberships.iterator(chunk_size):
+            matrix.add(user_id, movie_id, WATCHLIST_WEIGHT)
+        return matrix.finalize()
+
+    @property
+    def interaction_count(self):
+        return sum(len(items) for items in self.user_items.values())
+
+    def neighbors(self, movie_id, k):
+        """The ``k`` most similar movies as ``[(movie_id, cosine similarity)]``."""
+        users = self.item_users.get(movie_id)
+        if not users:
+            return []
+        # Dot products with every movie sharing at least one user
+        dots = defaultdict(float)
+        for user_id, weight in users.items():
+            for other_id, other_weight in self.user_items[user_id].items():
+                dots[other_id] += weight * other_weight
+        dots.pop(movie_id, None)
+        norm = self.norms[movie_id]
+        best = heapq.nlargest(k, ((dot / (norm * self.norms[other_id]), -other_id) for other_id, dot in dots.items()))
+        return [(-negated_id, score) for score, negated_id in best]
+
+
+def _blocks(ids, block_size):
+    for start in range(0, len(ids), block_size):
+        yield ids[start:start + block_size]
+
+
+def build_neighbors(movie_ids, matrix, k=None, block_size=BLOCK_SIZE, using=None):
+    """Replace the neighbour rows of ``movie_ids``, one block of movies per transaction."""
+    k = k or get_neighbor_count()
+    neighbors = MovieNeighbor.objects.using(using)
+    for block in _blocks(sorted(movie_ids), block_size):
+        rows = [
+            MovieNeighbor(movie_id=movie_id, neighbor_id=neighbor_id, score=score)
+            for movie_id in block
+            for neighbor_id, score in matrix.neighbors(movie_id, k)
+        ]
+        with transaction.atomic(using=using):
+            neighbors.filter(movie_id__in=block).delete()
+            neighbors.bulk_create(rows)
+    return len(movie_ids)
+
+
+def changed_movie_ids(since, using=None):
+    """Movies whose reviews (their aggregates bump ``updated_at``) or watchlists changed since ``since``."""
+    ids = set(Movie.objects.using(using).filter(updated_at__gte=since).values_list('id', flat=True))
+    ids.update(
+        Watchlist.movies.through.objects.using(using)
+        .filter(watchlist__updated_at__gte=since).values_list('movie_id', flat=True)
+    )
+    return ids
+
+
+def refresh_recommendations(full=False, k=None, block_size=BLOCK_SIZE, using=None):
+    """
+    Rebuild the neighbour lists of every movie (``full``) or only of movies
+    with new activity since the last run. Other movies' lists keep their
+    similarity to changed movies until the next full build.
+    Returns ``(movies rebuilt, seconds)``.
+    """
+    # The database clock stamps updated_at; look back past the last build (movies/watermarks.py)
+    started = database_now(using)
+    clock = time.monotonic()
+    state = RecommendationState.objects.using(using).order_by('pk').first() \
+        or RecommendationState.objects.using(using).create()
+
+    matrix = InteractionMatrix.from_database(using)
+    if full or state.built_at is None:
+        movie_ids = list(Movie.objects.using(using).values_list('id', flat=True))
+    else:
+        movie_ids = list(changed_movie_ids(changed_since(state.built_at), using))
+    built = build_neighbors(movie_ids, matrix, k=k, block_size=block_size, using=using)
+
+    state.built_at = started
+    state.save(update_fields=['built_at'])
+    return built, time.monotonic() - clock
+
+
+# Online lookups
+
+def similar_movies(movie_id, limit=10, using=None):
+    """``[(movie, score)]`` most similar to ``movie_id``; one indexed query."""
+    rows = (
+        MovieNeighbor.objects.using(using).filter(movie_id=movie_id)
+        .select_related('neighbor__category').defer('neighbor__description')
+        .order_by('-score')[:limit]
+    )
+    return [(row.neighbor, row.score) for row in rows]
+
+
+def user_seeds(user, using=None):
+    """``(seeds, seen)``: weights of the movies the user liked, and every movie they interacted with."""
+    seeds, seen = {}, set()
+    reviews = (
+        Review.objects.using(using).filter(user=user).order_by('-created_at')
+        .values_list('movie_id', 'rating')[:HISTORY_LIMIT]
+    )
+    for movie_id, rating in reviews:
+        seen.add(movie_id)
+        weight = LIKED_WEIGHTS.get(rating)
+        if weight and weight > seeds.get(movie_id, 0.0):
+            seeds[movie_id] = weight
+    watchlisted = Watchlist.movies.through.objects.using(using).filter(watchlist__user=user)
+    for movie_id in watchlisted.values_list('movie_id', flat=True):
+        seen.add(movie_id)
+        seeds.setdefault(movie_id, WATCHLIST_WEIGHT)
+    return seeds, seen
+
+
+def recommend_for_user(user, limit=20, using=None):
+    """``[(movie_id, score)]`` ranked by similarity to the user's history, excluding movies they know."""
+    seeds, seen = user_seeds(user, using)
+    if not seeds:
+        return []
+    scores = defaultdict(float)
+    neighbors = MovieNeighbor.objects.using(using).filter(movie_id__in=list(seeds))
+    for movie_id, neighbor_id, score in neighbors.values_list('movie_id', 'neighbor_id', 'score'):
+        if neighbor_id not in seen:
+            scores[neighbor_id] += seeds[movie_id] * score
+    return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
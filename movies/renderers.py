@@ -0,0 +1,55 @@
+"""
+``FastJSONRenderer``: DRF's ``JSONRenderer`` on top of orjson.
+
+It writes the same bytes as DRF's renderer with the default (compact,
+unicode) settings. Dates and decimals still go through DRF's ``JSONEncoder``
+(millisecond precision, ``Z`` suffix), and U+2028/U+2029 are escaped the same
+way. Indented output (``Accept: application/json; indent=4``), non-default
+JSON settings and values orjson cannot encode use the regular renderer.
+
+Floats only come out the same where Python's ``repr`` writes them without an
+exponent (``1e-4 <= abs(x) < 1e16``, and zero): orjson prints ``2.5e-05`` as
+``0.000025`` and ``1e+16`` as ``1e16``, and turns NaN and infinities into
+null where DRF raises. Data holding any other float is rendered by DRF.
+"""
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def orjson_floats_match(data):
+    """Whether every float in ``data`` is written by orjson as ``json.dumps`` would."""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if type(value) is float:
+            # NaN fails both comparisons
+            if value and not 1e-4 <= abs(value) < 1e16:
+                return False
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, float):
+            return False
+    return True
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (not self.compact or self.ensure_ascii or not self.strict
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+                or not orjson_floats_match(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        # Keep the output a strict JavaScript subset, as DRF does
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
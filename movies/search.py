@@ -0,0 +1,178 @@
+"""
+Ranked full-text search over movie titles, directors and descriptions.
+
+On PostgreSQL the query runs against a weighted ``tsvector`` expression that is
+backed by a GIN index (see migration 0007), with prefix matching on every term
+and a ``pg_trgm`` similarity fallback on titles when nothing matches.
+
+Other databases (SQLite in development and tests) use ``InvertedIndex``, a
+pure-Python index built in-process from the movie table and rebuilt whenever
+the ``movies`` cache version changes.
+"""
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.contrib.postgres.lookups import TrigramSimilar
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import F
+
+from . import cache
+from .models import Movie
+
+SEARCH_CONFIG = 'english'
+
+# Relative importance of each field (PostgreSQL weights A > B > C)
+FIELD_WEIGHTS = (
+    ('title', 'A', 3.0),
+    ('director', 'B', 2.0),
+    ('description', 'C', 1.0),
+)
+
+TOKEN_RE = re.compile(r'\w+')
+TRIGRAM_THRESHOLD = 0.3
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def movie_search_vector():
+    """
+    The indexed expression; queries must use exactly this to hit the GIN index.
+    Changing it needs a new migration that rebuilds movie_search_vector_idx (0007 keeps its own copy).
+    """
+    vector = None
+    for field, weight, _ in FIELD_WEIGHTS:
+        part = SearchVector(field, weight=weight, config=SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+# PostgreSQL backend
+
+def _prefix_tsquery(terms):
+    # Terms are \w+ tokens, so they cannot inject tsquery operators
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def postgres_search(terms, raw_query, limit):
+    vector = movie_search_vector()
+    query = SearchQuery(_prefix_tsquery(terms), search_type='raw', config=SEARCH_CONFIG)
+    ids = list(
+        Movie.objects.annotate(search=vector, rank=SearchRank(vector, query))
+        .filter(search=query)
+        .order_by('-rank', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+    if ids:
+        return ids
+    # Fuzzy fallback for typos, served by the trigram index on title
+    return list(
+        Movie.objects.filter(TrigramSimilar(F('title'), raw_query))
+        .annotate(similarity=TrigramSimilarity('title', raw_query))
+        .order_by('-similarity', 'id')
+        .values_list('id', flat=True)[:limit]
+    )
+
+
+# In-process fallback backend
+
+def trigrams(text):
+    # Same padding scheme as pg_trgm: each word is padded with two spaces in front, one behind
+    grams = set()
+    for word in tokenize(text):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class InvertedIndex:
+    """
+    Token -> {movie_id: weighted term frequency} postings with a sorted
+    vocabulary for prefix lookups and title trigrams for fuzzy matching.
+    """
+
+    def __init__(self, rows):
+        self.postings = defaultdict(dict)
+        self.title_trigrams = {}
+        for movie_id, *values in rows:
+            for (field, _, weight), text in zip(FIELD_WEIGHTS, values):
+                for token in tokenize(text or ''):
+                    postings = self.postings[token]
+                    postings[movie_id] = postings.get(movie_id, 0.0) + weight
+            self.title_trigrams[movie_id] = trigrams(values[0] or '')
+        self.vocabulary = sorted(self.postings)
+        self.document_count = len(self.title_trigrams)
+
+    @classmethod
+    def from_database(cls):
+        fields = [field for field, _, _ in FIELD_WEIGHTS]
+        return cls(Movie.objects.values_list('id', *fields).iterator(chunk_size=2000))
+
+    def expand(self, term):
+        """All indexed tokens starting with ``term``."""
+        start = bisect_left(self.vocabulary, term)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            yield token
+
+    def search(self, terms, raw_query, limit):
+        scores = None
+        for term in terms:
+            term_scores = defaultdict(float)
+            for token in self.expand(term):
+                postings = self.postings[token]
+                idf = math.log(1 + self.document_count / len(postings))
+                # Exact matches rank above prefix matches
+                boost = 1.0 if token == term else 0.5
+                for movie_id, frequency in postings.items():
+                    term_scores[movie_id] += frequency * idf * boost
+            if scores is None:
+                scores = term_scores
+            else:
+                # AND semantics, like the tsquery built for PostgreSQL
+                scores = {movie_id: score + term_scores[movie_id]
+                          for movie_id, score in scores.items() if movie_id in term_scores}
+        if scores:
+            return [movie_id for movie_id, _ in sorted(scores.items(), key=lambda item: (-item[1], item[0]))][:limit]
+        return self.fuzzy(raw_query, limit)
+
+    def fuzzy(self, raw_query, limit):
+        query_grams = trigrams(raw_query)
+        if not query_grams:
+            return []
+        matches = []
+        for movie_id, grams in self.title_trigrams.items():
+            similarity = len(query_grams & grams) / len(query_grams | grams)
+            if similarity >= TRIGRAM_THRESHOLD:
+                matches.append((-similarity, movie_id))
+        return [movie_id for _, movie_id in sorted(matches)[:limit]]
+
+
+_index_lock = threading.Lock()
+_index = (None, None)  # (movies cache version, InvertedIndex)
+
+
+def get_inverted_index():
+    global _index
+    version = cache.get_version(cache.MOVIES)
+    with _index_lock:
+        # The version is None when the cache does not store anything (DummyCache)
+        if _index[1] is None or _index[0] != version:
+            _index = (version, InvertedIndex.from_database())
+        return _index[1]
+
+
+def search_movie_ids(query, limit=20):
+    """Return up to ``limit`` movie ids ranked by relevance to ``query``."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    if connection.vendor == 'postgresql':
+        return postgres_search(terms, query, limit)
+    return get_inverted_index().search(terms, query, limit)
@@ -1,10 +1,71 @@
 from rest_framework import serializers
+from . import fastpath, metrics
 from .models import Movie, Category, Review, Watchlist, Rating
+from .posters import thumbnail_url
+from .uploads import POSTER_CONTENT_TYPES
+from .watchlists import MAX_BATCH_SIZE
 from datetime import date
 
 
+class DynamicFieldsMixin:
+    """Takes an optional ``fields`` argument restricting which fields are rendered."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Only top-level lists; nested ones are part of their parent's time
+        if self.parent is not None:
+            return self.represent(data)
+        with metrics.timed_serializer(type(self.child).__name__):
+            return self.represent(data)
+
+    def represent(self, data):
+        if fastpath.enabled() and fastpath.compilable(self.child):
+            return fastpath.represent_many(self.child, data)
+        return super().to_representation(data)
+
+    to_representation.fast_path = True
+
+
+class TimedSerializerMixin:
+    """
+    Reports the rendering time of top-level serializers (``many=True`` included)
+    to movies.metrics, and renders through the compiled read-only fast path of
+    movies/fastpath.py.
+    """
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+
+    def to_representation(self, instance):
+        if self.parent is not None:
+            return self.represent(instance)
+        with metrics.timed_serializer(type(self).__name__):
+            return self.represent(instance)
+
+    def represent(self, instance):
+        if fastpath.enabled():
+            return fastpath.compile_serializer(self, instance)(instance)
+        return super().to_representation(instance)
+
+    to_representation.fast_path = True
+
+    def get_fields(self):
+        # Serializers given data= validate input and keep DRF's deep copies
+        if fastpath.enabled() and not hasattr(self, 'initial_data'):
+            return fastpath.copy_fields(self._declared_fields)
+        return super().get_fields()
+
+
 # Category Serializer (using serializers.Serializer)
-class CategorySerializer(serializers.Serializer):
+class CategorySerializer(DynamicFieldsMixin, TimedSerializerMixin, serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
     name = serializers.CharField(max_length=50)
 
@@ -26,17 +87,34 @@ class CategorySerializer(serializers.Serializer):
         return instance
 
 
+class CategoryStatsSerializer(CategorySerializer):
+    """Category with the totals annotated from its CategoryStats row (``/categories/?with_stats=1``)."""
+    movie_count = serializers.IntegerField(read_only=True)
+    review_count = serializers.IntegerField(read_only=True)
+    mean_rating = serializers.SerializerMethodField()
+    newest_release = serializers.DateField(read_only=True)
+
+    def get_mean_rating(self, obj):
+        # Weighted by reviews, like CategoryStats.mean_rating
+        if obj.review_count:
+            return obj.rating_sum / obj.review_count
+        return 0
+
+
 # Movie Serializer (using serializers.Serializer)
-class MovieSerializer(serializers.Serializer):
+class MovieSerializer(DynamicFieldsMixin, TimedSerializerMixin, serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
     title = serializers.CharField(max_length=255)
     description = serializers.CharField()
     release_date = serializers.DateField()
     director = serializers.CharField(max_length=100)
     poster = serializers.ImageField(required=False)
+    # WebP/JPEG URLs by width plus a blurred placeholder; {} until generated
+    poster_renditions = serializers.JSONField(source='poster_variants', read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), write_only=True)
     category = serializers.CharField(source='category.name', read_only=True)
     average_rating = serializers.SerializerMethodField()
+    review_count = serializers.IntegerField(read_only=True)
 
     def validate_release_date(self, value):
         # Ensure that the release date is not in the future
@@ -45,15 +123,13 @@ class MovieSerializer(serializers.Serializer):
         return value
 
     def get_average_rating(self, obj):
-        # Calculate average rating (if any reviews exist)
-        reviews = obj.reviews.all()
-        if reviews:
-            return sum([review.rating for review in reviews]) / len(reviews)
-        return 0
+        # Read from the denormalized aggregates, no reviews query needed
+        return obj.average_rating
 
     def create(self, validated_data):
-        category = validated_data.pop('category', None)
-        movie = Movie.objects.create(**validated_data)
+        # category_id is validated into the Category instance
+        category = validated_data.pop('category_id')
+        movie = Movie.objects.create(category=category, **validated_data)
         return movie
 
     def update(self, instance, validated_data):
@@ -61,12 +137,13 @@ class MovieSerializer(serializers.Serializer):
         instance.description = validated_data.get('description', instance.description)
         instance.release_date = validated_data.get('release_date', instance.release_date)
         instance.director = validated_data.get('director', instance.director)
+        instance.category = validated_data.get('category_id', instance.category)
         instance.save()
         return instance
 
 
 # Review Serializer (using serializers.Serializer)
-class ReviewSerializer(serializers.Serializer):
+class ReviewSerializer(DynamicFieldsMixin, TimedSerializerMixin, serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
     movie_id = serializers.PrimaryKeyRelatedField(queryset=Movie.objects.all(), write_only=True)
     rating = serializers.IntegerField()
@@ -87,7 +164,9 @@ class ReviewSerializer(serializers.Serializer):
         return value
 
     def create(self, validated_data):
-        review = Review.objects.create(**validated_data)
+        # movie_id is validated into the Movie instance; the view passes the user
+        movie = validated_data.pop('movie_id')
+        review = Review.objects.create(movie=movie, **validated_data)
         return review
 
     def update(self, instance, validated_data):
@@ -98,7 +177,7 @@ class ReviewSerializer(serializers.Serializer):
 
 
 # Watchlist Serializer (using serializers.Serializer)
-class WatchlistSerializer(serializers.Serializer):
+class WatchlistSerializer(TimedSerializerMixin, serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
     user = serializers.StringRelatedField(read_only=True)
     movies = MovieSerializer(many=True, read_only=True)
@@ -120,3 +199,64 @@ class WatchlistSerializer(serializers.Serializer):
         instance.user = validated_data.get('user', instance.user)
         instance.save()
         return instance
+
+
+# Compact movie rows of the paginated watchlist (WatchlistMoviesAPIView)
+class WatchlistMovieSerializer(TimedSerializerMixin, serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    title = serializers.CharField(read_only=True)
+    # Smallest JPEG rendition; null until the renditions are generated
+    poster_thumbnail = serializers.SerializerMethodField()
+    average_rating = serializers.SerializerMethodField()
+
+    def get_poster_thumbnail(self, obj):
+        return thumbnail_url(obj.poster_variants)
+
+    def get_average_rating(self, obj):
+        return obj.average_rating
+
+
+# Direct poster upload requests (see movies/uploads.py)
+class PosterUploadSerializer(serializers.Serializer):
+    content_type = serializers.ChoiceField(choices=list(POSTER_CONTENT_TYPES))
+    size = serializers.IntegerField(min_value=1)
+    method = serializers.ChoiceField(choices=['put', 'post'], default='put')
+
+
+class UploadPartSerializer(serializers.Serializer):
+    part_number = serializers.IntegerField(min_value=1, max_value=10000)
+    etag = serializers.CharField()
+
+
+class PosterUploadCompleteSerializer(serializers.Serializer):
+    token = serializers.CharField()
+    parts = UploadPartSerializer(many=True, required=False)
+
+
+# Batch watchlist requests (see movies/watchlists.py)
+class MovieIdsField(serializers.ListField):
+    """A list of movie IDs; also accepts comma-separated values (``"1,2,3"``, e.g. from a query string)."""
+    # Bounded by the BigAutoField primary keys; larger values overflow the query
+    child = serializers.IntegerField(min_value=1, max_value=2 ** 63 - 1)
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('allow_empty', False)
+        kwargs.setdefault('max_length', MAX_BATCH_SIZE)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [data]
+        if isinstance(data, list):
+            data = [part for value in data for part in self.split(value)]
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def split(value):
+        if not isinstance(value, str):
+            return [value]
+        return [part for part in value.split(',') if part.strip()]
+
+
+class WatchlistBatchSerializer(serializers.Serializer):
+    movie_ids = MovieIdsField()
@@ -0,0 +1,134 @@
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache
+from .category_stats import refresh_category_stats
+from .models import Category, Movie, Review, Watchlist
+from .posters import schedule_renditions
+from .ratings import apply_rating_delta, refresh_rating_stats
+
+
+# Keep Movie rating aggregates in sync with single-row Review writes
+# (forms, serializers, admin). Bulk paths are handled by ReviewQuerySet.
+
+@receiver(post_save, sender=Review)
+def update_rating_stats_on_save(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    new = (instance.movie_id, instance.rating)
+    old = getattr(instance, '_rating_snapshot', None)
+
+    if created:
+        apply_rating_delta(*new, +1, using=using)
+    elif old is None:
+        # Saved from an instance we did not load; the previous values are unknown
+        refresh_rating_stats([instance.movie_id], using=using)
+    elif old != new:
+        apply_rating_delta(*old, -1, using=using)
+        apply_rating_delta(*new, +1, using=using)
+    instance._rating_snapshot = new
+
+
+def _deleted_from(origin, model):
+    """Whether a delete started from ``model`` (an instance or a queryset of it)."""
+    return isinstance(origin, model) or (isinstance(origin, QuerySet) and origin.model is model)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_stats_on_delete(sender, instance, using=None, origin=None, **kwargs):
+    # Cascades and queryset deletes are handled once for all their reviews, not per row
+    if _deleted_from(origin, Movie):
+        # The movie goes too; its category is refreshed by update_category_stats_on_delete
+        return
+    if isinstance(origin, QuerySet) and origin.model is Review:
+        # ReviewQuerySet.delete refreshes the movies afterwards
+        return
+    movie_id, rating = getattr(instance, '_rating_snapshot', (instance.movie_id, instance.rating))
+    if _deleted_from(origin, User):
+        # Refreshed when the user is gone (refresh_rating_stats_on_user_delete)
+        vars(origin).setdefault('_review_movie_ids', set()).add(movie_id)
+        return
+    apply_rating_delta(movie_id, rating, -1, using=using)
+
+
+@receiver(post_delete, sender=User)
+def refresh_rating_stats_on_user_delete(sender, instance, using=None, origin=None, **kwargs):
+    # Reviews are deleted before their user; the first user of a queryset delete takes them all
+    movie_ids = vars(origin).pop('_review_movie_ids', None) if origin is not None else None
+    if movie_ids:
+        refresh_rating_stats(movie_ids, using=using)
+
+
+# Category summary rows (movies/category_stats.py); review deltas are applied in movies.ratings
+
+@receiver(post_save, sender=Movie)
+def update_category_stats_on_save(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    new = (instance.category_id, instance.release_date)
+    old = getattr(instance, '_category_snapshot', None)
+    if created or old != new:
+        # Unknown previous values (an instance we did not load): only the current category
+        refresh_category_stats({new[0], old[0] if old else None}, using=using)
+    instance._category_snapshot = new
+
+
+@receiver(post_delete, sender=Movie)
+def update_category_stats_on_delete(sender, instance, using=None, **kwargs):
+    refresh_category_stats([instance.category_id], using=using)
+
+
+# Poster renditions (generated in the background, see movies/posters.py)
+
+@receiver(post_save, sender=Movie)
+def update_poster_renditions(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    source = instance.poster.name if instance.poster else None
+    if source != (instance.poster_renditions or {}).get('source'):
+        schedule_renditions(instance.pk, using=using)
+
+
+# Response cache invalidation (rating changes are handled in movies.ratings)
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def invalidate_movie_cache(sender, instance, using=None, **kwargs):
+    cache.invalidate_movies([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, using=None, **kwargs):
+    # Movie payloads embed the category name
+    cache.invalidate(cache.CATEGORIES, cache.MOVIES, using=using)
+
+
+# updated_at maintenance for conditional GET (ETag / Last-Modified)
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def touch_category_movies(sender, instance, using=None, **kwargs):
+    # Movie payloads embed the category name, so a rename/delete changes them
+    # (their cache entries depend on the categories namespace, bumped above)
+    Movie.objects.using(using).filter(category=instance).update(updated_at=timezone.now(), invalidate_cache=False)
+
+
+@receiver(m2m_changed, sender=Watchlist.movies.through)
+def touch_watchlist(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    if not reverse:
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+        watchlists = Watchlist.objects.using(using).filter(pk=instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        # movie.watchlists.add(...): pk_set holds watchlist ids
+        watchlists = Watchlist.objects.using(using).filter(pk__in=pk_set)
+    elif action == 'pre_clear':
+        # The affected watchlists are only known before the clear
+        watchlists = Watchlist.objects.using(using).filter(movies=instance)
+    else:
+        return
+    watchlists.update(updated_at=timezone.now())
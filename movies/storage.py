@@ -0,0 +1,14 @@
+from storages.backends.s3 import S3Storage
+
+from . import metrics
+
+
+class InstrumentedS3Storage(S3Storage):
+    """S3Storage reporting the latency of every S3 API call to movies.metrics."""
+
+    @property
+    def connection(self):
+        # One boto3 resource per thread; its client is instrumented on first use
+        connection = super().connection
+        metrics.instrument_boto_client(connection.meta.client)
+        return connection
@@ -1,3 +1,1875 @@
-from django.test import TestCase
+import base64
+import csv
+import importlib
+import io
+import json
+import logging
+import os
+import re
+import runpy
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import QuerySet
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from silk.collector import DataCollector
+from rest_framework.renderers import JSONRenderer
+from silk.models import Request as SilkRequest
+
+from movieR import replicas
+
+from . import cache as response_cache, importing, metrics, recently_viewed
+from .querybudget import QueryBudgetExceeded, QueryRecorder, find_problems, query_budget, view_budget
+from .leaderboards import _missing_ids, _missing_ranges, decayed_count, log_add, log_weight, get_half_life
+from .models import (
+    Category, CategoryStats, ImportCheckpoint, LeaderboardState, Movie, MovieNeighbor, MovieRanking, RATING_STAT_FIELDS,
+    RecommendationState, Review, Watchlist,
+)
+from .ratings import compute_rating_stats
+from .recommendations import InteractionMatrix
+from .search import movie_search_vector
+from .renderers import FastJSONRenderer
+from .serializer import CategorySerializer, MovieSerializer, ReviewSerializer, WatchlistSerializer
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('critic', password='secret')
+        self.category = Category.objects.create(name='Drama')
+        self.movie = Movie.objects.create(
+            title='Heat', description='Crime saga', release_date=date(1995, 12, 15),
+            director='Michael Mann', category=self.category,
+        )
+
+    def add_review(self, rating, movie=None):
+        return Review.objects.create(movie=movie or self.movie, rating=rating, review_text='ok', user=self.user)
+
+    def test_create_edit_delete_keep_aggregates_in_sync(self):
+        first = self.add_review(5)
+        self.add_review(3)
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.review_count, self.movie.rating_sum), (2, 8))
+        self.assertEqual(self.movie.average_rating, 4)
+
+        first = Review.objects.get(pk=first.pk)
+        first.rating = 1
+        first.save()
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.rating_histogram, {1: 1, 2: 0, 3: 1, 4: 0, 5: 0})
+
+        first.delete()
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.review_count, self.movie.rating_sum), (1, 3))
+
+    def test_bulk_paths_refresh_aggregates(self):
+        Review.objects.bulk_create([
+            Review(movie=self.movie, rating=rating, review_text='ok', user=self.user) for rating in (2, 4, 4)
+        ])
+        Review.objects.filter(rating=2).update(rating=5)
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.rating_histogram, {1: 0, 2: 0, 3: 0, 4: 2, 5: 1})
+
+        Review.objects.filter(rating=4).delete()
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.review_count, self.movie.rating_sum), (1, 5))
+
+    def test_update_moving_reviews_refreshes_both_movies(self):
+        other = Movie.objects.create(title='Thief', description='-', release_date=date(1981, 3, 27),
+                                     director='Michael Mann', category=self.category)
+        self.add_review(4)
+        Review.objects.filter(movie=self.movie).update(movie_id=other.pk)
+        self.movie.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.movie.review_count, other.review_count, other.rating_sum), (0, 1, 4))
+
+    def test_cascades_refresh_each_movie_once(self):
+        other = Movie.objects.create(title='Thief', description='-', release_date=date(1981, 3, 27),
+                                     director='Michael Mann', category=self.category)
+        self.add_review(4, movie=other)
+        counts = []
+        for reviews in (1, 20):
+            critic = User.objects.create_user(f'critic{reviews}')
+            Review.objects.bulk_create([Review(movie=movie, rating=2, review_text='ok', user=critic)
+                                        for movie in (self.movie, other) for _ in range(reviews)])
+            with CaptureQueriesContext(connection) as queries:
+                critic.delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        other.refresh_from_db()
+        self.assertEqual((other.review_count, other.rating_sum), (1, 4))
+        self.assertEqual(CategoryStats.objects.get(category=self.category).review_count, 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            other.delete()
+        self.assertLess(len(queries), 15)
+        self.assertEqual(CategoryStats.objects.get(category=self.category).review_count, 0)
+
+    def test_movie_save_does_not_clobber_aggregates(self):
+        stale = Movie.objects.get(pk=self.movie.pk)
+        self.add_review(4)
+        stale.title = 'Heat (1995)'
+        stale.save()
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.review_count, 1)
+
+    def test_rebuild_ratings_command(self):
+        self.add_review(4)
+        Movie.objects.filter(pk=self.movie.pk).update(review_count=0, rating_sum=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_ratings', '--verify', stdout=StringIO())
+        call_command('rebuild_ratings', stdout=StringIO())
+        call_command('rebuild_ratings', '--verify', stdout=StringIO())
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.average_rating, 4)
+
+
+# Silk records sampled requests into the database, which would skew query counts
+without_silk = modify_settings(MIDDLEWARE={'remove': 'movieR.profiling.SampledSilkyMiddleware'})
+
+
+@without_silk
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Drama')
+        # Several movies share a release date so the id tie-breaker matters
+        for index in range(7):
+            Movie.objects.create(
+                title=f'Movie {index}', description='long text', director='Someone',
+                release_date=date(2000, 1, 1 + index // 3), category=category,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_walks_all_pages_forward_and_back(self):
+        seen = []
+        url = '/movies/?page_size=3'
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json())
+            seen.extend(movie['id'] for movie in pages[-1]['results'])
+            url = pages[-1]['next']
+        expected = list(Movie.objects.order_by('release_date', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+
+        previous = self.client.get(pages[-1]['previous']).json()
+        self.assertEqual(previous['results'], pages[1]['results'])
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.client.get('/movies/?cursor=not-a-cursor').status_code, 404)
+
+    def crafted(self, position, ordering):
+        payload = json.dumps({'p': position, 'r': 0, 'o': ordering})
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def test_crafted_cursor_values_are_404(self):
+        cases = [
+            ('/movies/', ['notadate', 1], 'release_date,id'),
+            ('/movies/', [None, None], 'release_date,id'),
+            ('/movies/?sort=rating', ['abc', 1], 'rating_average,id'),
+            ('/movies/', ['2000-01-01', 2 ** 70], 'release_date,id'),
+            ('/categories/', ['x'], 'id'),
+            ('/reviews/', ['x', 'y'], 'created_at,id'),
+            ('/async/movies/', [None, 'x'], 'release_date,id'),
+        ]
+        for path, position, ordering in cases:
+            with self.subTest(path=path, position=position):
+                separator = '&' if '?' in path else '?'
+                response = self.client.get(f'{path}{separator}cursor={self.crafted(position, ordering)}')
+                self.assertEqual(response.status_code, 404)
+
+    def test_cursor_of_another_sort_is_404(self):
+        next_url = self.client.get('/movies/?page_size=2&sort=-title').json()['next']
+        cursor = next_url.split('cursor=')[1].split('&')[0]
+        self.assertEqual(self.client.get(f'/movies/?cursor={cursor}').status_code, 404)
+        self.assertEqual(self.client.get(f'/async/movies/?sort=title&cursor={cursor}').status_code, 404)
+        self.assertEqual(self.client.get(f'/movies/?sort=-title&cursor={cursor}').status_code, 200)
+
+    def test_fields_trim_output_and_columns(self):
+        with self.assertNumQueries(2) as queries:  # ETag validator + page
+            response = self.client.get('/movies/?fields=id,title')
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title'})
+        self.assertNotIn('description', queries.captured_queries[-1]['sql'])
+
+        self.assertEqual(self.client.get('/movies/?fields=id,bogus').status_code, 400)
+
+
+@without_silk
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('critic', password='secret')
+        category = Category.objects.create(name='Drama')
+        cls.movie = Movie.objects.create(
+            title='Heat', description='Crime, saga', release_date=date(1995, 12, 15),
+            director='Michael Mann', category=category,
+        )
+        Review.objects.create(movie=cls.movie, rating=4, review_text='Great "heist"', user=user)
+
+    def test_movies_ndjson(self):
+        response = self.client.get('/movies/export/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual((row['title'], row['category'], row['average_rating']), ('Heat', 'Drama', 4))
+        self.assertEqual(row['release_date'], '1995-12-15')
+
+    def test_reviews_csv(self):
+        response = self.client.get('/reviews/export/?output=csv')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['review_text'], 'Great "heist"')
+        self.assertEqual(rows[0]['user'], 'critic')
+
+    def test_unknown_output_format(self):
+        self.assertEqual(self.client.get('/movies/export/?output=xml').status_code, 400)
+
+
+class ImportMoviesCommandTests(TestCase):
+    def setUp(self):
+        User.objects.create_user('importer', password='secret')  # reviews default to user id 1
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.movies_csv = os.path.join(self.tmpdir.name, 'movies.csv')
+        self.reviews_csv = os.path.join(self.tmpdir.name, 'reviews.csv')
+        with open(self.movies_csv, 'w', newline='', encoding='utf-8') as f:
+            f.write('id,title,description,release_date,director,category\n'
+                    '1,Inception,Dreams.,2010-07-16,Christopher Nolan,SciFi\n'
+                    '2,Heat,Crime.,1995-12-15,Michael Mann,Crime\n'
+                    '3,Inception,Duplicate title.,2010-07-16,Christopher Nolan,SciFi\n'
+                    '4,Broken,Bad date.,not-a-date,Nobody,Crime\n')
+
+    def write_reviews(self, movie_id):
+        with open(self.reviews_csv, 'w', newline='', encoding='utf-8') as f:
+            f.write('movie_id,rating,review_text,created_at\n'
+                    f'{movie_id},5,Great,2023-02-10\n'
+                    f'{movie_id},3,"Fine, I guess",2023-02-11\n'
+                    f'{movie_id},9,Out of range,2023-02-12\n'
+                    '999999,4,No such movie,2023-02-12\n')
+
+    def run_import(self, *args):
+        out = StringIO()
+        call_command('import_movies', '--movies', self.movies_csv, '--reviews', self.reviews_csv,
+                     '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_bulk_import(self):
+        self.write_reviews(movie_id=0)
+        output = self.run_import()
+        self.assertIn('Movies: 4 rows, 2 created, 1 skipped, 1 invalid', output)
+        self.assertEqual(Category.objects.count(), 2)
+
+        inception = Movie.objects.get(title='Inception')
+        self.write_reviews(movie_id=inception.pk)
+        output = self.run_import()
+        self.assertIn('Reviews: 4 rows, 2 created, 0 skipped, 2 invalid', output)
+        inception.refresh_from_db()
+        self.assertEqual((inception.review_count, inception.average_rating), (2, 4))
+        self.assertEqual(Movie.objects.count(), 2)
+
+    def test_parallel_review_import_matches_sequential_report(self):
+        self.write_reviews(movie_id=0)
+        self.run_import()
+        inception = Movie.objects.get(title='Inception')
+        self.write_reviews(movie_id=inception.pk)
+        sequential = self.run_import().splitlines()
+        parallel = self.run_import('--workers', '2', '--shard-bytes', '40').splitlines()
+
+        # Same rows created, same invalid lines reported (tagged with their shard)
+        self.assertEqual(Review.objects.count(), 4)
+        self.assertIn('Reviews: 4 rows, 2 created, 0 skipped, 2 invalid', parallel[2])
+        strip_shard = [re.sub(r'\[shard \d+\] ', '', line) for line in parallel[3:5]]
+        self.assertEqual(strip_shard, sequential[3:5])
+        inception.refresh_from_db()
+        self.assertEqual(inception.review_count, 4)
+
+    def test_resumes_from_checkpoint(self):
+        self.write_reviews(movie_id=0)
+        ImportCheckpoint.objects.create(name='nightly', state={
+            'movies': {'source': os.path.abspath(self.movies_csv), 'rows': 2},
+        })
+        output = self.run_import('--checkpoint', 'nightly')
+        self.assertIn('Movies: 2 rows', output)
+        self.assertFalse(Movie.objects.filter(title='Heat').exists())
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_copy_writes_every_required_column(self):
+        required = {field.column for field in Review._meta.concrete_fields if not field.null and not field.primary_key}
+        cursor = mock.MagicMock()
+        with mock.patch.object(connection, 'cursor', return_value=cursor):
+            importing.copy_reviews([(1, 5, 'Great, really')], 'default')
+        statement, buffer = cursor.__enter__.return_value.copy_expert.call_args.args
+        columns = re.search(r'\((.*?)\)', statement).group(1).split(', ')
+        self.assertEqual(set(columns), required)
+        [values] = csv.reader(StringIO(buffer.getvalue()))
+        row = dict(zip(columns, values))
+        self.assertEqual((row['review_text'], row['updated_at']), ('Great, really', row['created_at']))
+
+    def test_checkpoint_commits_with_the_batch(self):
+        self.write_reviews(movie_id=0)
+        with mock.patch('movies.importing.write_review_batch', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(CommandError):
+                self.run_import('--checkpoint', 'nightly')
+        # Both movie batches committed with their positions, the failed review batch with neither
+        self.assertEqual(ImportCheckpoint.objects.get().state['movies']['rows'], 4)
+        self.assertNotIn('reviews', ImportCheckpoint.objects.get().state)
+
+
+@without_silk
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('critic', password='secret')
+        cls.category = Category.objects.create(name='Drama')
+        cls.movie = Movie.objects.create(
+            title='Heat', description='Crime saga', release_date=date(1995, 12, 15),
+            director='Michael Mann', category=cls.category,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_detail_served_from_cache_until_a_write(self):
+        url = f'/movies/{self.movie.pk}/'
+        self.assertEqual(self.client.get(url).json()['average_rating'], 0)
+        with self.assertNumQueries(1):  # only the ETag validator
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(movie=self.movie, rating=4, review_text='ok', user=self.user)
+        self.assertEqual(self.client.get(url).json()['average_rating'], 4)
+
+    def test_category_rename_invalidates_lists(self):
+        self.assertEqual(self.client.get('/movies/').json()['results'][0]['category'], 'Drama')
+        self.client.get('/categories/')
+        with self.assertNumQueries(1):  # only the movie list ETag validator
+            self.client.get('/movies/')
+            self.client.get('/categories/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Crime'
+            self.category.save()
+        self.assertEqual(self.client.get('/movies/').json()['results'][0]['category'], 'Crime')
+        self.assertEqual(self.client.get('/categories/').json()['results'][0]['name'], 'Crime')
+
+    def test_bulk_movie_writes_invalidate(self):
+        url = f'/movies/{self.movie.pk}/'
+        self.client.get(url)
+        self.client.get('/movies/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Movie.objects.filter(pk=self.movie.pk).update(title='Heat (1995)')
+        self.assertEqual(self.client.get(url).json()['title'], 'Heat (1995)')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Movie.objects.bulk_create([Movie(title='Thief', description='-', release_date=date(1981, 3, 27),
+                                             director='Michael Mann')])
+        self.assertEqual(len(self.client.get('/movies/').json()['results']), 2)
+
+    def test_several_workers_need_a_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            response_cache.check_shared_cache(workers=3)
+        response_cache.check_shared_cache(workers=1)
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+        with override_settings(CACHES=redis):
+            response_cache.check_shared_cache(workers=3)
+
+
+@without_silk
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('critic', password='secret')
+        cls.movie = Movie.objects.create(
+            title='Heat', description='Crime saga', release_date=date(1995, 12, 15), director='Michael Mann',
+        )
+        cls.other = Movie.objects.create(
+            title='Thief', description='Safecracker', release_date=date(1981, 3, 27), director='Michael Mann',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def revalidates(self, url, queries=1):
+        """True if a conditional re-request of ``url`` answers 304 with only the validator query."""
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        return response.status_code == 304
+
+    def test_detail_and_list_not_modified_until_a_write(self):
+        for url in (f'/movies/{self.movie.pk}/', '/movies/', '/reviews/'):
+            self.assertTrue(self.revalidates(url))
+
+        etags = {url: self.client.get(url)['ETag'] for url in (f'/movies/{self.movie.pk}/', '/movies/')}
+        Review.objects.create(movie=self.movie, rating=5, review_text='ok', user=self.user)
+        for url, etag in etags.items():
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_last_modified(self):
+        last_modified = self.client.get(f'/movies/{self.movie.pk}/')['Last-Modified']
+        response = self.client.get(f'/movies/{self.movie.pk}/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_watchlist_changes_on_membership(self):
+        self.client.force_login(self.user)
+        watchlist = Watchlist.objects.create(user=self.user)
+        watchlist.movies.add(self.movie)
+        self.assertTrue(self.revalidates('/watchlist/', queries=3))  # + session and user
+
+        etag = self.client.get('/watchlist/')['ETag']
+        watchlist.movies.add(self.other)
+        self.assertEqual(self.client.get('/watchlist/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@without_silk
+class MovieSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        def movie(title, director, description):
+            return Movie.objects.create(title=title, director=director, description=description,
+                                        release_date=date(2000, 1, 1))
+        cls.inception = movie('Inception', 'Christopher Nolan', 'A thief who enters the dreams of others.')
+        cls.heat = movie('Heat', 'Michael Mann', 'A crew of thieves and a detective.')
+        cls.memento = movie('Memento', 'Christopher Nolan', 'A man with short-term memory loss.')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_search_index_matches_the_query_expression(self):
+        # The migration keeps its own copy; a changed expression needs a new migration
+        migration = importlib.import_module('movies.migrations.0007_movie_search_indexes')
+        self.assertEqual(migration.SEARCH_INDEXES[0].expressions[0], movie_search_vector())
+
+    def search(self, query):
+        response = self.client.get('/movies/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [movie['title'] for movie in response.json()['results']]
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(self.search('incep'), ['Inception'])
+        self.assertEqual(self.search('nolan'), ['Inception', 'Memento'])
+        self.assertEqual(sorted(self.search('thie')), ['Heat', 'Inception'])
+        self.assertEqual(self.search('nolan memory'), ['Memento'])
+
+    def test_fuzzy_fallback(self):
+        self.assertEqual(self.search('Incepton'), ['Inception'])
+        self.assertEqual(self.search('zzzz'), [])
+
+    def test_index_follows_writes(self):
+        self.assertEqual(self.search('tenet'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Movie.objects.create(title='Tenet', director='Christopher Nolan', description='Time inversion.',
+                                 release_date=date(2020, 8, 26))
+        self.assertEqual(self.search('tenet'), ['Tenet'])
+
+    def test_query_required(self):
+        self.assertEqual(self.client.get('/movies/search/').status_code, 400)
+
+
+@without_silk
+class FilterSortTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('critic', password='secret')
+        cls.drama = Category.objects.create(name='Drama')
+        cls.crime = Category.objects.create(name='Crime')
+        cls.heat = Movie.objects.create(title='Heat', description='-', release_date=date(1995, 12, 15),
+                                        director='Michael Mann', category=cls.crime)
+        cls.thief = Movie.objects.create(title='Thief', description='-', release_date=date(1981, 3, 27),
+                                         director='Michael Mann', category=cls.crime)
+        cls.amour = Movie.objects.create(title='Amour', description='-', release_date=date(2012, 5, 20),
+                                         director='Michael Haneke', category=cls.drama)
+        for movie, rating in ((cls.heat, 5), (cls.thief, 3), (cls.amour, 4), (cls.amour, 5)):
+            Review.objects.create(movie=movie, rating=rating, review_text='ok', user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def titles(self, query):
+        response = self.client.get('/movies/', query)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [movie['title'] for movie in response.json()['results']]
+
+    def test_movie_filters_and_sorts(self):
+        self.assertEqual(self.titles({'category': self.crime.pk}), ['Thief', 'Heat'])
+        self.assertEqual(self.titles({'director': 'Michael Mann', 'sort': '-release_date'}), ['Heat', 'Thief'])
+        self.assertEqual(self.titles({'released_from': '1990-01-01', 'released_to': '2000-01-01'}), ['Heat'])
+        self.assertEqual(self.titles({'min_rating': 4.5, 'sort': '-rating'}), ['Heat', 'Amour'])
+        self.assertEqual(self.titles({'sort': 'title'}), ['Amour', 'Heat', 'Thief'])
+
+    def test_descending_sort_paginates(self):
+        first = self.client.get('/movies/', {'sort': '-rating', 'page_size': 2}).json()
+        second = self.client.get(first['next']).json()
+        titles = [movie['title'] for movie in first['results'] + second['results']]
+        self.assertEqual(titles, ['Heat', 'Amour', 'Thief'])
+
+    def test_review_filters(self):
+        def count(query):
+            return len(self.client.get('/reviews/', query).json()['results'])
+        self.assertEqual(count({'movie': self.amour.pk}), 2)
+        self.assertEqual(count({'user': self.user.pk, 'rating': 5}), 2)
+        today = date.today().isoformat()
+        self.assertEqual(count({'created_after': today, 'created_before': today}), 4)
+        self.assertEqual(count({'created_before': '2000-01-01'}), 0)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/movies/', {'min_rating': 'high'}).status_code, 400)
+        self.assertEqual(self.client.get('/movies/', {'sort': 'budget'}).status_code, 400)
+        self.assertEqual(self.client.get('/reviews/', {'created_after': 'yesterday'}).status_code, 400)
+
+    def page_query_plan(self, url, query):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, query)
+        # The page query (later queries, if any, load related rows)
+        sql = next(query['sql'] for query in queries.captured_queries if 'ORDER BY' in query['sql'])
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny test tables would always be seq-scanned; ask whether an index *can* serve the query
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+            else:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return ' '.join(str(row[-1]) for row in cursor.fetchall())
+
+    def test_each_filter_uses_an_index(self):
+        cases = [
+            ('/movies/', {'category': self.crime.pk}),
+            ('/movies/', {'director': 'Michael Mann'}),
+            ('/movies/', {'released_from': '1990-01-01', 'released_to': '2000-01-01'}),
+            ('/movies/', {'min_rating': 4, 'sort': '-rating'}),
+            ('/reviews/', {'movie': self.amour.pk}),
+            ('/reviews/', {'user': self.user.pk}),
+            ('/reviews/', {'rating': 5}),
+            ('/reviews/', {'created_after': '2020-01-01', 'created_before': '2030-01-01'}),
+        ]
+        for url, query in cases:
+            with self.subTest(url=url, query=query):
+                plan = self.page_query_plan(url, query)
+                if connection.vendor == 'postgresql':
+                    self.assertNotIn('Seq Scan', plan)
+                else:
+                    self.assertIn('SEARCH', plan)
+                    self.assertIn('INDEX', plan)
+                    self.assertNotIn('TEMP B-TREE', plan)  # no sort step either
+
+
+@without_silk
+class LeaderboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('critic', password='secret')
+        cls.drama = Category.objects.create(name='Drama')
+        cls.crime = Category.objects.create(name='Crime')
+
+        def movie(title, category, ratings):
+            movie = Movie.objects.create(title=title, description='-', release_date=date(2000, 1, 1),
+                                         director='-', category=category)
+            Review.objects.bulk_create([Review(movie=movie, rating=rating, review_text='ok', user=cls.user)
+                                        for rating in ratings])
+            return movie
+        # Highest raw average, but a single review
+        cls.lucky = movie('Lucky', cls.drama, [5])
+        cls.classic = movie('Classic', cls.crime, [5] * 10 + [4] * 10)
+        cls.flop = movie('Flop', cls.drama, [2] * 3)
+
+    def setUp(self):
+        cache.clear()
+
+    def titles(self, url, query=None):
+        response = self.client.get(url, query or {})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [movie['title'] for movie in response.json()['results']]
+
+    def test_top_uses_bayesian_average(self):
+        call_command('refresh_leaderboards', stdout=StringIO())
+        self.assertEqual(self.titles('/movies/top/'), ['Classic', 'Lucky', 'Flop'])
+        self.assertEqual(self.titles('/movies/top/', {'category': self.drama.pk}), ['Lucky', 'Flop'])
+        with self.assertNumQueries(1):
+            self.client.get('/movies/top/', {'category': self.drama.pk, 'limit': 1})
+
+    def test_incremental_refresh(self):
+        call_command('refresh_leaderboards', stdout=StringIO())
+        self.assertEqual(self.titles('/movies/trending/'), ['Classic', 'Flop', 'Lucky'])
+
+        Review.objects.bulk_create([Review(movie=self.flop, rating=5, review_text='ok', user=self.user)
+                                    for _ in range(25)])
+        stdout = StringIO()
+        call_command('refresh_leaderboards', stdout=stdout)
+        self.assertIn('25 new reviews counted', stdout.getvalue())
+        self.assertEqual(self.titles('/movies/trending/', {'limit': 1}), ['Flop'])
+        self.assertEqual(self.titles('/movies/top/', {'limit': 1}), ['Flop'])
+
+        # A full rebuild ends up with the same scores
+        incremental = dict(MovieRanking.objects.values_list('movie_id', 'trending_score'))
+        call_command('refresh_leaderboards', '--full', stdout=StringIO())
+        for movie_id, score in MovieRanking.objects.values_list('movie_id', 'trending_score'):
+            self.assertAlmostEqual(score, incremental[movie_id])
+
+    def test_reviews_committed_behind_the_watermark_are_counted(self):
+        call_command('refresh_leaderboards', stdout=StringIO())
+        # Two reviews get ids, but the first one's transaction is still open during the next run
+        late = Review(movie=self.lucky, rating=5, review_text='late', user=self.user)
+        late.save()
+        Review.objects.create(movie=self.flop, rating=5, review_text='ok', user=self.user)
+        late_pk = late.pk
+        late.delete()
+        stdout = StringIO()
+        call_command('refresh_leaderboards', stdout=stdout)
+        self.assertIn('1 new reviews counted', stdout.getvalue())
+        self.assertEqual(LeaderboardState.objects.get().review_gaps[0][:2], [late_pk, late_pk])
+
+        # Now it commits
+        Review.objects.create(pk=late_pk, movie=self.lucky, rating=5, review_text='late', user=self.user)
+        stdout = StringIO()
+        call_command('refresh_leaderboards', stdout=stdout)
+        self.assertIn('1 new reviews counted', stdout.getvalue())
+        self.assertEqual(LeaderboardState.objects.get().review_gaps, [])
+        incremental = dict(MovieRanking.objects.values_list('movie_id', 'trending_score'))
+        call_command('refresh_leaderboards', '--full', stdout=StringIO())
+        for movie_id, score in MovieRanking.objects.values_list('movie_id', 'trending_score'):
+            self.assertAlmostEqual(score, incremental[movie_id])
+
+    def test_gaps_expire_after_the_overlap(self):
+        call_command('refresh_leaderboards', stdout=StringIO())
+        deleted = Review.objects.create(movie=self.lucky, rating=5, review_text='x', user=self.user)
+        Review.objects.create(movie=self.flop, rating=5, review_text='ok', user=self.user)
+        deleted.delete()
+        call_command('refresh_leaderboards', stdout=StringIO())
+        self.assertEqual(len(LeaderboardState.objects.get().review_gaps), 1)
+        with override_settings(REFRESH_WATERMARK_OVERLAP_SECONDS=0):
+            call_command('refresh_leaderboards', stdout=StringIO())
+        self.assertEqual(LeaderboardState.objects.get().review_gaps, [])
+
+    def test_full_refresh_finds_the_gaps_in_the_database(self):
+        ids = sorted(Review.objects.values_list('pk', flat=True))
+        Review.objects.filter(pk__in=[ids[3], ids[4], ids[10]]).delete()
+        present = set(Review.objects.values_list('pk', flat=True))
+        for low, high in ((0, ids[-1] + 2), (ids[2], ids[4]), (ids[-1], ids[-1] + 3), (ids[5], ids[5])):
+            with self.subTest(low=low, high=high):
+                self.assertEqual(_missing_ids(Review.objects.all(), low, high, 'now'),
+                                 _missing_ranges(low, high, {pk for pk in present if low < pk <= high}, 'now'))
+        # Reviews older than the horizon are skipped, not taken for gaps
+        Review.objects.filter(movie=self.classic).update(created_at=timezone.now() - timedelta(days=365))
+        call_command('refresh_leaderboards', '--full', '--chunk-size', '2', stdout=StringIO())
+        self.assertEqual([gap[:2] for gap in LeaderboardState.objects.get().review_gaps],
+                         [[ids[3], ids[4]], [ids[10], ids[10]]])
+
+    def test_movies_written_just_before_the_last_run_are_rescored(self):
+        call_command('refresh_leaderboards', stdout=StringIO())
+        refreshed_at = LeaderboardState.objects.get().refreshed_at
+        # Committed after the run, but stamped when its transaction started
+        Movie.objects.filter(pk=self.flop.pk).update(review_count=50, rating_sum=250,
+                                                     updated_at=refreshed_at - timedelta(seconds=30))
+        call_command('refresh_leaderboards', stdout=StringIO())
+        self.assertEqual(self.titles('/movies/top/', {'limit': 1}), ['Flop'])
+
+    def test_trending_weight_halves_every_half_life(self):
+        now = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        score = log_add(log_weight(now), log_weight(now - get_half_life()))
+        self.assertAlmostEqual(decayed_count(score, now), 1.5)
+        self.assertAlmostEqual(decayed_count(score, now + get_half_life()), 0.75)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/movies/top/', {'limit': 'ten'}).status_code, 400)
+
+
+@without_silk
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        def movie(title):
+            return Movie.objects.create(title=title, description='-', release_date=date(2000, 1, 1), director='-')
+        cls.alien, cls.aliens, cls.heat, cls.amour = (movie(title) for title in ('Alien', 'Aliens', 'Heat', 'Amour'))
+        cls.users = [User.objects.create_user(f'user{i}', password='secret') for i in range(4)]
+        likes = {
+            0: [cls.alien, cls.aliens],
+            1: [cls.alien, cls.aliens, cls.heat],
+            2: [cls.heat, cls.amour],
+        }
+        for index, movies in likes.items():
+            for movie in movies:
+                Review.objects.create(movie=movie, user=cls.users[index], rating=5, review_text='ok')
+        # Dislikes are not a signal
+        Review.objects.create(movie=cls.amour, user=cls.users[0], rating=1, review_text='no')
+        # The last user only has a watchlist
+        Watchlist.objects.create(user=cls.users[3]).movies.add(cls.alien)
+
+    def setUp(self):
+        cache.clear()
+
+    def titles(self, query):
+        response = self.client.get('/recommendations/', query)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [movie['title'] for movie in response.json()['results']]
+
+    def test_cosine_neighbours(self):
+        matrix = InteractionMatrix()
+        for user, movie in ((1, 10), (1, 11), (2, 10), (2, 11), (3, 10), (3, 12)):
+            matrix.add(user, movie, 1.0)
+        matrix.finalize()
+        neighbors = dict(matrix.neighbors(10, k=5))
+        self.assertAlmostEqual(neighbors[11], 2 / (3 ** 0.5 * 2 ** 0.5))
+        self.assertAlmostEqual(neighbors[12], 1 / 3 ** 0.5)
+        self.assertEqual([movie for movie, _ in matrix.neighbors(10, k=1)], [11])
+
+    def test_also_liked_and_user_recommendations(self):
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertEqual(self.titles({'movie': self.alien.pk})[:2], ['Aliens', 'Heat'])
+        self.assertNotIn('Amour', self.titles({'movie': self.alien.pk}))
+
+        self.client.force_login(self.users[3])
+        with self.assertNumQueries(6):  # session, user, reviews, watchlist, neighbours, movies
+            titles = self.titles({})
+        self.assertEqual(titles[0], 'Aliens')
+        self.assertNotIn('Alien', titles)
+
+        self.client.logout()
+        self.assertIn(self.client.get('/recommendations/').status_code, (401, 403))
+
+    def age_activity(self):
+        # Older than the watermark overlap of the next build
+        hour_ago = timezone.now() - timedelta(hours=1)
+        Movie.objects.update(updated_at=hour_ago)
+        Watchlist.objects.update(updated_at=hour_ago)
+
+    def test_incremental_refresh(self):
+        self.age_activity()
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertFalse(MovieNeighbor.objects.filter(movie=self.amour, neighbor=self.alien).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(movie=self.amour, user=self.users[1], rating=5, review_text='ok')
+        stdout = StringIO()
+        call_command('build_recommendations', stdout=stdout)
+        # Only the movie with new activity is rebuilt
+        self.assertIn('neighbours of 1 movies', stdout.getvalue())
+        self.assertTrue(MovieNeighbor.objects.filter(movie=self.amour, neighbor=self.alien).exists())
+
+    def test_activity_committed_after_a_build_started_is_rebuilt(self):
+        self.age_activity()
+        call_command('build_recommendations', stdout=StringIO())
+        built_at = RecommendationState.objects.get().built_at
+        # Stamped before the build's watermark by a transaction that committed after it
+        Movie.objects.filter(pk=self.heat.pk).update(updated_at=built_at - timedelta(seconds=30))
+        stdout = StringIO()
+        call_command('build_recommendations', stdout=stdout)
+        self.assertIn('neighbours of 1 movies', stdout.getvalue())
+
+
+def poster_file(name='poster.png', size=(800, 1200)):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGBA', size, (200, 30, 30, 255)).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@without_silk
+class PosterRenditionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storages = override_settings(
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+            MEDIA_ROOT=media.name,
+            MEDIA_URL='/media/',
+            POSTER_RENDITIONS_ASYNC=False,
+        )
+        storages.enable()
+        self.addCleanup(storages.disable)
+        self.media = media.name
+
+    def create_movie(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Movie.objects.create(title='Heat', description='-', release_date=date(1995, 12, 15),
+                                        director='Michael Mann', **kwargs)
+
+    def test_renditions_generated_on_upload(self):
+        movie = self.create_movie(poster=poster_file())
+        movie.refresh_from_db()
+        renditions = movie.poster_variants
+        self.assertEqual((renditions['width'], renditions['height']), (800, 1200))
+        self.assertEqual(sorted(renditions['webp'], key=int), ['160', '320', '640'])
+        self.assertTrue(renditions['placeholder'].startswith('data:image/jpeg;base64,'))
+        self.assertLess(len(renditions['placeholder']), 2000)
+        stem = os.path.splitext(os.path.basename(movie.poster.name))[0]
+        self.assertEqual(renditions['webp']['320'], f'/media/poster_renditions/{movie.pk}/{stem}-320w.webp')
+        self.assertTrue(os.path.exists(os.path.join(self.media, 'poster_renditions', str(movie.pk), f'{stem}-320w.webp')))
+
+        data = self.client.get(f'/movies/{movie.pk}/').json()
+        self.assertEqual(data['poster_renditions']['jpeg'], renditions['jpeg'])
+
+    def test_small_posters_are_not_upscaled(self):
+        movie = self.create_movie(poster=poster_file(size=(200, 300)))
+        movie.refresh_from_db()
+        self.assertEqual(sorted(movie.poster_variants['jpeg'], key=int), ['160', '200'])
+
+    def test_backfill_command(self):
+        movie = self.create_movie()
+        # Posters written without signals (e.g. bulk imports) have no renditions
+        movie.poster.save('old.png', poster_file(), save=False)
+        Movie.objects.filter(pk=movie.pk).update(poster=movie.poster.name)
+        stdout = StringIO()
+        # One worker: the work runs in this thread, inside the test transaction
+        call_command('generate_poster_renditions', '--workers', '1', stdout=stdout)
+        self.assertIn('for 1 movies (0 failed)', stdout.getvalue())
+        movie.refresh_from_db()
+        self.assertTrue(movie.poster_variants)
+        # Nothing left to do
+        call_command('generate_poster_renditions', stdout=stdout)
+        self.assertIn('for 0 movies', stdout.getvalue())
+
+
+@without_silk
+class DirectPosterUploadTests(TestCase):
+    """The S3 API is faked with botocore's Stubber on the storage's own client."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(title='Heat', description='-', release_date=date(1995, 12, 15),
+                                         director='Michael Mann')
+
+    def setUp(self):
+        from botocore.stub import Stubber
+        from django.core.files.storage import default_storage
+        cache.clear()
+        self.storage = default_storage
+        self.stubber = Stubber(default_storage.connection.meta.client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+    def url(self, action):
+        return f'/movies/{self.movie.pk}/poster/{action}/'
+
+    def stub_stored_object(self, key, size, content_type, first_bytes):
+        from botocore.response import StreamingBody
+        from botocore.stub import ANY
+        bucket = self.storage.bucket_name
+        self.stubber.add_response('head_object', {'ContentLength': size, 'ContentType': content_type},
+                                  {'Bucket': bucket, 'Key': key})
+        self.stubber.add_response('get_object', {'Body': StreamingBody(io.BytesIO(first_bytes), len(first_bytes))},
+                                  {'Bucket': bucket, 'Key': key, 'Range': ANY})
+
+    def test_presigned_put_and_complete(self):
+        response = self.client.post(self.url('upload'), {'content_type': 'image/png', 'size': 1000},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        payload = response.json()
+        self.assertEqual(payload['upload']['method'], 'PUT')
+        self.assertIn('Signature=', payload['upload']['url'])
+        self.assertIn(payload['name'], payload['upload']['url'])
+
+        self.stub_stored_object(payload['name'], 1000, 'image/png', b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR')
+        response = self.client.post(self.url('complete'), {'token': payload['token']}, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.stubber.assert_no_pending_responses()
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.poster.name, payload['name'])
+
+    def test_presigned_post(self):
+        response = self.client.post(self.url('upload'), {'content_type': 'image/jpeg', 'size': 1000, 'method': 'post'},
+                                    content_type='application/json')
+        upload = response.json()['upload']
+        self.assertEqual(upload['method'], 'POST')
+        self.assertIn('policy', upload['fields'])
+
+    def test_multipart_upload(self):
+        size = 20 * 1024 * 1024
+        self.stubber.add_response('create_multipart_upload', {'UploadId': 'upload-1'})
+        payload = self.client.post(self.url('upload'), {'content_type': 'image/jpeg', 'size': size},
+                                   content_type='application/json').json()
+        self.assertEqual(payload['upload']['method'], 'MULTIPART')
+        self.assertEqual([part['part_number'] for part in payload['upload']['parts']], [1, 2, 3])
+
+        parts = [{'part_number': number, 'etag': f'"etag{number}"'} for number in (2, 1, 3)]
+        self.stubber.add_response('complete_multipart_upload', {}, {
+            'Bucket': self.storage.bucket_name, 'Key': payload['name'], 'UploadId': 'upload-1',
+            'MultipartUpload': {'Parts': [{'PartNumber': n, 'ETag': f'"etag{n}"'} for n in (1, 2, 3)]},
+        })
+        self.stub_stored_object(payload['name'], size, 'image/jpeg', b'\xff\xd8\xff\xe0' + b'\x00' * 12)
+        response = self.client.post(self.url('complete'), {'token': payload['token'], 'parts': parts},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.stubber.assert_no_pending_responses()
+
+    def test_spoofed_content_is_rejected_and_deleted(self):
+        payload = self.client.post(self.url('upload'), {'content_type': 'image/png', 'size': 100},
+                                   content_type='application/json').json()
+        self.stub_stored_object(payload['name'], 100, 'image/png', b'<?php echo 1; ?>')
+        self.stubber.add_response('delete_object', {}, {'Bucket': self.storage.bucket_name, 'Key': payload['name']})
+        response = self.client.post(self.url('complete'), {'token': payload['token']}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.stubber.assert_no_pending_responses()
+        self.movie.refresh_from_db()
+        self.assertFalse(self.movie.poster)
+
+    def test_invalid_requests(self):
+        too_big = {'content_type': 'image/png', 'size': 10 ** 10}
+        self.assertEqual(self.client.post(self.url('upload'), too_big, content_type='application/json').status_code, 400)
+        gif = {'content_type': 'image/gif', 'size': 100}
+        self.assertEqual(self.client.post(self.url('upload'), gif, content_type='application/json').status_code, 400)
+        forged = {'token': 'not-a-token'}
+        self.assertEqual(self.client.post(self.url('complete'), forged, content_type='application/json').status_code, 400)
+
+
+@without_silk
+class AsyncReadPathTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('critic', password='secret')
+        crime = Category.objects.create(name='Crime')
+        cls.movies = [
+            Movie.objects.create(title=f'Movie {i}', description='-', release_date=date(2000, 1, i + 1),
+                                 director='Someone', category=crime)
+            for i in range(5)
+        ]
+        for movie in cls.movies[:3]:
+            Review.objects.create(movie=movie, user=cls.user, rating=4, review_text='ok')
+        Watchlist.objects.create(user=cls.user).movies.add(*cls.movies[:2])
+
+    def setUp(self):
+        cache.clear()
+
+    def assertSamePayload(self, sync_url, async_url, query=None):
+        expected = self.client.get(sync_url, query or {})
+        response = self.client.get(async_url, query or {})
+        self.assertEqual(response.status_code, expected.status_code)
+        expected, actual = expected.json(), response.json()
+        if 'results' in expected:
+            self.assertEqual(actual['results'], expected['results'])
+            self.assertEqual(bool(actual['next']), bool(expected['next']))
+        else:
+            self.assertEqual(actual, expected)
+        return response
+
+    def test_same_payloads_as_sync_views(self):
+        self.assertSamePayload('/movies/', '/async/movies/', {'page_size': 2, 'sort': '-release_date'})
+        self.assertSamePayload('/movies/', '/async/movies/', {'fields': 'id,title', 'min_rating': 4})
+        self.assertSamePayload(f'/movies/{self.movies[0].pk}/', f'/async/movies/{self.movies[0].pk}/')
+        self.assertSamePayload('/reviews/', '/async/reviews/', {'movie': self.movies[0].pk})
+        self.client.force_login(self.user)
+        self.assertSamePayload('/watchlist/', '/async/watchlist/')
+
+    def test_pagination_and_errors(self):
+        first = self.client.get('/async/movies/', {'page_size': 3}).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(first['results'] + second['results']), 5)
+        self.assertEqual(self.client.get('/async/movies/', {'sort': 'budget'}).status_code, 400)
+        self.assertEqual(self.client.get('/async/movies/999999/').status_code, 404)
+        self.assertEqual(self.client.get('/async/watchlist/').status_code, 401)
+        self.assertEqual(self.client.post('/async/movies/').status_code, 405)
+
+    def test_conditional_get(self):
+        url = f'/async/movies/{self.movies[0].pk}/'
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        response = self.client.get('/async/reviews/')
+        self.assertEqual(self.client.get('/async/reviews/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    async def test_async_client(self):
+        response = await self.async_client.get('/async/movies/', {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class AsgiMiddlewareTests(SimpleTestCase):
+    @override_settings(DEBUG=True)
+    def test_middleware_chain_stays_async(self):
+        # Django logs every middleware (and view middleware method) it wraps in a thread adapter
+        with self.assertLogs('django.request', level='DEBUG') as logs:
+            logging.getLogger('django.request').debug('Loading the ASGI middleware.')
+            ASGIHandler()
+        ours = re.compile(r'adapted for (middleware |method (Replica|Silky|Budget|Metrics)\w*\.process_)')
+        adapted = [line for line in logs.output if ours.search(line)]
+        self.assertEqual(adapted, [])
+
+
+class GunicornConfigTests(SimpleTestCase):
+    def load_config(self, **env):
+        with mock.patch.dict(os.environ, env):
+            return runpy.run_path(os.path.join(settings.BASE_DIR, 'movieR', 'gunicorn.conf.py'))
+
+    def test_gthread_defaults(self):
+        config = self.load_config()
+        self.assertEqual(config['worker_class'], 'gthread')
+        self.assertEqual(config['wsgi_app'], 'movieR.wsgi:application')
+        self.assertEqual(config['workers'], os.cpu_count() * 2 + 1)
+        self.assertTrue(config['preload_app'])
+        self.assertGreater(config['max_requests'], 0)
+
+    def test_uvicorn_workers_serve_asgi(self):
+        config = self.load_config(GUNICORN_WORKER_CLASS='uvicorn', GUNICORN_WORKERS='3', GUNICORN_ACCESSLOG='')
+        self.assertEqual(config['worker_class'], 'uvicorn.workers.UvicornWorker')
+        self.assertEqual(config['wsgi_app'], 'movieR.asgi:application')
+        self.assertEqual(config['workers'], 3)
+        self.assertIsNone(config['accesslog'])
+
+    def test_persistent_connections(self):
+        from movieR import settings as project_settings
+        self.assertGreater(project_settings.DATABASES['default']['CONN_MAX_AGE'], 0)
+        self.assertTrue(project_settings.DATABASES['default']['CONN_HEALTH_CHECKS'])
+
+
+@override_settings(SILK_SAMPLE_RATE=0.0, SILK_PROFILE_TOKEN='secret', SILK_PROFILE_PATHS=[], SILK_PROFILE_USERS=[])
+class SilkProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_unsampled_requests_are_not_recorded(self):
+        self.client.get('/movies/')
+        self.client.get('/movies/', HTTP_X_SILK_PROFILE='wrong')
+        self.assertEqual(SilkRequest.objects.count(), 0)
+        self.assertIsNone(DataCollector().request)
+
+    def test_header_forces_profiling(self):
+        self.client.get('/movies/', HTTP_X_SILK_PROFILE='secret')
+        recorded = SilkRequest.objects.get()
+        self.assertEqual(recorded.path, '/movies/')
+        self.assertTrue(recorded.pyprofile)
+        self.assertGreater(recorded.queries.count(), 0)
+
+    @override_settings(SILK_SAMPLE_RATE=1.0)
+    def test_random_samples_skip_cprofile(self):
+        self.client.get('/movies/')
+        self.assertFalse(SilkRequest.objects.get().pyprofile)
+
+    @override_settings(SILK_ENABLED=False, SILK_SAMPLE_RATE=1.0)
+    def test_switched_off(self):
+        self.client.get('/movies/', HTTP_X_SILK_PROFILE='secret')
+        self.assertEqual(SilkRequest.objects.count(), 0)
+
+    def test_prune_silk(self):
+        old = timezone.now() - timedelta(days=30)
+        for _ in range(3):
+            SilkRequest.objects.create(path='/old/', method='GET', start_time=old)
+        for _ in range(3):
+            SilkRequest.objects.create(path='/new/', method='GET')
+
+        call_command('prune_silk', '--days', '7', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(set(SilkRequest.objects.values_list('path', flat=True)), {'/new/'})
+        call_command('prune_silk', '--keep', '1', stdout=StringIO())
+        self.assertEqual(SilkRequest.objects.count(), 1)
+
+
+@without_silk
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Drama")
+        Movie.objects.create(title="Heat", description="d", release_date=date(1995, 12, 15),
+                             director="Mann", category=cls.category)
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+
+    def test_only_internal_clients_scrape(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='172.18.0.5').status_code, 200)
+
+    def test_request_metrics(self):
+        self.client.get('/movies/')
+        self.client.get('/movies/')
+        text = self.client.get('/metrics').content.decode()
+
+        labels = 'view="movie-list-create",method="GET",status="2xx"'
+        self.assertIn(f'http_request_duration_seconds_count{{{labels}}} 2', text)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn('db_queries_per_request_count{view="movie-list-create"} 2', text)
+        self.assertIn('cache_requests_total{cache="movie-list",result="miss"} 1', text)
+        self.assertIn('cache_requests_total{cache="movie-list",result="hit"} 1', text)
+        self.assertIn('serializer_duration_seconds_count{serializer="MovieSerializer"} 1', text)
+        queries = re.search(r'db_queries_per_request_sum\{view="movie-list-create"\} (\d+)', text)
+        self.assertGreater(int(queries.group(1)), 0)
+
+    def test_workers_are_summed(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            metrics.registry.inc('cache_requests_total', ('movie', 'hit'), 2)
+            other = {'counters': [['cache_requests_total', ['movie', 'hit'], 3]], 'histograms': []}
+            with open(metrics.process_file(directory, 999999), 'w') as f:
+                json.dump(other, f)
+            counters, _ = metrics.collect()
+            self.assertEqual(counters['cache_requests_total', ('movie', 'hit')], 5)
+
+            # An exited worker's numbers survive in the archive
+            metrics.archive_process(directory, 999999)
+            self.assertFalse(os.path.exists(metrics.process_file(directory, 999999)))
+            counters, _ = metrics.collect()
+            self.assertEqual(counters['cache_requests_total', ('movie', 'hit')], 5)
+
+    def test_s3_calls_are_timed(self):
+        from botocore.stub import Stubber
+        from django.core.files.storage import default_storage
+
+        client = default_storage.connection.meta.client
+        stubber = Stubber(client)
+        stubber.add_response('head_object', {'ContentLength': 1}, {'Bucket': 'b', 'Key': 'k'})
+        with stubber:
+            client.head_object(Bucket='b', Key='k')
+        _, histograms = metrics.collect()
+        self.assertEqual(sum(histograms['s3_request_duration_seconds', ('HeadObject',)][:-1]), 1)
+
+
+@without_silk
+# Recently viewed movies stay buffered, so the cache.clear() before each request keeps them
+@override_settings(QUERY_BUDGET_RAISE=True, QUERY_BUDGET_HEADER=True, POSTER_RENDITIONS_ASYNC=False,
+                   RECENTLY_VIEWED_FLUSH_INTERVAL=3600)
+class QueryBudgetTests(TestCase):
+    """
+    Every endpoint in movies/urls.py runs the same number of queries whatever
+    the number of rows, within the budget its view declares (enforced by
+    QueryBudgetMiddleware, which raises in tests).
+    """
+    # (method, url, data); {movie} is a movie with reviews, {scratch} a new movie that may be deleted.
+    # Not listed: silk/ (third-party), the poster completion (S3 calls, see DirectPosterUploadTests),
+    # the exports (queries run while streaming) and movie/<pk>/delete/ (it has no template yet).
+    ENDPOINTS = [
+        ('get', '/movies/', None),
+        ('get', '/movies/?fields=id,title,category', None),
+        ('get', '/movies/get/', None),
+        ('post', '/movies/post/', {'title': 'New', 'description': 'd', 'release_date': '2001-01-01',
+                                   'director': 'D', 'category_id': '{category}'}),
+        ('get', '/movies/search/?q=heat', None),
+        ('get', '/movies/top/', None),
+        ('get', '/movies/trending/', None),
+        ('get', '/movies/{movie}/', None),
+        ('get', '/movies/{movie}/get/', None),
+        ('post', '/movies/{movie}/poster/upload/', {'content_type': 'image/png', 'size': 1000}),
+        ('put', '/movies/{scratch}/put/', {'title': 'Changed', 'description': 'd', 'release_date': '2001-01-01',
+                                           'director': 'D', 'category_id': '{category}'}),
+        ('delete', '/movies/{scratch}/delete/', None),
+        ('get', '/categories/', None),
+        ('get', '/categories/?with_stats=1', None),
+        ('get', '/categories/?with_stats=1&fields=name,mean_rating', None),
+        ('get', '/categories/get/', None),
+        ('post', '/categories/post/', {'name': 'Noir{n}'}),
+        ('get', '/reviews/', None),
+        ('get', '/reviews/get/', None),
+        ('get', '/reviews/?movie={movie}', None),
+        ('post', '/reviews/post/', {'movie_id': '{scratch}', 'rating': 4, 'review_text': 'Good'}),
+        ('get', '/recommendations/', None),
+        ('get', '/recommendations/?movie={movie}', None),
+        ('get', '/watchlist/', None),
+        ('get', '/watchlist/get/', None),
+        ('get', '/watchlist/movies/', None),
+        ('get', '/watchlist/movies/?page_size=2', None),
+        ('get', '/watchlist/ids/', None),
+        ('get', '/watchlist/count/', None),
+        ('post', '/watchlist/add/', {'movie_id': '{scratch}'}),
+        ('post', '/watchlist/remove/', {'movie_id': '{movie}'}),
+        ('post', '/watchlist/batch/add/', {'movie_ids': '{scratch},{movie}'}),
+        ('post', '/watchlist/batch/remove/', {'movie_ids': '{scratch}'}),
+        ('get', '/watchlist/contains/?movie_ids={movie},{scratch}', None),
+        ('get', '/async/movies/', None),
+        ('get', '/async/movies/{movie}/', None),
+        ('get', '/async/reviews/', None),
+        ('get', '/async/watchlist/', None),
+        ('get', '/', None),
+        ('get', '/movie/{movie}/', None),
+        ('get', '/movie/create/', None),
+        ('get', '/movie/{movie}/update/', None),
+        ('get', '/movie/{movie}/review/', None),
+        ('get', '/movie/{movie}/upload_poster/', None),
+        ('get', '/recently-viewed/', None),
+        ('get', '/metrics', None),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('budget', password='secret')
+        cls.category = Category.objects.create(name="Crime")
+        cls.movie = Movie.objects.create(title="Heat", description="d", release_date=date(1995, 12, 15),
+                                         director="Mann", category=cls.category)
+        cls.watchlist = Watchlist.objects.create(user=cls.user)
+        cls.watchlist.movies.add(cls.movie)
+        Review.objects.create(movie=cls.movie, user=cls.user, rating=5, review_text="Great")
+        # Not seen by the user, so recommendations have results
+        unseen = Movie.objects.create(title="Thief", description="d", release_date=date(1981, 3, 27),
+                                      director="Mann", category=cls.category)
+        MovieNeighbor.objects.create(movie=cls.movie, neighbor=unseen, score=0.9)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.created = 0
+
+    def add_rows(self, count):
+        """More of everything the endpoints read: movies, categories, reviewers, reviews, watchlist entries."""
+        for i in range(count):
+            category = Category.objects.create(name=f"Genre{i}")
+            user = User.objects.create_user(f'reviewer{i}', password='secret')
+            movie = Movie.objects.create(title=f"Heat {i}", description="d", release_date=date(2000, 1, 1),
+                                         director="Mann", category=category)
+            Review.objects.create(movie=movie, user=user, rating=4, review_text="Fine")
+            Review.objects.create(movie=self.movie, user=user, rating=5, review_text="Great")
+            Review.objects.create(movie=movie, user=self.user, rating=5, review_text="Great")
+            self.watchlist.movies.add(movie)
+            MovieNeighbor.objects.create(movie=self.movie, neighbor=movie, score=0.5)
+            MovieNeighbor.objects.create(movie=movie, neighbor=self.movie, score=0.5)
+        call_command('refresh_leaderboards', '--full', stdout=StringIO())
+
+    def scratch_movie(self):
+        self.created += 1
+        return Movie.objects.create(title=f"Scratch {self.created}", description="d",
+                                    release_date=date(2001, 1, 1), director="D", category=self.category)
+
+    def format(self, value, values):
+        return value.format(**values) if isinstance(value, str) else value
+
+    def count_queries(self, method, url, data):
+        values = {'movie': self.movie.pk, 'category': self.category.pk, 'n': self.created}
+        if '{scratch}' in url or '{scratch}' in json.dumps(data or {}):
+            values['scratch'] = self.scratch_movie().pk
+        url = url.format(**values)
+        data = {key: self.format(value, values) for key, value in (data or {}).items()}
+        cache.clear()
+        if method in ('put', 'delete'):
+            response = getattr(self.client, method)(url, json.dumps(data), content_type='application/json')
+        else:
+            response = getattr(self.client, method)(url, data)
+        self.assertLess(response.status_code, 400, f"{method.upper()} {url}: {response.status_code}")
+        # Counted by QueryBudgetMiddleware, which also checked the view's budget
+        return int(response['X-Query-Count'])
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        small = [self.count_queries(*endpoint) for endpoint in self.ENDPOINTS]
+        self.add_rows(5)
+        large = [self.count_queries(*endpoint) for endpoint in self.ENDPOINTS]
+        for endpoint, before, after in zip(self.ENDPOINTS, small, large):
+            with self.subTest(endpoint=endpoint[:2]):
+                self.assertEqual(before, after)
+
+    def test_deleting_a_movie_does_not_grow_with_its_reviews(self):
+        counts = []
+        for reviews in (1, 30):
+            movie = self.scratch_movie()
+            Review.objects.bulk_create([Review(movie=movie, user=self.user, rating=3, review_text='ok')
+                                        for _ in range(reviews)])
+            counts.append(self.count_queries('delete', f'/movies/{movie.pk}/delete/', None))
+        self.assertEqual(counts[0], counts[1])
+
+    async def test_async_requests_are_counted(self):
+        # Served through the async middleware chain; the ORM runs in sync_to_async threads
+        await sync_to_async(cache.clear)()
+        response = await self.async_client.get('/async/movies/')
+        await sync_to_async(cache.clear)()
+        expected = await sync_to_async(self.client.get)('/async/movies/')
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertEqual(response['X-Query-Count'], expected['X-Query-Count'])
+
+    def test_every_view_declares_a_budget(self):
+        for method, url, _ in self.ENDPOINTS:
+            with self.subTest(url=url):
+                match = resolve(url.split('?')[0].format(movie=1, scratch=1))
+                self.assertIsNotNone(view_budget(match.func, method.upper()))
+
+    def test_query_budget_context_manager(self):
+        with query_budget(2):
+            list(Movie.objects.all())
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_budget(1):
+                list(Movie.objects.all())
+                list(Category.objects.all())
+        # Transaction control is not a duplicate (e.g. one BEGIN per batch on SQLite)
+        recorder = QueryRecorder()
+        recorder.queries = [('default', 'BEGIN', None), ('default', 'BEGIN', None)]
+        self.assertEqual(find_problems(recorder, 2), [])
+        # The N+1 pattern: the same statement with different parameters
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_budget():
+                for movie in Movie.objects.all()[:1]:
+                    for pk in range(4):
+                        Review.objects.filter(movie_id=pk).first()
+
+
+@without_silk
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def generate(self, **options):
+        options = {'movies': 30, 'reviews': 400, 'watchlists': 5, 'categories': 3, 'batch_size': 64, **options}
+        call_command('generate_benchmark_data', stdout=StringIO(), **options)
+
+    def test_generated_data_is_consistent(self):
+        self.generate()
+        self.assertEqual(Movie.objects.count(), 30)
+        self.assertEqual(Review.objects.count(), 400)
+        self.assertEqual(Watchlist.objects.count(), 5)
+        self.assertTrue(Watchlist.movies.through.objects.exists())
+        # The aggregates are written with the movies, not refreshed afterwards
+        stats = compute_rating_stats(list(Movie.objects.values_list('pk', flat=True)))
+        for movie in Movie.objects.all():
+            self.assertEqual(stats[movie.pk], {field: getattr(movie, field) for field in RATING_STAT_FIELDS})
+
+        # Seeded: flushing and regenerating gives the same catalog
+        catalog = list(Movie.objects.order_by('pk').values_list('title', 'director', 'rating_sum'))
+        self.generate(flush=True)
+        self.assertEqual(list(Movie.objects.order_by('pk').values_list('title', 'director', 'rating_sum')), catalog)
+        self.assertEqual(User.objects.filter(username__startswith='bench').count(), 5)
+
+    def test_benchmark_results(self):
+        self.generate()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command('benchmark', rounds=1, min_time=0, sample_size=10, output=path, stdout=StringIO())
+            with open(path) as f:
+                document = json.load(f)
+
+        self.assertEqual(document['meta']['dataset']['movies'], 30)
+        results = {result['name']: result for result in document['results']}
+        self.assertIn('serializer.movie_list', results)
+        self.assertEqual(results['query.movie_page']['queries'], 1)
+        # Every GET route of movies/urls.py is exercised, and answers
+        self.assertIn('endpoint.movie-list-create', results)
+        self.assertIn('endpoint.watchlist-retrieve', results)
+        self.assertIn('endpoint.movie_detail', results)
+        for name, result in results.items():
+            with self.subTest(name=name):
+                self.assertLess(result.get('status', 200), 400)
+
+    def test_compare_benchmarks(self):
+        def document(median, queries):
+            return {'meta': {'commit': 'abc', 'database': 'sqlite', 'dataset': {}},
+                    'results': [{'name': 'serializer.movie_list', 'kind': 'micro',
+                                 'median_us': median, 'queries': queries}]}
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = {}
+            for name, doc in (('base', document(100, 1)), ('same', document(105, 1)),
+                              ('slower', document(150, 1)), ('more_queries', document(90, 2))):
+                paths[name] = os.path.join(directory, f'{name}.json')
+                with open(paths[name], 'w') as f:
+                    json.dump(doc, f)
+
+            call_command('compare_benchmarks', paths['base'], paths['same'], stdout=StringIO())
+            for head in ('slower', 'more_queries'):
+                with self.subTest(head=head), self.assertRaises(CommandError):
+                    call_command('compare_benchmarks', paths['base'], paths[head], stdout=StringIO())
+
+
+@without_silk
+class SerializerContractTests(TestCase):
+    """The compiled fast path and orjson renderer produce exactly what DRF does."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('critic', password='secret')
+        cls.category = Category.objects.create(name='Drama')
+        cls.movie = Movie.objects.create(
+            title='Amélie \U0001f3ac', description='Paris "quoted" \\ \u2028\n', release_date=date(2001, 4, 25),
+            director='Jean-Pierre Jeunet', category=cls.category,
+            poster='posters/amelie.png',
+            poster_renditions={'source': 'posters/amelie.png', 'width': 800, 'jpeg': {'160': '/media/a-160w.jpg'}},
+        )
+        cls.uncategorized = Movie.objects.create(title='Untitled', description='-', release_date=date(2020, 1, 1),
+                                                 director='Nobody', category=None)
+        cls.review = Review.objects.create(movie=cls.movie, rating=5, review_text='Très bien', user=cls.user)
+        Review.objects.filter(pk=cls.review.pk).update(
+            created_at=datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc))
+        Review.objects.create(movie=cls.uncategorized, rating=2, review_text='meh',
+                              user=User.objects.create_user('lurker'))
+        cls.watchlist = Watchlist.objects.create(user=cls.user)
+        cls.watchlist.movies.add(cls.movie, cls.uncategorized)
+
+    def setUp(self):
+        cache.clear()
+
+    def both(self, render):
+        """``render()`` with the fast path off and on."""
+        with override_settings(SERIALIZER_FAST_PATH=False):
+            expected = render()
+        with override_settings(SERIALIZER_FAST_PATH=True):
+            actual = render()
+        return expected, actual
+
+    def assertSameOutput(self, serializer_class, instance, **kwargs):
+        def render():
+            data = serializer_class(instance, **kwargs).data
+            return data, FastJSONRenderer().render(data), JSONRenderer().render(data)
+
+        (expected, _, drf_bytes), (actual, fast_bytes, _) = self.both(render)
+        self.assertEqual(actual, expected)
+        self.assertEqual(fast_bytes, drf_bytes)
+
+    def test_serializers(self):
+        movies = list(Movie.objects.select_related('category').order_by('pk'))
+        reviews = list(Review.objects.select_related('user').order_by('pk'))
+        self.assertSameOutput(MovieSerializer, movies, many=True)
+        self.assertSameOutput(MovieSerializer, movies, many=True, fields=['id', 'category', 'average_rating'])
+        self.assertSameOutput(MovieSerializer, self.uncategorized)
+        self.assertSameOutput(ReviewSerializer, reviews, many=True)
+        self.assertSameOutput(ReviewSerializer, reviews[0], fields=['created_at'])
+        self.assertSameOutput(WatchlistSerializer, self.watchlist)
+        self.assertSameOutput(CategorySerializer, Category.objects.all(), many=True)
+        self.assertSameOutput(MovieSerializer, [], many=True)
+
+    def test_edge_cases(self):
+        data = MovieSerializer(self.uncategorized).data
+        # DRF leaves out read-only fields whose source cannot be reached
+        self.assertNotIn('category', data)
+        self.assertEqual(data['poster'], None)
+        data = ReviewSerializer(Review.objects.get(pk=self.review.pk)).data
+        self.assertEqual(data['created_at'], '2024-05-01T12:30:15.123456Z')
+        self.assertIn(b'\\u2028', FastJSONRenderer().render(MovieSerializer(self.movie).data))
+        # Indented and non-JSON-native values use DRF's encoder
+        self.assertEqual(FastJSONRenderer().render({'a': [1]}, 'application/json; indent=2'),
+                         JSONRenderer().render({'a': [1]}, 'application/json; indent=2'))
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70, 'd': date(2020, 1, 2)}),
+                         JSONRenderer().render({'big': 2 ** 70, 'd': date(2020, 1, 2)}))
+        # Floats Python writes with an exponent are left to DRF
+        floats = {'small': [2.5e-05, 1e-07, 0.0001, 0.0, -0.5], 'large': (1e16, -1.2345678901234568e+17, 9.999e15)}
+        self.assertEqual(FastJSONRenderer().render(floats), JSONRenderer().render(floats))
+        with self.assertRaises(ValueError):
+            FastJSONRenderer().render({'rating': float('nan')})
+
+    def test_validation_still_uses_drf_fields(self):
+        serializer = MovieSerializer(data={'title': 'x', 'description': 'y', 'release_date': '2999-01-01',
+                                           'director': 'z', 'category_id': self.category.pk})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('release_date', serializer.errors)
+        self.assertFalse(CategorySerializer(data={'name': ' '}).is_valid())
+
+    def test_endpoints_are_byte_identical(self):
+        self.client.force_login(self.user)
+        for path in ('/movies/', f'/movies/{self.movie.pk}/', '/reviews/', '/categories/', '/watchlist/'):
+            with self.subTest(path=path):
+                def render():
+                    cache.clear()
+                    response = self.client.get(path)
+                    self.assertEqual(response.status_code, 200)
+                    return response.content
+                expected, actual = self.both(render)
+                self.assertEqual(actual, expected)
+
+
+@without_silk
+class WatchlistBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('collector', password='secret')
+        cls.movies = [
+            Movie.objects.create(title=f'Film {i}', description='-', release_date=date(2000, 1, 1), director='D')
+            for i in range(5)
+        ]
+        cls.ids = [movie.pk for movie in cls.movies]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def post(self, action, movie_ids):
+        return self.client.post(f'/watchlist/batch/{action}/', {'movie_ids': movie_ids},
+                                content_type='application/json')
+
+    def test_add_and_remove_return_the_diff(self):
+        Watchlist.objects.create(user=self.user).movies.add(self.movies[0])
+        missing = max(self.ids) + 1
+        response = self.post('add', [self.ids[0], self.ids[1], self.ids[2], missing])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'added': self.ids[1:3], 'already_present': self.ids[:1],
+                                           'not_found': [missing]})
+        self.assertEqual(set(self.user.watchlist.movies.values_list('pk', flat=True)), set(self.ids[:3]))
+
+        response = self.post('remove', [self.ids[1], self.ids[4]])
+        self.assertEqual(response.json(), {'removed': [self.ids[1]], 'not_in_watchlist': [self.ids[4]]})
+        self.assertEqual(set(self.user.watchlist.movies.values_list('pk', flat=True)), {self.ids[0], self.ids[2]})
+
+        response = self.client.get(f'/watchlist/contains/?movie_ids={self.ids[0]},{self.ids[1]}')
+        self.assertEqual(response.json(), {'contains': [self.ids[0]], 'missing': [self.ids[1]]})
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        more = [
+            Movie.objects.create(title=f'Extra {i}', description='-', release_date=date(2000, 1, 1), director='D').pk
+            for i in range(30)
+        ]
+        Watchlist.objects.create(user=self.user)
+        self.post('add', self.ids[:1])
+        with self.assertNumQueries(7):  # session, user, movies, watchlist, membership, insert, touch
+            self.post('add', self.ids + more)
+        with self.assertNumQueries(6):
+            self.post('remove', self.ids + more)
+        with self.assertNumQueries(3):
+            self.client.get('/watchlist/contains/', {'movie_ids': ','.join(map(str, self.ids + more))})
+
+    def test_batch_writes_change_the_etag(self):
+        Watchlist.objects.create(user=self.user).movies.add(self.movies[0])
+        etag = self.client.get('/watchlist/')['ETag']
+        self.post('add', self.ids[1:2])
+        self.assertEqual(self.client.get('/watchlist/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get('/watchlist/')['ETag']
+        self.post('remove', self.ids[1:2])
+        self.assertEqual(self.client.get('/watchlist/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_form_encoded_ids(self):
+        # Repeated values, some of them comma-separated
+        response = self.client.post('/watchlist/batch/add/',
+                                    {'movie_ids': [self.ids[0], f'{self.ids[1]},{self.ids[2]}']})
+        self.assertEqual(response.json()['added'], self.ids[:3])
+
+    def test_invalid_requests(self):
+        for movie_ids in ([], ['x'], [0], [2 ** 63], list(range(1, 1002))):
+            with self.subTest(movie_ids=movie_ids[:3]):
+                self.assertEqual(self.post('add', movie_ids).status_code, 400)
+        self.assertEqual(self.client.get('/watchlist/contains/').status_code, 400)
+        response = self.client.get('/watchlist/contains/?movie_ids=99999999999999999999')
+        self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        self.assertIn(self.post('add', self.ids).status_code, (401, 403))
+        self.assertIn(self.client.get(f'/watchlist/contains/?movie_ids={self.ids[0]}').status_code, (401, 403))
+
+
+@without_silk
+class WatchlistLeanReadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('collector', password='secret')
+        cls.movies = [
+            Movie.objects.create(title=f'Film {i}', description='Long text', release_date=date(2000, 1, 1),
+                                 director='D', review_count=2, rating_sum=7)
+            for i in range(5)
+        ]
+        Movie.objects.filter(pk=cls.movies[0].pk).update(poster='posters/a.png', poster_renditions={
+            'source': 'posters/a.png', 'jpeg': {'320': '/media/a-320w.jpg', '160': '/media/a-160w.jpg'}})
+        cls.watchlist = Watchlist.objects.create(user=cls.user)
+        cls.watchlist.movies.add(*cls.movies[:4])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_pages_of_compact_rows(self):
+        first = self.client.get('/watchlist/movies/?page_size=3').json()
+        self.assertEqual(first['results'][0], {'id': self.movies[0].pk, 'title': 'Film 0',
+                                               'poster_thumbnail': '/media/a-160w.jpg', 'average_rating': 3.5})
+        self.assertIsNone(first['results'][1]['poster_thumbnail'])
+        second = self.client.get(first['next']).json()
+        self.assertIsNone(second['next'])
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(ids, [movie.pk for movie in self.movies[:4]])
+
+    def test_ids_and_count(self):
+        self.assertEqual(self.client.get('/watchlist/ids/').json(),
+                         {'count': 4, 'movie_ids': [movie.pk for movie in self.movies[:4]]})
+        self.assertEqual(self.client.get('/watchlist/count/').json(), {'count': 4})
+
+        response = self.client.get('/watchlist/ids/')
+        self.assertEqual(self.client.get('/watchlist/ids/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.watchlist.movies.add(self.movies[4])
+        response = self.client.get('/watchlist/ids/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.json()['count'], 5)
+
+    def test_without_a_watchlist(self):
+        self.client.force_login(User.objects.create_user('newcomer'))
+        self.assertEqual(self.client.get('/watchlist/movies/').json()['results'], [])
+        self.assertEqual(self.client.get('/watchlist/ids/').json(), {'count': 0, 'movie_ids': []})
+        self.assertEqual(self.client.get('/watchlist/count/').json(), {'count': 0})
+        self.client.logout()
+        for path in ('/watchlist/movies/', '/watchlist/ids/', '/watchlist/count/'):
+            with self.subTest(path=path):
+                self.assertIn(self.client.get(path).status_code, (401, 403))
+
+
+@without_silk
+@override_settings(RECENTLY_VIEWED_LIMIT=3, RECENTLY_VIEWED_FLUSH_INTERVAL=3600, RECENTLY_VIEWED_BATCH_SIZE=2)
+class RecentlyViewedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('browser', password='secret')
+        cls.movies = [
+            Movie.objects.create(title=f'Film {i}', description='-', release_date=date(2000, 1, 1), director='D')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        recently_viewed.flush()
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def view(self, movie):
+        response = self.client.get(f'/movie/{movie.pk}/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_browsing_does_not_write_to_the_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/')
+            self.view(self.movies[0])
+        writes = [query['sql'] for query in queries if not query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(writes, [])
+        self.assertNotIn('last_viewed_movie', self.client.session)
+
+    def test_bounded_list_most_recent_first(self):
+        for movie in (self.movies[0], self.movies[1], self.movies[0], self.movies[2], self.movies[3]):
+            self.view(movie)
+        expected = [self.movies[3].pk, self.movies[2].pk, self.movies[0].pk]
+        # Still buffered in this process
+        self.assertEqual(recently_viewed.recent_movie_ids(self.user), expected)
+        self.assertIsNone(cache.get(f'recently_viewed:{self.user.pk}'))
+        response = self.client.get('/recently-viewed/')
+        self.assertEqual([movie['id'] for movie in response.json()], expected)
+
+        recently_viewed.flush()
+        self.assertEqual(cache.get(f'recently_viewed:{self.user.pk}'), expected)
+        self.view(self.movies[4])
+        self.assertEqual(recently_viewed.recent_movie_ids(self.user), [self.movies[4].pk] + expected[:2])
+
+    def test_views_are_flushed_in_batches(self):
+        other = User.objects.create_superuser('other', password='secret')
+        recently_viewed.record_view(self.user, self.movies[0].pk)
+        self.assertIsNone(cache.get(f'recently_viewed:{self.user.pk}'))
+        # The second pending user fills the batch
+        recently_viewed.record_view(other, self.movies[1].pk)
+        self.assertEqual(cache.get_many([f'recently_viewed:{self.user.pk}', f'recently_viewed:{other.pk}']), {
+            f'recently_viewed:{self.user.pk}': [self.movies[0].pk],
+            f'recently_viewed:{other.pk}': [self.movies[1].pk],
+        })
+
+    def test_pending_views_are_flushed_without_further_views(self):
+        with override_settings(RECENTLY_VIEWED_FLUSH_INTERVAL=0.05):
+            recently_viewed.record_view(self.user, self.movies[0].pk)
+        for _ in range(100):
+            if cache.get(f'recently_viewed:{self.user.pk}') is not None:
+                break
+            time.sleep(0.02)
+        self.assertEqual(cache.get(f'recently_viewed:{self.user.pk}'), [self.movies[0].pk])
+
+    def test_several_workers_need_a_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            recently_viewed.check_shared_cache(workers=3)
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+        with override_settings(CACHES=redis):
+            recently_viewed.check_shared_cache(workers=3)
+
+    def test_deleted_movies_and_anonymous_users(self):
+        self.view(self.movies[0])
+        self.view(self.movies[1])
+        self.movies[1].delete()
+        self.assertEqual([movie['id'] for movie in self.client.get('/recently-viewed/').json()], [self.movies[0].pk])
+        self.client.logout()
+        self.assertIn(self.client.get('/recently-viewed/').status_code, (401, 403))
+
+
+@without_silk
+@skipUnless('replica' in settings.DATABASES, "needs the second database of movieR/test_settings.py")
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(TestCase):
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='secret')
+        cls.category = Category.objects.create(name='Drama')
+        # The replica lags behind: each database has its own rows
+        cls.primary_movie = Movie.objects.create(title='On primary', description='-', release_date=date(2000, 1, 1),
+                                                 director='D')
+        cls.replica_movie = Movie.objects.using('replica').create(
+            title='On replica', description='-', release_date=date(2000, 1, 1), director='D')
+
+    def setUp(self):
+        cache.clear()
+
+    def titles(self, path, **extra):
+        return [movie['title'] for movie in self.client.get(path, **extra).json()['results']]
+
+    def post_movie(self, **extra):
+        return self.client.post('/movies/post/', {'title': 'New', 'description': 'd', 'release_date': '2001-01-01',
+                                                  'director': 'D', 'category_id': self.category.pk}, **extra)
+
+    def test_marked_views_read_from_the_replica(self):
+        self.assertEqual(self.titles('/movies/'), ['On replica'])
+        self.assertEqual(self.client.get(f'/movies/{self.replica_movie.pk}/').json()['title'], 'On replica')
+        # Not marked: the web UI and the search read from the primary
+        self.assertContains(self.client.get('/movies/search/?q=primary'), 'On primary')
+        # Sessions and users always come from the primary
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/watchlist/count/').status_code, 200)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.client.force_login(self.user)
+        response = self.post_movie()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.cookies['db_pin']['max-age'], 5)
+        self.assertFalse(Movie.objects.using('replica').filter(title='New').exists())
+        self.assertEqual(self.titles('/movies/'), ['On primary', 'New'])
+        # The page built from the primary is cached and served to every client
+        self.client.cookies.pop('db_pin')
+        self.assertEqual(self.titles('/movies/'), ['On primary', 'New'])
+
+    async def test_async_views_read_from_the_replica(self):
+        response = await self.async_client.get('/async/movies/')
+        self.assertEqual([movie['title'] for movie in response.json()['results']], ['On replica'])
+        self.async_client.cookies['db_pin'] = '1'
+        response = await self.async_client.get('/async/movies/')
+        self.assertEqual([movie['title'] for movie in response.json()['results']], ['On primary'])
+
+    def test_pages_read_from_a_replica_are_not_cached(self):
+        self.assertEqual(self.titles('/movies/'), ['On replica'])
+        self.client.cookies['db_pin'] = '1'
+        self.assertEqual(self.titles('/movies/'), ['On primary'])
+
+    def test_clients_without_cookies_are_pinned_by_their_credentials(self):
+        credentials = {'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(b'reader:secret').decode()}
+        self.assertEqual(self.titles('/movies/', **credentials), ['On replica'])
+        self.assertEqual(self.post_movie(**credentials).status_code, 201)
+        self.client.cookies.clear()
+        self.assertEqual(self.titles('/movies/', **credentials), ['On primary', 'New'])
+
+    def test_router(self):
+        router = replicas.ReplicaRouter()
+        routing = replicas.RequestRouting()
+        routing.replica = 'replica'
+        token = replicas._routing.set(routing)
+        try:
+            self.assertEqual(router.db_for_read(Movie), 'replica')
+            self.assertIsNone(router.db_for_read(User))
+            # Related objects follow their instance
+            self.assertEqual(router.db_for_read(Category, instance=self.primary_movie), 'default')
+            # Locking reads are routed as writes
+            self.assertEqual(Movie.objects.select_for_update().db, 'default')
+            # After a write the request reads its own writes
+            self.assertEqual(router.db_for_write(Movie, instance=self.replica_movie), 'default')
+            self.assertIsNone(router.db_for_read(Movie))
+        finally:
+            replicas._routing.reset(token)
+        # Outside requests: the primary
+        self.assertIsNone(router.db_for_read(Movie))
+        self.assertEqual(Movie.objects.get().title, 'On primary')
+
+
+@without_silk
+class CategoryStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser('editor', password='secret')
+        self.drama = Category.objects.create(name='Drama')
+        self.crime = Category.objects.create(name='Crime')
+        self.heat = self.add_movie('Heat', date(1995, 12, 15), self.crime)
+        self.ronin = self.add_movie('Ronin', date(1998, 9, 25), self.crime)
+
+    def add_movie(self, title, release_date, category):
+        return Movie.objects.create(title=title, description='-', release_date=release_date, director='D',
+                                    category=category)
+
+    def add_review(self, movie, rating):
+        return Review.objects.create(movie=movie, rating=rating, review_text='ok', user=self.user)
+
+    def stats(self, category):
+        row = CategoryStats.objects.get(category=category)
+        return row.movie_count, row.review_count, row.mean_rating, row.newest_release
+
+    def test_review_writes_update_the_category(self):
+        review = self.add_review(self.heat, 5)
+        self.add_review(self.ronin, 2)
+        self.assertEqual(self.stats(self.crime), (2, 2, 3.5, date(1998, 9, 25)))
+
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 3
+        review.save()
+        self.assertEqual(self.stats(self.crime)[1:3], (2, 2.5))
+        Review.objects.filter(movie=self.ronin).update(rating=5)
+        self.assertEqual(self.stats(self.crime)[1:3], (2, 4))
+        review.delete()
+        self.assertEqual(self.stats(self.crime)[1:3], (1, 5))
+
+    def test_movie_writes_update_the_categories(self):
+        self.add_review(self.heat, 4)
+        heat = Movie.objects.get(pk=self.heat.pk)
+        heat.category = self.drama
+        heat.save()
+        self.assertEqual(self.stats(self.drama), (1, 1, 4, date(1995, 12, 15)))
+        self.assertEqual(self.stats(self.crime), (1, 0, 0, date(1998, 9, 25)))
+
+        Movie.objects.get(pk=self.ronin.pk).delete()
+        self.assertEqual(self.stats(self.crime), (0, 0, 0, None))
+        call_command('rebuild_category_stats', '--verify', stdout=StringIO())
+
+    def test_recomputing_locks_the_summary_rows_first(self):
+        # Review writes adjust the same rows; holding them keeps their deltas from being overwritten
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True,
+                               side_effect=QuerySet.select_for_update) as lock:
+            Movie.objects.get(pk=self.ronin.pk).delete()
+        [(queryset, *_)] = [call.args for call in lock.call_args_list]
+        self.assertIs(queryset.model, CategoryStats)
+        self.assertEqual(self.stats(self.crime), (1, 0, 0, date(1995, 12, 15)))
+
+    def test_bulk_movie_writes_update_the_categories(self):
+        self.add_review(self.heat, 4)
+        Movie.objects.filter(pk=self.heat.pk).update(category=self.drama)
+        self.assertEqual(self.stats(self.drama), (1, 1, 4, date(1995, 12, 15)))
+        self.assertEqual(self.stats(self.crime), (1, 0, 0, date(1998, 9, 25)))
+        # Later review deltas find the row of the new category
+        self.add_review(self.heat, 2)
+        self.assertEqual(self.stats(self.drama)[1:3], (2, 3))
+
+        noir = Category.objects.create(name='Noir')
+        [laura] = Movie.objects.bulk_create([
+            Movie(title='Laura', description='-', release_date=date(1944, 10, 11), director='D', category=noir),
+        ])
+        self.add_review(laura, 5)
+        self.assertEqual(self.stats(noir), (1, 1, 5, date(1944, 10, 11)))
+        laura.category = self.drama
+        Movie.objects.bulk_update([laura], ['category'])
+        self.assertEqual(self.stats(noir), (0, 0, 0, None))
+        self.assertEqual(self.stats(self.drama)[:3], (2, 3, 11 / 3))
+        call_command('rebuild_category_stats', '--verify', stdout=StringIO())
+
+    def test_rebuild_category_stats_command(self):
+        self.add_review(self.heat, 4)
+        CategoryStats.objects.filter(category=self.crime).update(movie_count=7, review_count=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_category_stats', '--verify', stdout=StringIO())
+        call_command('rebuild_category_stats', stdout=StringIO())
+        call_command('rebuild_category_stats', '--verify', stdout=StringIO())
+        self.assertEqual(self.stats(self.crime)[:3], (2, 1, 4))
+
+    def test_category_list_with_stats(self):
+        self.add_review(self.heat, 4)
+        Category.objects.create(name='Empty')
+        rows = self.client.get('/categories/?with_stats=1').json()['results']
+        self.assertEqual(rows[1], {'id': self.crime.pk, 'name': 'Crime', 'movie_count': 2, 'review_count': 1,
+                                   'mean_rating': 4.0, 'newest_release': '1998-09-25'})
+        self.assertEqual(rows[2]['movie_count'], 0)
+        self.assertIsNone(rows[2]['newest_release'])
+        # Cached, but refreshed by the next review
+        self.add_review(self.ronin, 2)
+        rows = self.client.get('/categories/?with_stats=1&fields=name,review_count').json()['results']
+        self.assertEqual(rows[1], {'name': 'Crime', 'review_count': 2})
+        self.assertNotIn('movie_count', self.client.get('/categories/').json()['results'][0])
+        self.assertEqual(self.client.get('/categories/?fields=movie_count').status_code, 400)
+
+    def test_admin_reads_the_stored_counts(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/admin/movies/movie/')
+        self.assertContains(response, 'Crime (2)')
+        self.assertContains(response, 'Drama (0)')
+        response = self.client.get(f'/admin/movies/movie/?category__id__exact={self.drama.pk}')
+        self.assertNotContains(response, 'Ronin')
+        # The editable category column loads its options once, not once per row
+        with query_budget():
+            self.client.get('/admin/movies/movie/')
+        self.assertEqual(self.client.get('/admin/movies/category/').status_code, 200)
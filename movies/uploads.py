@@ -0,0 +1,182 @@
+"""
+Direct-to-bucket poster uploads.
+
+Instead of streaming the file through a Django worker, the client asks for a
+presigned request (PUT, POST form or, above ``MULTIPART_PART_SIZE``, one
+presigned PUT per multipart part), uploads straight to the bucket of
+``STORAGES['default']`` and then calls the completion endpoint. Completion
+checks the stored object's size and leading bytes before attaching it to
+``Movie.poster``; rejected objects are deleted.
+
+The upload's movie, key, size and type travel in a signed token, so no
+server-side state is kept between the two calls.
+"""
+import math
+import posixpath
+import uuid
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+
+from .models import Movie
+
+# content type -> (file extension, check of the file's first 16 bytes)
+POSTER_CONTENT_TYPES = {
+    'image/jpeg': ('.jpg', lambda head: head.startswith(b'\xff\xd8\xff')),
+    'image/png': ('.png', lambda head: head.startswith(b'\x89PNG\r\n\x1a\n')),
+    'image/webp': ('.webp', lambda head: head[:4] == b'RIFF' and head[8:12] == b'WEBP'),
+}
+# S3 requires every part but the last to be at least 5 MiB
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+TOKEN_SALT = 'movies.poster-upload'
+
+
+class UploadError(Exception):
+    """The upload cannot be issued or accepted; the message is safe to show to the client."""
+
+
+def get_max_size():
+    return getattr(settings, 'POSTER_UPLOAD_MAX_BYTES', 20 * 1024 * 1024)
+
+
+def get_expiry():
+    return getattr(settings, 'POSTER_UPLOAD_EXPIRES', 900)
+
+
+def get_bucket_storage():
+    # Only S3-compatible storages (S3/MinIO via django-storages) can presign requests
+    storage = default_storage
+    if not hasattr(storage, 'bucket_name') or not hasattr(storage, 'connection'):
+        raise UploadError("Direct uploads need an S3-compatible default storage.")
+    return storage
+
+
+def get_client(storage):
+    return storage.connection.meta.client
+
+
+def object_key(storage, name):
+    return posixpath.join(storage.location, name) if storage.location else name
+
+
+def new_poster_name(movie_id, content_type):
+    extension = POSTER_CONTENT_TYPES[content_type][0]
+    upload_to = Movie._meta.get_field('poster').upload_to
+    return f'{upload_to}{movie_id}-{uuid.uuid4().hex}{extension}'
+
+
+def _object_params(storage, content_type):
+    params = {'ContentType': content_type}
+    if storage.default_acl:
+        params['ACL'] = storage.default_acl
+    return params
+
+
+def start_upload(movie, content_type, size, method='put'):
+    """
+    Presign the request(s) the client must send. Returns the response payload,
+    including the ``token`` to send to ``complete_upload``.
+    """
+    if content_type not in POSTER_CONTENT_TYPES:
+        raise UploadError(f"Unsupported content type; use one of {', '.join(POSTER_CONTENT_TYPES)}.")
+    if size > get_max_size():
+        raise UploadError(f"Posters may be at most {get_max_size()} bytes.")
+
+    storage = get_bucket_storage()
+    client = get_client(storage)
+    name = new_poster_name(movie.pk, content_type)
+    key = object_key(storage, name)
+    params = _object_params(storage, content_type)
+    expires = get_expiry()
+    token = {'movie': movie.pk, 'name': name, 'size': size, 'type': content_type}
+
+    if size > MULTIPART_PART_SIZE:
+        upload_id = client.create_multipart_upload(Bucket=storage.bucket_name, Key=key, **params)['UploadId']
+        token['upload_id'] = upload_id
+        parts = [
+            {
+                'part_number': number,
+                'url': client.generate_presigned_url(
+                    'upload_part', ExpiresIn=expires,
+                    Params={'Bucket': storage.bucket_name, 'Key': key, 'UploadId': upload_id, 'PartNumber': number},
+                ),
+            }
+            for number in range(1, math.ceil(size / MULTIPART_PART_SIZE) + 1)
+        ]
+        upload = {'method': 'MULTIPART', 'part_size': MULTIPART_PART_SIZE, 'parts': parts}
+    elif method == 'post':
+        fields = {'Content-Type': content_type}
+        conditions = [{'Content-Type': content_type}, ['content-length-range', 1, get_max_size()]]
+        if 'ACL' in params:
+            fields['acl'] = params['ACL']
+            conditions.append({'acl': params['ACL']})
+        post = client.generate_presigned_post(
+            storage.bucket_name, key, Fields=fields, Conditions=conditions, ExpiresIn=expires,
+        )
+        upload = {'method': 'POST', 'url': post['url'], 'fields': post['fields']}
+    else:
+        headers = {'Content-Type': content_type}
+        if 'ACL' in params:
+            headers['x-amz-acl'] = params['ACL']
+        url = client.generate_presigned_url(
+            'put_object', ExpiresIn=expires, Params={'Bucket': storage.bucket_name, 'Key': key, **params},
+        )
+        upload = {'method': 'PUT', 'url': url, 'headers': headers}
+
+    return {'token': signing.dumps(token, salt=TOKEN_SALT), 'name': name, 'upload': upload}
+
+
+def load_token(token, movie):
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT, max_age=get_expiry() * 2)
+    except signing.BadSignature:
+        raise UploadError("Invalid or expired upload token.")
+    if data['movie'] != movie.pk:
+        raise UploadError("This upload token belongs to another movie.")
+    return data
+
+
+def _reject(client, storage, key, message):
+    client.delete_object(Bucket=storage.bucket_name, Key=key)
+    raise UploadError(message)
+
+
+def complete_upload(movie, token, parts=None):
+    """
+    Finish a multipart upload (``parts`` are ``{'part_number', 'etag'}``),
+    validate the stored object and attach it to ``movie.poster``.
+    """
+    data = load_token(token, movie)
+    storage = get_bucket_storage()
+    client = get_client(storage)
+    key = object_key(storage, data['name'])
+
+    try:
+        if 'upload_id' in data:
+            if not parts:
+                raise UploadError("The uploaded parts are required to complete a multipart upload.")
+            client.complete_multipart_upload(
+                Bucket=storage.bucket_name, Key=key, UploadId=data['upload_id'],
+                MultipartUpload={'Parts': [
+                    {'PartNumber': part['part_number'], 'ETag': part['etag']}
+                    for part in sorted(parts, key=lambda part: part['part_number'])
+                ]},
+            )
+        head = client.head_object(Bucket=storage.bucket_name, Key=key)
+    except ClientError as e:
+        raise UploadError(f"The upload could not be found or completed ({e.response['Error'].get('Code')}).")
+
+    if head['ContentLength'] != data['size'] or head['ContentLength'] > get_max_size():
+        _reject(client, storage, key, "The uploaded file does not have the announced size.")
+    if head.get('ContentType') != data['type']:
+        _reject(client, storage, key, "The uploaded file does not have the announced content type.")
+    # Check the leading bytes too: the client controls the Content-Type header
+    first_bytes = client.get_object(Bucket=storage.bucket_name, Key=key, Range='bytes=0-15')['Body'].read()
+    if not POSTER_CONTENT_TYPES[data['type']][1](first_bytes):
+        _reject(client, storage, key, "The uploaded file is not a valid image of the announced type.")
+
+    movie.poster.name = data['name']
+    movie.save(update_fields=['poster', 'updated_at'])
+    return movie
@@ -8,22 +8,49 @@ from .views import (
 
 from rest_framework.routers import DefaultRouter
 
+from .metrics import metrics_view
+from .async_views import AsyncMovieDetailView, AsyncMovieListView, AsyncReviewListView, AsyncWatchlistView
+
 from .api_view import (
     MovieListCreateAPIView,
     MovieRetrieveUpdateDestroyAPIView,
     CategoryListCreateAPIView,
     ReviewListCreateAPIView,
+    MovieExportAPIView,
+    MovieSearchAPIView,
+    PosterUploadAPIView,
+    PosterUploadCompleteAPIView,
+    TopMoviesAPIView,
+    TrendingMoviesAPIView,
+    RecommendationAPIView,
+    RecentlyViewedAPIView,
+    ReviewExportAPIView,
     WatchlistRetrieveAPIView,
     WatchlistAddMovieAPIView,
-    WatchlistRemoveMovieAPIView
+    WatchlistRemoveMovieAPIView,
+    WatchlistMoviesAPIView,
+    WatchlistIdsAPIView,
+    WatchlistCountAPIView,
+    WatchlistBatchAddAPIView,
+    WatchlistBatchRemoveAPIView,
+    WatchlistContainsAPIView
 )
 
 urlpatterns = [
     path('silk/', include('silk.urls', namespace='silk')),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape endpoint
     path('movies/', MovieListCreateAPIView.as_view(), name='movie-list-create'),
     # GET for listing and POST for creating
     path('movies/get/', MovieListCreateAPIView.as_view(), name='movie-list'),  # GET for listing
     path('movies/post/', MovieListCreateAPIView.as_view(), name='movie-create'),  # POST for creating
+    path('movies/search/', MovieSearchAPIView.as_view(), name='movie-search'),
+    # GET ranked full-text search (?q=)
+    path('movies/top/', TopMoviesAPIView.as_view(), name='movie-top'),
+    # GET best-rated movies (?category=)
+    path('movies/trending/', TrendingMoviesAPIView.as_view(), name='movie-trending'),
+    # GET most-reviewed movies lately (?category=)
+    path('movies/export/', MovieExportAPIView.as_view(), name='movie-export'),
+    # GET streaming NDJSON/CSV export of all movies
     path('movies/<int:pk>/', MovieRetrieveUpdateDestroyAPIView.as_view(), name='movie-retrieve-update-destroy'),
     # GET, PUT, DELETE for specific movie
     path('movies/<int:pk>/get/', MovieRetrieveUpdateDestroyAPIView.as_view(), name='movie-retrieve'),
@@ -31,6 +58,10 @@ urlpatterns = [
     path('movies/<int:pk>/put/', MovieRetrieveUpdateDestroyAPIView.as_view(), name='movie-update'),  # PUT for updating
     path('movies/<int:pk>/delete/', MovieRetrieveUpdateDestroyAPIView.as_view(), name='movie-delete'),
     # DELETE for deleting
+    path('movies/<int:pk>/poster/upload/', PosterUploadAPIView.as_view(), name='movie-poster-upload'),
+    # POST for a presigned direct-to-bucket poster upload
+    path('movies/<int:pk>/poster/complete/', PosterUploadCompleteAPIView.as_view(), name='movie-poster-complete'),
+    # POST once the direct upload finished
 
     # Category Endpoints
     path('categories/', CategoryListCreateAPIView.as_view(), name='category-list-create'),
@@ -43,15 +74,42 @@ urlpatterns = [
     # GET for listing and POST for creating
     path('reviews/get/', ReviewListCreateAPIView.as_view(), name='review-list'),  # GET for listing reviews
     path('reviews/post/', ReviewListCreateAPIView.as_view(), name='review-create'),  # POST for creating reviews
+    path('reviews/export/', ReviewExportAPIView.as_view(), name='review-export'),
+    # GET streaming NDJSON/CSV export of all reviews
+
+    # Recommendation Endpoints
+    path('recommendations/', RecommendationAPIView.as_view(), name='recommendations'),
+    # GET movies for the current user, or similar to ?movie=<id>
+    path('recently-viewed/', RecentlyViewedAPIView.as_view(), name='recently-viewed'),
+    # GET movies the user last opened, most recent first
 
     # Watchlist Endpoints
     path('watchlist/', WatchlistRetrieveAPIView.as_view(), name='watchlist-retrieve'),  # GET for retrieving watchlist
     path('watchlist/get/', WatchlistRetrieveAPIView.as_view(), name='watchlist-retrieve-get'),
     # GET for retrieving watchlist
+    path('watchlist/movies/', WatchlistMoviesAPIView.as_view(), name='watchlist-movies'),
+    # GET paginated compact movie rows of the watchlist
+    path('watchlist/ids/', WatchlistIdsAPIView.as_view(), name='watchlist-ids'),
+    # GET movie IDs and count only, for client-side sync
+    path('watchlist/count/', WatchlistCountAPIView.as_view(), name='watchlist-count'),
+    # GET movie count only
     path('watchlist/add/', WatchlistAddMovieAPIView.as_view(), name='watchlist-add'),
     # POST for adding movie to watchlist
     path('watchlist/remove/', WatchlistRemoveMovieAPIView.as_view(), name='watchlist-remove'),
     # POST for removing movie from watchlist
+    path('watchlist/batch/add/', WatchlistBatchAddAPIView.as_view(), name='watchlist-batch-add'),
+    # POST {movie_ids: [...]} to add many movies at once
+    path('watchlist/batch/remove/', WatchlistBatchRemoveAPIView.as_view(), name='watchlist-batch-remove'),
+    # POST {movie_ids: [...]} to remove many movies at once
+    path('watchlist/contains/', WatchlistContainsAPIView.as_view(), name='watchlist-contains'),
+    # GET ?movie_ids=1,2,3 membership check
+
+    # Async (ASGI) read-only variants of the endpoints above
+    path('async/movies/', AsyncMovieListView.as_view(), name='async-movie-list'),
+    path('async/movies/<int:pk>/', AsyncMovieDetailView.as_view(), name='async-movie-detail'),
+    path('async/reviews/', AsyncReviewListView.as_view(), name='async-review-list'),
+    path('async/watchlist/', AsyncWatchlistView.as_view(), name='async-watchlist'),
+
     path('', MovieListView.as_view(), name='movie_list'),
     path('movie/<int:pk>/', MovieDetailView.as_view(), name='movie_detail'),  # `pk` for CBVs
     path('movie/create/', MovieCreateView.as_view(), name='movie_create'),
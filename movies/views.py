@@ -3,8 +3,12 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse_lazy
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 
+from . import cache
 from .models import Movie
 from .forms import MovieForm, ReviewForm, MoviePosterForm
+from .posters import picture_context
+from .recently_viewed import record_view
+from .recommendations import similar_movies
 
 
 # 🎬 Movie List View
@@ -12,10 +16,16 @@ class MovieListView(LoginRequiredMixin, ListView):
     model = Movie
     template_name = 'movies/movie_list.html'
     context_object_name = 'movies'
+    query_budget = 3  # session, user, movies (movies/querybudget.py)
 
-    def get(self, request, *args, **kwargs):
-        request.session['last_viewed'] = 'Movie List'
-        return super().get(request, *args, **kwargs)
+    def get_queryset(self):
+        return Movie.objects.select_related('category')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # The rendered list is cached under this version; the queryset only runs on a miss
+        context['movies_cache_version'] = cache.get_version(cache.MOVIES)
+        return context
 
 
 # 🎬 Movie Detail View
@@ -24,15 +34,19 @@ class MovieDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
     template_name = 'movies/movie_detail.html'
     context_object_name = 'movie'
     permission_required = 'movies.view_movie'
+    query_budget = 5
 
     def get_object(self, queryset=None):
         movie = super().get_object(queryset)
-        self.request.session['last_viewed_movie'] = movie.id
+        # Buffered and flushed to the cache, no session write (movies/recently_viewed.py)
+        record_view(self.request.user, movie.id)
         return movie
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['reviews'] = self.object.reviews.all()
+        context['reviews'] = self.object.reviews.select_related('user')
+        context['also_liked'] = [movie for movie, _ in similar_movies(self.object.pk, limit=6)]
+        context['poster_picture'] = picture_context(self.object, display_width=200)
         return context
 
 
@@ -42,6 +56,7 @@ class MovieCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     form_class = MovieForm
     template_name = 'movies/movie_form.html'
     permission_required = 'movies.add_movie'
+    query_budget = 3
     success_url = reverse_lazy('movie_list')
 
 
@@ -51,6 +66,7 @@ class MovieUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
     form_class = MovieForm
     template_name = 'movies/movie_form.html'
     permission_required = 'movies.change_movie'
+    query_budget = 4
     success_url = reverse_lazy('movie_list')
 
 
@@ -82,6 +98,9 @@ def review_create(request, movie_id):
     return render(request, 'movies/review_form.html', {'form': form})
 
 
+review_create.query_budget = 4
+
+
 # 🖼 Upload Poster (FBV for now)
 @login_required
 def upload_poster(request, movie_id):
@@ -94,3 +113,6 @@ def upload_poster(request, movie_id):
     else:
         form = MoviePosterForm(instance=movie)
     return render(request, 'movies/upload_poster.html', {'form': form, 'movie': movie})
+
+
+upload_poster.query_budget = 5
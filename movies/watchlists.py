@@ -0,0 +1,81 @@
+"""
+Set-based watchlist updates.
+
+A batch of movie IDs costs the same handful of queries whatever its size: one
+``IN`` query to check the movies exist, one for the current membership, then a
+single ``INSERT`` (``bulk_create(ignore_conflicts=True)``) or ``DELETE`` on the
+M2M through table. ``m2m_changed`` is sent like ``watchlist.movies.add()``
+would, with ``pk_set`` holding the movies that actually changed, so the
+receivers in movies/signals.py keep working.
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+
+from .models import Movie, Watchlist
+
+WatchlistEntry = Watchlist.movies.through
+
+# Movie IDs accepted per request
+MAX_BATCH_SIZE = 1000
+
+
+def _send(action, watchlist, pk_set, using):
+    m2m_changed.send(sender=WatchlistEntry, action=action, instance=watchlist, reverse=False,
+                     model=Movie, pk_set=pk_set, using=using)
+
+
+def _members(watchlist, movie_ids):
+    return set(WatchlistEntry.objects.filter(watchlist=watchlist, movie_id__in=movie_ids)
+               .values_list('movie_id', flat=True))
+
+
+def add_movies(user, movie_ids):
+    """Add the movies to the user's watchlist (created if needed); returns the diff."""
+    movie_ids = set(movie_ids)
+    found = set(Movie.objects.filter(pk__in=movie_ids).values_list('pk', flat=True))
+    watchlist, _ = Watchlist.objects.get_or_create(user=user)
+    present = _members(watchlist, found) if found else set()
+    added = found - present
+    if added:
+        using = watchlist._state.db
+        with transaction.atomic(using=using, savepoint=False):
+            _send('pre_add', watchlist, added, using)
+            # A concurrent add of the same movie is ignored rather than failing the batch
+            WatchlistEntry.objects.using(using).bulk_create(
+                [WatchlistEntry(watchlist_id=watchlist.pk, movie_id=movie_id) for movie_id in added],
+                ignore_conflicts=True,
+            )
+            _send('post_add', watchlist, added, using)
+    return {
+        'added': sorted(added),
+        'already_present': sorted(present),
+        'not_found': sorted(movie_ids - found),
+    }
+
+
+def remove_movies(user, movie_ids):
+    """Remove the movies from the user's watchlist; returns the diff."""
+    movie_ids = set(movie_ids)
+    watchlist = Watchlist.objects.filter(user=user).first()
+    removed = _members(watchlist, movie_ids) if watchlist is not None else set()
+    if removed:
+        using = watchlist._state.db
+        with transaction.atomic(using=using, savepoint=False):
+            _send('pre_remove', watchlist, removed, using)
+            WatchlistEntry.objects.using(using).filter(watchlist=watchlist, movie_id__in=removed).delete()
+            _send('post_remove', watchlist, removed, using)
+    return {
+        'removed': sorted(removed),
+        'not_in_watchlist': sorted(movie_ids - removed),
+    }
+
+
+def contains_movies(user, movie_ids):
+    """Which of the movies are in the user's watchlist, in one query without loading it."""
+    movie_ids = set(movie_ids)
+    members = set(WatchlistEntry.objects.filter(watchlist__user=user, movie_id__in=movie_ids)
+                  .values_list('movie_id', flat=True))
+    return {
+        'contains': sorted(members),
+        'missing': sorted(movie_ids - members),
+    }
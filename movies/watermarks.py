@@ -0,0 +1,44 @@
+"""
+Time watermarks of the incremental jobs (leaderboards, recommendations).
+
+A job that only looks at rows with ``updated_at >= last run`` misses rows
+written by transactions that were still open when it ran: their
+``updated_at`` is earlier than the commit, and earlier than the watermark
+saved at the end of the run. So the watermark is taken from the database
+clock (the one ``Now()`` writes), and each run looks back
+``REFRESH_WATERMARK_OVERLAP_SECONDS`` further than the previous one, which
+must exceed the longest write transaction. Rows in the overlap are processed
+twice, so jobs using it must be idempotent (rescoring, rebuilding).
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.functions import Now
+from django.db.models.sql import Query
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def get_overlap():
+    return timedelta(seconds=getattr(settings, 'REFRESH_WATERMARK_OVERLAP_SECONDS', 600))
+
+
+def database_now(using=None):
+    """The database's current time (what ``Now()`` stores), as an aware datetime."""
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    sql, params = Now().as_sql(Query(None).get_compiler(connection=connection), connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {sql}', params)
+        value = cursor.fetchone()[0]
+    if isinstance(value, str):
+        # SQLite
+        value = parse_datetime(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, dt_timezone.utc)
+    return value
+
+
+def changed_since(watermark):
+    """Lower bound of the ``updated_at`` rows to look at, given the previous run's watermark."""
+    return watermark - get_overlap()